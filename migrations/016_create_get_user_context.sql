@@ -0,0 +1,52 @@
+-- Migration 016: get_user_context RPC
+-- Returns the per-turn chat context (profile, today's goals, active notes)
+-- as one jsonb document, replacing three separate PostgREST round-trips
+-- made by ContextService on every message.
+
+BEGIN;
+
+-- ============================================================================
+-- 1. Supporting indexes for the three lookups
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_daily_goals_user_date
+    ON public.daily_goals (user_id, goal_date);
+
+CREATE INDEX IF NOT EXISTS idx_persistent_context_user
+    ON public.persistent_context (user_id);
+
+-- ============================================================================
+-- 2. RPC: get_user_context
+--    profile: user_profile row (or null)
+--    goals:   daily_goals row for p_today (or null)
+--    notes:   array of {note_content, created_at} for active notes
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.get_user_context(
+    p_user_id uuid,
+    p_today date
+)
+RETURNS jsonb AS $$
+    SELECT jsonb_build_object(
+        'profile', (
+            SELECT to_jsonb(up)
+            FROM public.user_profile up
+            WHERE up.user_id = p_user_id
+            LIMIT 1
+        ),
+        'goals', (
+            SELECT to_jsonb(dg)
+            FROM public.daily_goals dg
+            WHERE dg.user_id = p_user_id AND dg.goal_date = p_today
+            LIMIT 1
+        ),
+        'notes', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'note_content', pc.note_content,
+                'created_at', pc.created_at
+            ))
+            FROM public.persistent_context pc
+            WHERE pc.user_id = p_user_id AND pc.is_active = true
+        ), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,7 @@
+-- Migration 017: chat_history lookup index
+-- Serves HistoryService.get_recent_chat_history (WHERE user_id = ?
+-- ORDER BY created_at [DESC] LIMIT n, optionally created_at > cursor)
+-- as a single index range scan instead of a sort over the user's rows.
+
+CREATE INDEX IF NOT EXISTS idx_chat_history_user_created
+    ON public.chat_history (user_id, created_at DESC);
@@ -0,0 +1,9 @@
+-- Migration 018: chat-images storage bucket
+-- User-uploaded chat images are stored as objects (<user_id>/<uuid>.<ext>)
+-- and chat_history.image_data holds the object path instead of a base64
+-- data URL. The bucket is private: uploads go through the backend's service
+-- key, and /api/history hands the frontend short-lived signed URLs.
+
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('chat-images', 'chat-images', false)
+ON CONFLICT (id) DO UPDATE SET public = false;
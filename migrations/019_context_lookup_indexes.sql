@@ -0,0 +1,22 @@
+-- Migration 019: context lookup indexes
+-- Completes the index coverage for get_user_context (migration 016):
+--   * user_profile(user_id) for the profile lookup
+--   * a partial index on persistent_context for active notes only, which
+--     replaces the full (user_id) index from 016
+-- daily_goals keeps the (user_id, goal_date) index from 016; it is not made
+-- UNIQUE here because existing data may hold duplicate rows per day.
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction; these tables are small per user.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_user_profile_user
+    ON public.user_profile (user_id);
+
+CREATE INDEX IF NOT EXISTS idx_persistent_context_user_active
+    ON public.persistent_context (user_id)
+    WHERE is_active = true;
+
+DROP INDEX IF EXISTS public.idx_persistent_context_user;
+
+COMMIT;
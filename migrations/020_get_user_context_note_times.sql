@@ -0,0 +1,37 @@
+-- Migration 020: get_user_context returns preformatted note times
+-- Notes now carry 'created_str' (Cairo local time, 'YYYY-MM-DD HH24:MI')
+-- so ContextService can build the "(Added: ...)" suffix without parsing
+-- and converting timestamps in Python. Otherwise identical to 016.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_user_context(
+    p_user_id uuid,
+    p_today date
+)
+RETURNS jsonb AS $$
+    SELECT jsonb_build_object(
+        'profile', (
+            SELECT to_jsonb(up)
+            FROM public.user_profile up
+            WHERE up.user_id = p_user_id
+            LIMIT 1
+        ),
+        'goals', (
+            SELECT to_jsonb(dg)
+            FROM public.daily_goals dg
+            WHERE dg.user_id = p_user_id AND dg.goal_date = p_today
+            LIMIT 1
+        ),
+        'notes', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'note_content', pc.note_content,
+                'created_str', to_char(pc.created_at AT TIME ZONE 'Africa/Cairo', 'YYYY-MM-DD HH24:MI')
+            ))
+            FROM public.persistent_context pc
+            WHERE pc.user_id = p_user_id AND pc.is_active = true
+        ), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,65 @@
+-- Migration 022: get_user_training_context RPC
+-- Returns the training half of the per-turn chat context (equipment, 1RM
+-- records, active workout plan, active split structure) as one document,
+-- replacing the six PostgREST round-trips ContextService made for it
+-- (plan and split each needed a separate active-split lookup first).
+-- json (not jsonb) keeps object keys in the order the prompt has always
+-- shown them.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_user_training_context(
+    p_user_id uuid
+)
+RETURNS json AS $$
+    WITH active_split AS (
+        SELECT ws.id, ws.name
+        FROM public.workout_splits ws
+        WHERE ws.user_id = p_user_id AND ws.is_active = true
+        LIMIT 1
+    )
+    SELECT json_build_object(
+        'equipment', COALESCE((
+            SELECT json_agg(ue.equipment_name)
+            FROM public.user_equipment ue
+            WHERE ue.user_id = p_user_id
+        ), '[]'::json),
+        'one_rm_records', COALESCE((
+            SELECT json_agg(json_build_object(
+                'exercise', r.exercise_name,
+                'weight_kg', r.weight_kg
+            ))
+            FROM public.user_1rm_records r
+            WHERE r.user_id = p_user_id
+        ), '[]'::json),
+        'workout_plan', COALESCE((
+            SELECT json_agg(json_build_object(
+                'split_day_name', e.split_day_name,
+                'exercise_order', e.exercise_order,
+                'exercise_name', e.exercise_name,
+                'exercise_type', e.exercise_type,
+                'target_muscles', e.target_muscles,
+                'sets', e.sets,
+                'rep_range_low', e.rep_range_low,
+                'rep_range_high', e.rep_range_high,
+                'load_percentage', e.load_percentage,
+                'rest_seconds', e.rest_seconds,
+                'notes', e.notes
+            ) ORDER BY e.split_day_name, e.exercise_order)
+            FROM public.workout_plan_exercises e
+            JOIN active_split s ON s.id = e.split_id
+            WHERE e.user_id = p_user_id
+        ), '[]'::json),
+        'split_structure', COALESCE((
+            SELECT json_agg(json_build_object(
+                'position', si.order_index,
+                'day', si.workout_name,
+                'split_name', s.name
+            ) ORDER BY si.order_index)
+            FROM public.split_items si
+            JOIN active_split s ON s.id = si.split_id
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
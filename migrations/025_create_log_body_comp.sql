@@ -0,0 +1,30 @@
+-- Migration 025: log_body_comp RPC
+-- Inserts a body_composition_logs row and syncs user_profile.weight_kg in
+-- one call. The log_body_comp tool previously made two PostgREST requests,
+-- and a failed profile update could leave the two out of step. Returns the
+-- inserted row, like a PostgREST insert with return=representation.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.log_body_comp(
+    p_user_id uuid,
+    p_created_at timestamptz,
+    p_weight_kg numeric,
+    p_muscle_kg numeric DEFAULT NULL,
+    p_bf_percent numeric DEFAULT NULL,
+    p_resting_hr integer DEFAULT NULL,
+    p_notes text DEFAULT NULL
+)
+RETURNS SETOF public.body_composition_logs AS $$
+    UPDATE public.user_profile
+    SET weight_kg = p_weight_kg
+    WHERE user_id = p_user_id;
+
+    INSERT INTO public.body_composition_logs
+        (user_id, created_at, weight_kg, muscle_kg, bf_percent, resting_hr, notes)
+    VALUES
+        (p_user_id, p_created_at, p_weight_kg, p_muscle_kg, p_bf_percent, p_resting_hr, p_notes)
+    RETURNING *;
+$$ LANGUAGE sql VOLATILE;
+
+COMMIT;
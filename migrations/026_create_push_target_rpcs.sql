@@ -0,0 +1,123 @@
+-- Migration 026: notification sweep target RPCs
+-- Each scheduled check asks Postgres for the devices that need a push, with
+-- the user's language and whatever the message interpolates, in one query.
+-- The sweeps previously pulled every subscription and then filtered them in
+-- Python with batched lookups (languages, logs, splits, last workouts,
+-- macro totals). Message text and thresholds stay in notifications.py.
+
+BEGIN;
+
+-- Morning: no sleep log for the day
+CREATE OR REPLACE FUNCTION public.get_morning_push_targets(
+    p_date date
+)
+RETURNS TABLE (endpoint text, p256dh text, auth text, language text) AS $$
+    SELECT ps.endpoint, ps.p256dh, ps.auth, COALESCE(up.language, 'en')
+    FROM public.push_subscriptions ps
+    LEFT JOIN public.user_profile up ON up.user_id = ps.user_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.sleep_logs sl
+        WHERE sl.user_id = ps.user_id AND sl.sleep_date = p_date
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Afternoon: no nutrition log for the day
+CREATE OR REPLACE FUNCTION public.get_afternoon_push_targets(
+    p_date date
+)
+RETURNS TABLE (endpoint text, p256dh text, auth text, language text) AS $$
+    SELECT ps.endpoint, ps.p256dh, ps.auth, COALESCE(up.language, 'en')
+    FROM public.push_subscriptions ps
+    LEFT JOIN public.user_profile up ON up.user_id = ps.user_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.nutrition_logs nl
+        WHERE nl.user_id = ps.user_id AND nl.log_date = p_date
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Body comp: no weigh-in since the cutoff (body_composition_logs has no day
+-- column, so created_at against the start of p_since)
+CREATE OR REPLACE FUNCTION public.get_body_comp_push_targets(
+    p_since date
+)
+RETURNS TABLE (endpoint text, p256dh text, auth text, language text) AS $$
+    SELECT ps.endpoint, ps.p256dh, ps.auth, COALESCE(up.language, 'en')
+    FROM public.push_subscriptions ps
+    LEFT JOIN public.user_profile up ON up.user_id = ps.user_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.body_composition_logs bc
+        WHERE bc.user_id = ps.user_id AND bc.created_at >= p_since
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Serves the latest-workout_type lookup in the evening sweep
+CREATE INDEX IF NOT EXISTS idx_workout_logs_user_start
+    ON public.workout_logs (user_id, start_time DESC);
+
+-- Evening: no workout today; next_workout is the split day after the last
+-- logged workout_type (first match), or the first day if it isn't in the split
+CREATE OR REPLACE FUNCTION public.get_evening_push_targets(
+    p_date date
+)
+RETURNS TABLE (endpoint text, p256dh text, auth text, language text, next_workout text) AS $$
+    WITH pending AS (
+        SELECT ps.user_id, ps.endpoint, ps.p256dh, ps.auth
+        FROM public.push_subscriptions ps
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.workout_logs wl
+            WHERE wl.user_id = ps.user_id AND wl.log_date = p_date
+        )
+    ),
+    schedules AS (
+        SELECT s.user_id,
+               ARRAY(
+                   SELECT si.workout_name
+                   FROM public.split_items si
+                   WHERE si.split_id = s.id
+                   ORDER BY si.order_index
+               ) AS names
+        FROM (
+            SELECT DISTINCT ON (ws.user_id) ws.user_id, ws.id
+            FROM public.workout_splits ws
+            WHERE ws.is_active = true
+              AND ws.user_id IN (SELECT user_id FROM pending)
+            ORDER BY ws.user_id
+        ) s
+    ),
+    last_types AS (
+        SELECT DISTINCT ON (wl.user_id) wl.user_id, wl.workout_type
+        FROM public.workout_logs wl
+        WHERE wl.user_id IN (SELECT user_id FROM schedules)
+        ORDER BY wl.user_id, wl.start_time DESC
+    )
+    SELECT p.endpoint, p.p256dh, p.auth, COALESCE(up.language, 'en'),
+           sc.names[COALESCE(array_position(sc.names, lt.workout_type) % cardinality(sc.names), 0) + 1]
+    FROM pending p
+    JOIN schedules sc ON sc.user_id = p.user_id
+    LEFT JOIN last_types lt ON lt.user_id = p.user_id
+    LEFT JOIN public.user_profile up ON up.user_id = p.user_id
+    WHERE cardinality(sc.names) > 0;
+$$ LANGUAGE sql STABLE;
+
+-- Night: remaining calories/protein against the profile targets
+CREATE OR REPLACE FUNCTION public.get_night_push_targets(
+    p_date date
+)
+RETURNS TABLE (endpoint text, p256dh text, auth text, language text,
+               remaining_calories numeric, remaining_protein numeric) AS $$
+    SELECT ps.endpoint, ps.p256dh, ps.auth, COALESCE(up.language, 'en'),
+           GREATEST(0, COALESCE(up.daily_calorie_target, 0)::numeric - COALESCE(t.calories, 0)),
+           GREATEST(0, COALESCE(up.daily_protein_target_gm, 0)::numeric - COALESCE(t.protein, 0))
+    FROM public.push_subscriptions ps
+    JOIN public.user_profile up ON up.user_id = ps.user_id
+    LEFT JOIN (
+        SELECT nl.user_id, SUM(nl.calories) AS calories, SUM(nl.protein) AS protein
+        FROM public.nutrition_logs nl
+        WHERE nl.log_date = p_date
+        GROUP BY nl.user_id
+    ) t ON t.user_id = ps.user_id
+    WHERE COALESCE(up.daily_calorie_target, 0) <> 0
+       OR COALESCE(up.daily_protein_target_gm, 0) <> 0;
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
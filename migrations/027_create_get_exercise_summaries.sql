@@ -0,0 +1,38 @@
+-- Migration 027: get_exercise_summaries RPC
+-- Per-exercise working-set totals over a lookback window, aggregated in
+-- Postgres. get_progressive_overload_summary (all-exercises mode) used to
+-- pull up to 500 raw sets and fold them in a Python loop, which also
+-- silently truncated busy training blocks.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_summaries(
+    p_user_id uuid,
+    p_since date
+)
+RETURNS TABLE (
+    exercise        text,
+    total_sets      int,
+    total_volume    float,
+    best_weight     float,
+    best_volume_set float,
+    pr_count        int,
+    last_date       date
+) AS $$
+    SELECT
+        el.exercise_name,
+        COUNT(*)::int,
+        COALESCE(SUM(el.volume_load), 0)::float,
+        COALESCE(MAX(el.weight_kg), 0)::float,
+        COALESCE(MAX(el.volume_load), 0)::float,
+        COUNT(*) FILTER (WHERE el.is_pr)::int,
+        MAX(el.log_date)
+    FROM public.exercise_logs el
+    WHERE el.user_id = p_user_id
+      AND el.is_warmup = false
+      AND el.log_date >= p_since
+    GROUP BY el.exercise_name
+    ORDER BY MAX(el.log_date) DESC;
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,77 @@
+-- Migration 028: get_exercise_overview RPC
+-- Everything get_progressive_overload_summary reports for one exercise
+-- (weekly trend, PR history, heaviest set, biggest-volume set and the most
+-- recent session) as a single json document. The tool previously made six
+-- serial PostgREST calls for it. The exercise matches on lower() equality,
+-- as in get_exercise_progress.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_overview(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_weeks int DEFAULT 8
+)
+RETURNS json AS $$
+    WITH sets AS (
+        SELECT el.log_date, el.set_number, el.weight_kg, el.reps, el.rpe,
+               el.is_warmup, el.is_pr, el.volume_load
+        FROM public.exercise_logs el
+        WHERE el.user_id = p_user_id
+          AND lower(el.exercise_name) = lower(p_exercise_name)
+    )
+    SELECT json_build_object(
+        'weekly_trend', COALESCE((
+            SELECT json_agg(p)
+            FROM public.get_exercise_progress(p_user_id, p_exercise_name, p_weeks) p
+        ), '[]'::json),
+        'pr_history', COALESCE((
+            SELECT json_agg(json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            ) ORDER BY s.log_date DESC)
+            FROM (
+                SELECT * FROM sets
+                WHERE is_warmup = false AND is_pr = true
+                ORDER BY log_date DESC
+                LIMIT 20
+            ) s
+        ), '[]'::json),
+        'best_weight', (
+            SELECT json_build_object('weight_kg', s.weight_kg, 'reps', s.reps, 'log_date', s.log_date)
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.weight_kg DESC
+            LIMIT 1
+        ),
+        'best_volume_set', (
+            SELECT json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            )
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.volume_load DESC
+            LIMIT 1
+        ),
+        'recent_session', COALESCE((
+            SELECT json_agg(json_build_object(
+                'set_number', s.set_number,
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'rpe', s.rpe,
+                'is_warmup', s.is_warmup,
+                'is_pr', s.is_pr,
+                'volume_load', s.volume_load
+            ) ORDER BY s.set_number)
+            FROM sets s
+            WHERE s.log_date = (SELECT MAX(log_date) FROM sets)
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
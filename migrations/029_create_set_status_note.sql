@@ -0,0 +1,25 @@
+-- Migration 029: set_status_note RPC
+-- Activates a persistent note in one call. Any active note with the same
+-- content (trimmed, case-insensitive) is deactivated first, so repeating a
+-- status doesn't stack duplicates into every chat context. Distinct notes
+-- still stack as before. Returns the inserted row.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.set_status_note(
+    p_user_id uuid,
+    p_note_content text
+)
+RETURNS SETOF public.persistent_context AS $$
+    UPDATE public.persistent_context
+    SET is_active = false
+    WHERE user_id = p_user_id
+      AND is_active = true
+      AND lower(btrim(note_content)) = lower(btrim(p_note_content));
+
+    INSERT INTO public.persistent_context (user_id, note_content, is_active)
+    VALUES (p_user_id, p_note_content, true)
+    RETURNING *;
+$$ LANGUAGE sql VOLATILE;
+
+COMMIT;
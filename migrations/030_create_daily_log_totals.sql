@@ -0,0 +1,53 @@
+-- Migration 030: daily_nutrition_totals / daily_workout_totals RPCs
+-- Per-day totals for one user since a given functional date, summed in
+-- Postgres. Questions like "did I hit my protein this week?" previously
+-- pulled every raw log row through get_nutrition_history and left the
+-- arithmetic to the model; these return one row per day instead.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.daily_nutrition_totals(
+    p_user_id uuid,
+    p_since date
+)
+RETURNS TABLE (
+    log_date date,
+    calories numeric,
+    protein numeric,
+    carbs numeric,
+    fats numeric,
+    items bigint
+) AS $$
+    SELECT nl.log_date,
+           COALESCE(SUM(nl.calories), 0),
+           COALESCE(SUM(nl.protein), 0),
+           COALESCE(SUM(nl.carbs), 0),
+           COALESCE(SUM(nl.fats), 0),
+           COUNT(*)
+    FROM public.nutrition_logs nl
+    WHERE nl.user_id = p_user_id AND nl.log_date >= p_since
+    GROUP BY nl.log_date
+    ORDER BY nl.log_date DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.daily_workout_totals(
+    p_user_id uuid,
+    p_since date
+)
+RETURNS TABLE (
+    log_date date,
+    sessions bigint,
+    duration_minutes numeric,
+    calories_burned numeric
+) AS $$
+    SELECT wl.log_date,
+           COUNT(*),
+           COALESCE(SUM(wl.duration_minutes), 0),
+           COALESCE(SUM(wl.calories_burned), 0)
+    FROM public.workout_logs wl
+    WHERE wl.user_id = p_user_id AND wl.log_date >= p_since
+    GROUP BY wl.log_date
+    ORDER BY wl.log_date DESC;
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- Migration 031: log history indexes
+-- The history tools (query_user_logs) filter each log table by user and a
+-- lookback window, newest first. nutrition_logs and workout_logs already
+-- carry the functional day (4am cutoff, Cairo time) in log_date, and
+-- sleep_logs in sleep_date, so the window is a plain date comparison that
+-- these (user_id, day DESC) indexes serve as a range scan. created_at is
+-- the in-day tiebreak; body_composition_logs has no day column.
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction; these tables are small per user.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_nutrition_logs_user_log_date
+    ON public.nutrition_logs (user_id, log_date DESC, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_workout_logs_user_log_date
+    ON public.workout_logs (user_id, log_date DESC, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_sleep_logs_user_sleep_date
+    ON public.sleep_logs (user_id, sleep_date DESC, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_body_composition_logs_user_created
+    ON public.body_composition_logs (user_id, created_at DESC);
+
+COMMIT;
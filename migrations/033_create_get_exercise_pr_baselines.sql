@@ -0,0 +1,24 @@
+-- Migration 033: get_exercise_pr_baselines RPC
+-- Best working-set volume and weight for one exercise, plus the last set
+-- number logged for it on a given day, in a single aggregate pass. The Live
+-- Coach set logger previously ran three ordered + limited PostgREST lookups
+-- for these before every insert. The exercise matches on lower() equality,
+-- as in get_exercise_progress.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_pr_baselines(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_log_date date DEFAULT NULL
+)
+RETURNS TABLE (best_volume float, best_weight float, last_set_number int) AS $$
+    SELECT COALESCE(MAX(el.volume_load) FILTER (WHERE el.is_warmup = false), 0),
+           COALESCE(MAX(el.weight_kg) FILTER (WHERE el.is_warmup = false), 0),
+           COALESCE(MAX(el.set_number) FILTER (WHERE el.log_date = p_log_date), 0)
+    FROM public.exercise_logs el
+    WHERE el.user_id = p_user_id
+      AND lower(el.exercise_name) = lower(p_exercise_name);
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
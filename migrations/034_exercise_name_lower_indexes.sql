@@ -0,0 +1,19 @@
+-- Migration 034: case-insensitive exercise name indexes
+-- Exercise lookups match names with lower() equality: get_exercise_progress
+-- (011), get_exercise_overview (028), log_exercise_sets_with_pr (032) and
+-- get_exercise_pr_baselines (033). Without an index on the expression each
+-- lookup walks every one of the user's exercise_logs rows; these back the
+-- exercise_logs reads and the user_1rm_records lookup in
+-- log_exercise_sets_with_pr.
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_lower_name_date
+    ON public.exercise_logs (user_id, lower(exercise_name), log_date DESC);
+
+CREATE INDEX IF NOT EXISTS idx_user_1rm_user_lower_name
+    ON public.user_1rm_records (user_id, lower(exercise_name));
+
+COMMIT;
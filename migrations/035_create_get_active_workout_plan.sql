@@ -0,0 +1,47 @@
+-- Migration 035: get_active_workout_plan RPC
+-- The user's active split and its plan exercises (optionally one day) as a
+-- single json document. The get_workout_plan tool and the
+-- /api/workout-plan endpoint each made two serial PostgREST calls for it:
+-- the active split, then its plan rows.
+-- Returns {"split_name": text|null, "plan": [...]}; split_name is null when
+-- the user has no active split.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_active_workout_plan(
+    p_user_id uuid,
+    p_split_day_name text DEFAULT NULL
+)
+RETURNS json AS $$
+    WITH split AS (
+        SELECT ws.id, ws.name
+        FROM public.workout_splits ws
+        WHERE ws.user_id = p_user_id AND ws.is_active = true
+        LIMIT 1
+    )
+    SELECT json_build_object(
+        'split_name', (SELECT s.name FROM split s),
+        'plan', COALESCE((
+            SELECT json_agg(json_build_object(
+                'split_day_name', wpe.split_day_name,
+                'exercise_order', wpe.exercise_order,
+                'exercise_name', wpe.exercise_name,
+                'exercise_type', wpe.exercise_type,
+                'target_muscles', wpe.target_muscles,
+                'sets', wpe.sets,
+                'rep_range_low', wpe.rep_range_low,
+                'rep_range_high', wpe.rep_range_high,
+                'load_percentage', wpe.load_percentage,
+                'rest_seconds', wpe.rest_seconds,
+                'superset_group', wpe.superset_group,
+                'notes', wpe.notes
+            ) ORDER BY wpe.split_day_name, wpe.exercise_order)
+            FROM public.workout_plan_exercises wpe
+            JOIN split s ON s.id = wpe.split_id
+            WHERE wpe.user_id = p_user_id
+              AND (p_split_day_name IS NULL OR wpe.split_day_name = p_split_day_name)
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
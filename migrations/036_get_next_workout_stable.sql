@@ -0,0 +1,11 @@
+-- Migration 036: get_next_workout volatility / planner hints
+-- get_next_workout (012) only reads workout_splits and split_items but was
+-- declared with the default VOLATILE. STABLE lets PostgREST run it in a
+-- read-only transaction and lets the planner evaluate it once per statement.
+-- It returns at most one row, so ROWS 1 replaces the default estimate of 1000.
+
+BEGIN;
+
+ALTER FUNCTION public.get_next_workout(uuid) STABLE COST 100 ROWS 1;
+
+COMMIT;
@@ -0,0 +1,74 @@
+-- Migration 037: page and format get_active_workout_plan
+-- Extends the 035 RPC (one function, no new view) with:
+--   p_limit / p_offset  page through the ordered plan rows (NULL limit = all)
+--   p_formatted         return rows the way the get_workout_plan tool presents
+--                       them (reps "8-12", load "75%", rest "90s") instead of
+--                       the raw columns /api/workout-plan renders itself
+-- Returns {"split_name": text|null, "plan": [...]} as before.
+-- The signature changes, so the 035 function is dropped and recreated.
+
+BEGIN;
+
+DROP FUNCTION IF EXISTS public.get_active_workout_plan(uuid, text);
+
+CREATE FUNCTION public.get_active_workout_plan(
+    p_user_id uuid,
+    p_split_day_name text DEFAULT NULL,
+    p_limit integer DEFAULT NULL,
+    p_offset integer DEFAULT 0,
+    p_formatted boolean DEFAULT false
+)
+RETURNS json AS $$
+    WITH split AS (
+        SELECT ws.id, ws.name
+        FROM public.workout_splits ws
+        WHERE ws.user_id = p_user_id AND ws.is_active = true
+        LIMIT 1
+    ),
+    page AS (
+        SELECT wpe.*
+        FROM public.workout_plan_exercises wpe
+        JOIN split s ON s.id = wpe.split_id
+        WHERE wpe.user_id = p_user_id
+          AND (p_split_day_name IS NULL OR wpe.split_day_name = p_split_day_name)
+        ORDER BY wpe.split_day_name, wpe.exercise_order
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT json_build_object(
+        'split_name', (SELECT s.name FROM split s),
+        'plan', COALESCE((
+            SELECT json_agg(
+                CASE WHEN p_formatted THEN json_build_object(
+                    'split_day_name', p.split_day_name,
+                    'order', p.exercise_order,
+                    'exercise', p.exercise_name,
+                    'type', p.exercise_type,
+                    'muscles', p.target_muscles,
+                    'sets', p.sets,
+                    'reps', p.rep_range_low || '-' || p.rep_range_high,
+                    'load_%1RM', CASE WHEN NULLIF(p.load_percentage, 0) IS NOT NULL
+                                      THEN trunc(p.load_percentage * 100)::int || '%' END,
+                    'rest', p.rest_seconds || 's',
+                    'superset_group', p.superset_group,
+                    'notes', p.notes
+                ) ELSE json_build_object(
+                    'split_day_name', p.split_day_name,
+                    'exercise_order', p.exercise_order,
+                    'exercise_name', p.exercise_name,
+                    'exercise_type', p.exercise_type,
+                    'target_muscles', p.target_muscles,
+                    'sets', p.sets,
+                    'rep_range_low', p.rep_range_low,
+                    'rep_range_high', p.rep_range_high,
+                    'load_percentage', p.load_percentage,
+                    'rest_seconds', p.rest_seconds,
+                    'superset_group', p.superset_group,
+                    'notes', p.notes
+                ) END
+                ORDER BY p.split_day_name, p.exercise_order)
+            FROM page p
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,72 @@
+-- Migration 038: replace_workout_plan RPC
+-- Swaps a split's plan in one transaction: rows still in the new plan are
+-- upserted on the existing (user_id, split_id, split_day_name, exercise_order)
+-- unique index (011), and slots the new plan no longer has are deleted.
+-- generate_workout_plan previously made a DELETE and a bulk INSERT as two
+-- calls, leaving a window where the split had no plan and rewriting every
+-- row even when most were unchanged.
+-- One statement: the parsed rows are a CTE feeding both the DELETE and the
+-- upsert. They touch disjoint (split day, order) keys, so sharing the
+-- statement snapshot is safe.
+--
+-- p_rows: [{"split_day_name", "exercise_order", "exercise_name", "exercise_type",
+--           "target_muscles", "sets", "rep_range_low", "rep_range_high",
+--           "load_percentage"?, "rest_seconds"?, "superset_group"?, "notes"?}, ...]
+-- Returns the number of rows written.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.replace_workout_plan(
+    p_user_id uuid,
+    p_split_id uuid,
+    p_rows jsonb
+)
+RETURNS integer AS $$
+    WITH new_plan AS (
+        SELECT *
+        FROM jsonb_to_recordset(p_rows) AS r(
+            split_day_name text, exercise_order int, exercise_name text,
+            exercise_type text, target_muscles text[], sets int,
+            rep_range_low int, rep_range_high int, load_percentage float,
+            rest_seconds int, superset_group int, notes text
+        )
+    ),
+    removed AS (
+        DELETE FROM public.workout_plan_exercises wpe
+        WHERE wpe.user_id = p_user_id
+          AND wpe.split_id = p_split_id
+          AND NOT EXISTS (
+              SELECT 1 FROM new_plan n
+              WHERE n.split_day_name = wpe.split_day_name
+                AND n.exercise_order = wpe.exercise_order
+          )
+    ),
+    written AS (
+        INSERT INTO public.workout_plan_exercises AS wpe
+            (user_id, split_id, split_day_name, exercise_order, exercise_name,
+             exercise_type, target_muscles, sets, rep_range_low, rep_range_high,
+             load_percentage, rest_seconds, superset_group, notes,
+             created_at, updated_at)
+        SELECT p_user_id, p_split_id, n.split_day_name, n.exercise_order, n.exercise_name,
+               n.exercise_type, n.target_muscles, n.sets, n.rep_range_low, n.rep_range_high,
+               n.load_percentage, COALESCE(n.rest_seconds, 120), n.superset_group, n.notes,
+               now(), now()
+        FROM new_plan n
+        ON CONFLICT (user_id, split_id, split_day_name, exercise_order) DO UPDATE SET
+            exercise_name   = EXCLUDED.exercise_name,
+            exercise_type   = EXCLUDED.exercise_type,
+            target_muscles  = EXCLUDED.target_muscles,
+            sets            = EXCLUDED.sets,
+            rep_range_low   = EXCLUDED.rep_range_low,
+            rep_range_high  = EXCLUDED.rep_range_high,
+            load_percentage = EXCLUDED.load_percentage,
+            rest_seconds    = EXCLUDED.rest_seconds,
+            superset_group  = EXCLUDED.superset_group,
+            notes           = EXCLUDED.notes,
+            updated_at      = EXCLUDED.updated_at
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM written;
+$$ LANGUAGE sql VOLATILE;
+
+COMMIT;
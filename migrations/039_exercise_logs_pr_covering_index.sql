@@ -0,0 +1,17 @@
+-- Migration 039: covering index for PR baselines
+-- log_exercise_sets_with_pr (032) reads MAX(volume_load) and
+-- MAX(weight_kg) over the user's working sets of one exercise on every
+-- log_exercise_sets call. Those are the only columns it projects, so a partial
+-- index on working sets that carries both lets the aggregate run as an
+-- index-only scan instead of visiting each matching heap row.
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_lower_name_working_cover
+    ON public.exercise_logs (user_id, lower(exercise_name))
+    INCLUDE (volume_load, weight_kg)
+    WHERE is_warmup = false;
+
+COMMIT;
@@ -0,0 +1,236 @@
+-- Migration 040: exercise_logs.exercise_name_lower
+-- The two remaining PostgREST reads by exercise name (get_exercise_history
+-- and the /api/progress best-set lookups) filtered with ILIKE, which no btree
+-- serves. PostgREST cannot filter on an expression, so the lowercased name is
+-- stored as a generated column the client can eq-match, and indexed in the
+-- (user_id, name, log_date DESC) shape those reads use.
+-- That index replaces 034's lower(exercise_name) expression index, and 039's
+-- PR covering index is rebuilt on the column, so the RPCs that read
+-- exercise_logs by name (get_exercise_overview, get_exercise_pr_baselines
+-- and log_exercise_sets_with_pr) match on the column as well. Every
+-- exercise_logs lookup normalises the same way:
+-- exercise_name_lower = lower(p_exercise_name). The user_1rm_records lookup
+-- keeps 034's expression index on that table.
+-- Adding a STORED generated column rewrites exercise_logs once; plain
+-- CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+ALTER TABLE public.exercise_logs
+    ADD COLUMN IF NOT EXISTS exercise_name_lower text
+    GENERATED ALWAYS AS (lower(exercise_name)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_date
+    ON public.exercise_logs (user_id, exercise_name_lower, log_date DESC);
+
+DROP INDEX IF EXISTS public.idx_exlog_user_lower_name_date;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_working_cover
+    ON public.exercise_logs (user_id, exercise_name_lower)
+    INCLUDE (volume_load, weight_kg)
+    WHERE is_warmup = false;
+
+DROP INDEX IF EXISTS public.idx_exlog_user_lower_name_working_cover;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_overview(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_weeks int DEFAULT 8
+)
+RETURNS json AS $$
+    WITH sets AS (
+        SELECT el.log_date, el.set_number, el.weight_kg, el.reps, el.rpe,
+               el.is_warmup, el.is_pr, el.volume_load
+        FROM public.exercise_logs el
+        WHERE el.user_id = p_user_id
+          AND el.exercise_name_lower = lower(p_exercise_name)
+    )
+    SELECT json_build_object(
+        'weekly_trend', COALESCE((
+            SELECT json_agg(p)
+            FROM public.get_exercise_progress(p_user_id, p_exercise_name, p_weeks) p
+        ), '[]'::json),
+        'pr_history', COALESCE((
+            SELECT json_agg(json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            ) ORDER BY s.log_date DESC)
+            FROM (
+                SELECT * FROM sets
+                WHERE is_warmup = false AND is_pr = true
+                ORDER BY log_date DESC
+                LIMIT 20
+            ) s
+        ), '[]'::json),
+        'best_weight', (
+            SELECT json_build_object('weight_kg', s.weight_kg, 'reps', s.reps, 'log_date', s.log_date)
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.weight_kg DESC
+            LIMIT 1
+        ),
+        'best_volume_set', (
+            SELECT json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            )
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.volume_load DESC
+            LIMIT 1
+        ),
+        'recent_session', COALESCE((
+            SELECT json_agg(json_build_object(
+                'set_number', s.set_number,
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'rpe', s.rpe,
+                'is_warmup', s.is_warmup,
+                'is_pr', s.is_pr,
+                'volume_load', s.volume_load
+            ) ORDER BY s.set_number)
+            FROM sets s
+            WHERE s.log_date = (SELECT MAX(log_date) FROM sets)
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_pr_baselines(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_log_date date DEFAULT NULL
+)
+RETURNS TABLE (best_volume float, best_weight float, last_set_number int) AS $$
+    SELECT COALESCE(MAX(el.volume_load) FILTER (WHERE el.is_warmup = false), 0),
+           COALESCE(MAX(el.weight_kg) FILTER (WHERE el.is_warmup = false), 0),
+           COALESCE(MAX(el.set_number) FILTER (WHERE el.log_date = p_log_date), 0)
+    FROM public.exercise_logs el
+    WHERE el.user_id = p_user_id
+      AND el.exercise_name_lower = lower(p_exercise_name);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.log_exercise_sets_with_pr(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_log_date date,
+    p_sets jsonb,
+    p_workout_log_id uuid DEFAULT NULL,
+    p_new_1rm_name text DEFAULT NULL
+)
+RETURNS jsonb AS $$
+DECLARE
+    v_best_volume float := 0;
+    v_best_weight float := 0;
+    v_set jsonb;
+    v_i int := 0;
+    v_weight float;
+    v_reps int;
+    v_vol float;
+    v_warmup boolean;
+    v_is_pr boolean;
+    v_pr_sets jsonb := '[]'::jsonb;
+    v_working int := 0;
+    v_total_volume float := 0;
+    v_rows jsonb := '[]'::jsonb;
+    v_inserted int;
+    v_top_single float;
+    v_1rm_name text;
+    v_1rm_weight float;
+    v_1rm_updated boolean := false;
+BEGIN
+    SELECT COALESCE(MAX(el.volume_load), 0), COALESCE(MAX(el.weight_kg), 0)
+    INTO v_best_volume, v_best_weight
+    FROM public.exercise_logs el
+    WHERE el.user_id = p_user_id
+      AND el.exercise_name_lower = lower(p_exercise_name)
+      AND el.is_warmup = false;
+
+    FOR v_set IN SELECT value FROM jsonb_array_elements(p_sets) LOOP
+        v_i := v_i + 1;
+        v_weight := COALESCE((v_set->>'weight_kg')::float, 0);
+        v_reps := COALESCE((v_set->>'reps')::numeric::int, 0);
+        v_warmup := COALESCE((v_set->>'is_warmup')::boolean, false);
+        v_vol := v_weight * v_reps;
+        v_is_pr := false;
+
+        IF NOT v_warmup THEN
+            v_working := v_working + 1;
+            v_total_volume := v_total_volume + v_vol;
+        END IF;
+
+        IF NOT v_warmup AND v_vol > 0 THEN
+            IF v_vol > v_best_volume THEN
+                v_is_pr := true;
+                v_best_volume := v_vol;
+                v_pr_sets := v_pr_sets || jsonb_build_object(
+                    'set_number', v_i, 'kind', 'volume', 'weight_kg', v_weight, 'reps', v_reps
+                );
+            ELSIF v_weight > v_best_weight THEN
+                v_is_pr := true;
+                v_best_weight := v_weight;
+                v_pr_sets := v_pr_sets || jsonb_build_object(
+                    'set_number', v_i, 'kind', 'weight', 'weight_kg', v_weight, 'reps', v_reps
+                );
+            END IF;
+        END IF;
+
+        v_rows := v_rows || jsonb_build_object(
+            'set_number', v_i,
+            'weight_kg', v_weight,
+            'reps', v_reps,
+            'rpe', (v_set->>'rpe')::float,
+            'is_warmup', v_warmup,
+            'is_pr', v_is_pr,
+            'notes', v_set->>'notes'
+        );
+    END LOOP;
+
+    INSERT INTO public.exercise_logs
+        (user_id, workout_log_id, log_date, exercise_name, set_number,
+         weight_kg, reps, rpe, is_warmup, is_pr, notes)
+    SELECT p_user_id, p_workout_log_id, p_log_date, p_exercise_name, r.set_number,
+           r.weight_kg, r.reps, r.rpe, r.is_warmup, r.is_pr, r.notes
+    FROM jsonb_to_recordset(v_rows) AS r(
+        set_number int, weight_kg float, reps int, rpe float,
+        is_warmup boolean, is_pr boolean, notes text
+    );
+    GET DIAGNOSTICS v_inserted = ROW_COUNT;
+
+    -- Heaviest working single, if any, may raise the stored 1RM
+    SELECT MAX(r.weight_kg) INTO v_top_single
+    FROM jsonb_to_recordset(v_rows) AS r(weight_kg float, reps int, is_warmup boolean)
+    WHERE r.reps = 1 AND NOT r.is_warmup AND r.weight_kg > 0;
+
+    IF v_top_single IS NOT NULL THEN
+        SELECT r.exercise_name, r.weight_kg INTO v_1rm_name, v_1rm_weight
+        FROM public.user_1rm_records r
+        WHERE r.user_id = p_user_id AND lower(r.exercise_name) = lower(p_exercise_name)
+        LIMIT 1;
+
+        IF v_1rm_weight IS NULL OR v_1rm_weight < v_top_single THEN
+            -- Keep the existing canonical name so the case-sensitive unique
+            -- index doesn't get a second row for the same lift
+            INSERT INTO public.user_1rm_records (user_id, exercise_name, weight_kg, updated_at)
+            VALUES (p_user_id, COALESCE(v_1rm_name, p_new_1rm_name, p_exercise_name), v_top_single, now())
+            ON CONFLICT (user_id, exercise_name)
+            DO UPDATE SET weight_kg = EXCLUDED.weight_kg, updated_at = EXCLUDED.updated_at;
+            v_1rm_updated := true;
+        END IF;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'pr_sets', v_pr_sets,
+        'inserted', v_inserted,
+        'working_sets', v_working,
+        'total_volume', v_total_volume,
+        'one_rm_updated', v_1rm_updated
+    );
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- Migration 041: best-set indexes on working sets
+-- /api/progress fetches the heaviest and the biggest-volume working set of
+-- one exercise (is_warmup = false ORDER BY weight_kg / volume_load DESC
+-- LIMIT 1). These partial indexes match that filter and order, so each read
+-- is a single index probe instead of sorting every set of the exercise.
+-- The weight one supersedes 011's idx_exlog_user_exercise_weight, which keyed
+-- on the case-sensitive name that no lookup matches on any more.
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_weight
+    ON public.exercise_logs (user_id, exercise_name_lower, weight_kg DESC)
+    WHERE is_warmup = false;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_volume
+    ON public.exercise_logs (user_id, exercise_name_lower, volume_load DESC)
+    WHERE is_warmup = false;
+
+DROP INDEX IF EXISTS public.idx_exlog_user_exercise_weight;
+
+COMMIT;
@@ -0,0 +1,230 @@
+-- Migration 042: weekly overload rollup
+-- get_exercise_progress (011) re-aggregated every working set of an exercise
+-- in the lookback window on each call, and get_exercise_overview calls it on
+-- every progressive-overload request. exercise_weekly_rollup keeps those
+-- weekly aggregates per (user, lowercased exercise, week), maintained by
+-- statement-level triggers on exercise_logs, so the RPC reads a handful of
+-- precomputed rows instead.
+--
+-- The triggers recompute each touched (user, exercise, week) bucket from
+-- exercise_logs rather than adjusting it incrementally, so MAX/BOOL_OR stay
+-- correct on update and delete. A bulk set insert (log_exercise_sets_with_pr)
+-- recomputes each bucket once per statement, under a per-bucket advisory
+-- lock so concurrent writers to one week can't overwrite each other's totals.
+--
+-- Behaviour change: the oldest week in the window is now reported whole
+-- rather than clipped at exactly p_weeks * 7 days back.
+
+BEGIN;
+
+-- ============================================================================
+-- 1. ROLLUP TABLE
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.exercise_weekly_rollup (
+    user_id           uuid NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    exercise_name_key text NOT NULL,          -- lower(exercise_name)
+    week_start        date NOT NULL,          -- Monday of the ISO week
+    best_e1rm         float,
+    total_volume      float,
+    total_sets        int NOT NULL,
+    best_weight       float,
+    best_reps         int,
+    has_pr            boolean,
+    PRIMARY KEY (user_id, exercise_name_key, week_start)
+);
+
+ALTER TABLE public.exercise_weekly_rollup ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own exercise rollup" ON public.exercise_weekly_rollup;
+CREATE POLICY "Users can view own exercise rollup" ON public.exercise_weekly_rollup
+    FOR SELECT USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Service role full access exercise_weekly_rollup" ON public.exercise_weekly_rollup;
+CREATE POLICY "Service role full access exercise_weekly_rollup" ON public.exercise_weekly_rollup
+    FOR ALL USING (auth.role() = 'service_role');
+
+
+-- ============================================================================
+-- 2. MAINTENANCE TRIGGERS
+--    One function for all three statement triggers (transition tables can't
+--    be shared across events); SECURITY DEFINER so end-user writes to
+--    exercise_logs can maintain the rollup under RLS.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.refresh_exercise_weekly_rollup()
+RETURNS trigger AS $$
+DECLARE
+    v_user_ids uuid[];
+    v_names    text[];
+    v_weeks    date[];
+BEGIN
+    -- Touched buckets, collected from whichever transition tables this
+    -- event has (referencing an absent one is an error)
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(k.user_id), array_agg(k.name_key), array_agg(k.week_start)
+        INTO v_user_ids, v_names, v_weeks
+        FROM (
+            SELECT DISTINCT n.user_id, lower(n.exercise_name) AS name_key,
+                   date_trunc('week', n.log_date::timestamp)::date AS week_start
+            FROM new_rows n
+        ) k;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(k.user_id), array_agg(k.name_key), array_agg(k.week_start)
+        INTO v_user_ids, v_names, v_weeks
+        FROM (
+            SELECT DISTINCT o.user_id, lower(o.exercise_name) AS name_key,
+                   date_trunc('week', o.log_date::timestamp)::date AS week_start
+            FROM old_rows o
+        ) k;
+    ELSE
+        SELECT array_agg(k.user_id), array_agg(k.name_key), array_agg(k.week_start)
+        INTO v_user_ids, v_names, v_weeks
+        FROM (
+            SELECT n.user_id, lower(n.exercise_name) AS name_key,
+                   date_trunc('week', n.log_date::timestamp)::date AS week_start
+            FROM new_rows n
+            UNION
+            SELECT o.user_id, lower(o.exercise_name),
+                   date_trunc('week', o.log_date::timestamp)::date
+            FROM old_rows o
+        ) k;
+    END IF;
+
+    -- Serialize writers per bucket. Without this, two overlapping inserts
+    -- into the same week each aggregate a snapshot that misses the other's
+    -- rows, and the later upsert drops sets. The lock is held to commit, so
+    -- the recompute below (a new statement, hence a fresh READ COMMITTED
+    -- snapshot) sees everything the previous holder wrote. Taken in hash
+    -- order so concurrent multi-bucket writes can't deadlock.
+    PERFORM pg_advisory_xact_lock(k.lock_key)
+    FROM (
+        SELECT DISTINCT hashtext(u::text || n || w::text) AS lock_key
+        FROM unnest(v_user_ids, v_names, v_weeks) AS t(u, n, w)
+        ORDER BY 1
+    ) k;
+
+    -- Rebuild the touched buckets that still have working sets and drop the
+    -- ones that don't. The two sets of buckets are disjoint, so one
+    -- statement can do both.
+    WITH keys AS (
+        SELECT *
+        FROM unnest(v_user_ids, v_names, v_weeks) AS k(user_id, exercise_name_key, week_start)
+    ),
+    buckets AS (
+        SELECT el.user_id, k.exercise_name_key, k.week_start,
+               MAX(public.estimated_1rm(el.weight_kg, el.reps))::float AS best_e1rm,
+               SUM(el.volume_load)::float AS total_volume,
+               COUNT(*)::int AS total_sets,
+               MAX(el.weight_kg)::float AS best_weight,
+               MAX(el.reps)::int AS best_reps,
+               BOOL_OR(el.is_pr) AS has_pr
+        FROM keys k
+        JOIN public.exercise_logs el
+          ON el.user_id = k.user_id
+         AND el.exercise_name_lower = k.exercise_name_key
+         AND el.log_date >= k.week_start
+         AND el.log_date < k.week_start + 7
+        WHERE el.is_warmup = false
+        GROUP BY el.user_id, k.exercise_name_key, k.week_start
+    ),
+    emptied AS (
+        DELETE FROM public.exercise_weekly_rollup r
+        USING keys k
+        WHERE r.user_id = k.user_id
+          AND r.exercise_name_key = k.exercise_name_key
+          AND r.week_start = k.week_start
+          AND NOT EXISTS (
+              SELECT 1 FROM buckets b
+              WHERE b.user_id = k.user_id
+                AND b.exercise_name_key = k.exercise_name_key
+                AND b.week_start = k.week_start
+          )
+    )
+    INSERT INTO public.exercise_weekly_rollup AS r
+        (user_id, exercise_name_key, week_start, best_e1rm, total_volume,
+         total_sets, best_weight, best_reps, has_pr)
+    SELECT b.user_id, b.exercise_name_key, b.week_start, b.best_e1rm, b.total_volume,
+           b.total_sets, b.best_weight, b.best_reps, b.has_pr
+    FROM buckets b
+    ON CONFLICT (user_id, exercise_name_key, week_start) DO UPDATE SET
+        best_e1rm    = EXCLUDED.best_e1rm,
+        total_volume = EXCLUDED.total_volume,
+        total_sets   = EXCLUDED.total_sets,
+        best_weight  = EXCLUDED.best_weight,
+        best_reps    = EXCLUDED.best_reps,
+        has_pr       = EXCLUDED.has_pr;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp;
+
+DROP TRIGGER IF EXISTS trg_exlog_rollup_insert ON public.exercise_logs;
+CREATE TRIGGER trg_exlog_rollup_insert
+    AFTER INSERT ON public.exercise_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.refresh_exercise_weekly_rollup();
+
+DROP TRIGGER IF EXISTS trg_exlog_rollup_update ON public.exercise_logs;
+CREATE TRIGGER trg_exlog_rollup_update
+    AFTER UPDATE ON public.exercise_logs
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.refresh_exercise_weekly_rollup();
+
+DROP TRIGGER IF EXISTS trg_exlog_rollup_delete ON public.exercise_logs;
+CREATE TRIGGER trg_exlog_rollup_delete
+    AFTER DELETE ON public.exercise_logs
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.refresh_exercise_weekly_rollup();
+
+
+-- ============================================================================
+-- 3. BACKFILL
+-- ============================================================================
+
+INSERT INTO public.exercise_weekly_rollup
+    (user_id, exercise_name_key, week_start, best_e1rm, total_volume,
+     total_sets, best_weight, best_reps, has_pr)
+SELECT el.user_id, el.exercise_name_lower,
+       date_trunc('week', el.log_date::timestamp)::date,
+       MAX(public.estimated_1rm(el.weight_kg, el.reps))::float,
+       SUM(el.volume_load)::float,
+       COUNT(*)::int,
+       MAX(el.weight_kg)::float,
+       MAX(el.reps)::int,
+       BOOL_OR(el.is_pr)
+FROM public.exercise_logs el
+WHERE el.is_warmup = false
+GROUP BY 1, 2, 3
+ON CONFLICT (user_id, exercise_name_key, week_start) DO NOTHING;
+
+
+-- ============================================================================
+-- 4. get_exercise_progress READS THE ROLLUP
+--    Same signature and columns as 011; get_exercise_overview picks it up.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.get_exercise_progress(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_weeks int DEFAULT 8
+)
+RETURNS TABLE (
+    week_start   date,
+    best_e1rm    float,
+    total_volume float,
+    total_sets   int,
+    best_weight  float,
+    best_reps    int,
+    has_pr       boolean
+) AS $$
+    SELECT r.week_start, r.best_e1rm, r.total_volume, r.total_sets,
+           r.best_weight, r.best_reps, r.has_pr
+    FROM public.exercise_weekly_rollup r
+    WHERE r.user_id = p_user_id
+      AND r.exercise_name_key = lower(p_exercise_name)
+      AND r.week_start >= date_trunc('week', (CURRENT_DATE - (p_weeks * 7))::timestamp)::date
+    ORDER BY r.week_start ASC;
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Migration 043: exercise history keyset index
+-- get_exercise_history pages an exercise's sets in (log_date DESC,
+-- set_number, id) order. The 040 index only covered the log_date part, so
+-- every page re-sorted each day's sets. Extending it with the tiebreak
+-- columns lets both the ordering and the keyset cursor come straight off the
+-- index; it supersedes idx_exlog_user_name_lower_date (same leading columns).
+-- Plain CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_date_set
+    ON public.exercise_logs (user_id, exercise_name_lower, log_date DESC, set_number, id);
+
+DROP INDEX IF EXISTS public.idx_exlog_user_name_lower_date;
+
+COMMIT;
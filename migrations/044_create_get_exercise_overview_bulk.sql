@@ -0,0 +1,22 @@
+-- Migration 044: get_exercise_overview_bulk RPC
+-- get_exercise_overview (028/040) for several exercises in one call, as a
+-- json object keyed by the requested name. Backs the
+-- get_progressive_overload_bulk tool, so a dashboard-style "how are all my
+-- lifts going" turn is one request instead of one per exercise.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_overview_bulk(
+    p_user_id uuid,
+    p_names text[],
+    p_weeks int DEFAULT 8
+)
+RETURNS json AS $$
+    SELECT COALESCE(
+        json_object_agg(n.name, public.get_exercise_overview(p_user_id, n.name, p_weeks)),
+        '{}'::json
+    )
+    FROM unnest(p_names) AS n(name);
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
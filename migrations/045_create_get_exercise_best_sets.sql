@@ -0,0 +1,48 @@
+-- Migration 045: get_exercise_best_sets RPC
+-- The heaviest and the biggest-volume working set of one exercise in a
+-- single call. /api/progress fetched them as two PostgREST reads that differ
+-- only in ORDER BY; each subquery here is one probe of the matching 041
+-- partial index.
+-- Returns {"best_weight": {...}|null, "best_volume_set": {...}|null}, each
+-- {weight_kg, reps, volume_load, log_date}.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_best_sets(
+    p_user_id uuid,
+    p_exercise_name text
+)
+RETURNS json AS $$
+    SELECT json_build_object(
+        'best_weight', (
+            SELECT json_build_object(
+                'weight_kg', el.weight_kg,
+                'reps', el.reps,
+                'volume_load', el.volume_load,
+                'log_date', el.log_date
+            )
+            FROM public.exercise_logs el
+            WHERE el.user_id = p_user_id
+              AND el.exercise_name_lower = lower(p_exercise_name)
+              AND el.is_warmup = false
+            ORDER BY el.weight_kg DESC
+            LIMIT 1
+        ),
+        'best_volume_set', (
+            SELECT json_build_object(
+                'weight_kg', el.weight_kg,
+                'reps', el.reps,
+                'volume_load', el.volume_load,
+                'log_date', el.log_date
+            )
+            FROM public.exercise_logs el
+            WHERE el.user_id = p_user_id
+              AND el.exercise_name_lower = lower(p_exercise_name)
+              AND el.is_warmup = false
+            ORDER BY el.volume_load DESC
+            LIMIT 1
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
@@ -0,0 +1,148 @@
+-- Migration 046: exercise_logs.e1rm
+-- Estimated 1RM per set, stored as a generated column with the same Epley
+-- rule as public.estimated_1rm (011): 0 for no reps, the weight itself for a
+-- single, otherwise weight x (1 + reps / 30) to one decimal. Inlined rather
+-- than calling the function so the stored values can't drift if it changes.
+--
+-- best_e1rm used to be derived in Python from the heaviest set only, so a
+-- lighter set with more reps could out-estimate it and be missed (it also
+-- applied the multi-rep formula to singles). get_exercise_overview and
+-- get_exercise_best_sets now report MAX(e1rm) over working sets, served by
+-- a partial index. Both are otherwise unchanged from 040 / 045.
+-- Adding a STORED generated column rewrites exercise_logs once; plain
+-- CREATE INDEX (not CONCURRENTLY) so the file runs in the SQL editor's
+-- transaction.
+
+BEGIN;
+
+ALTER TABLE public.exercise_logs
+    ADD COLUMN IF NOT EXISTS e1rm float
+    GENERATED ALWAYS AS (
+        CASE
+            WHEN reps <= 0 THEN 0
+            WHEN reps = 1 THEN weight_kg
+            ELSE round((weight_kg * (1.0 + reps::float / 30.0))::numeric, 1)::float
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_exlog_user_name_lower_e1rm
+    ON public.exercise_logs (user_id, exercise_name_lower, e1rm DESC)
+    WHERE is_warmup = false;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_overview(
+    p_user_id uuid,
+    p_exercise_name text,
+    p_weeks int DEFAULT 8
+)
+RETURNS json AS $$
+    WITH sets AS (
+        SELECT el.log_date, el.set_number, el.weight_kg, el.reps, el.rpe,
+               el.is_warmup, el.is_pr, el.volume_load, el.e1rm
+        FROM public.exercise_logs el
+        WHERE el.user_id = p_user_id
+          AND el.exercise_name_lower = lower(p_exercise_name)
+    )
+    SELECT json_build_object(
+        'weekly_trend', COALESCE((
+            SELECT json_agg(p)
+            FROM public.get_exercise_progress(p_user_id, p_exercise_name, p_weeks) p
+        ), '[]'::json),
+        'pr_history', COALESCE((
+            SELECT json_agg(json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            ) ORDER BY s.log_date DESC)
+            FROM (
+                SELECT * FROM sets
+                WHERE is_warmup = false AND is_pr = true
+                ORDER BY log_date DESC
+                LIMIT 20
+            ) s
+        ), '[]'::json),
+        'best_weight', (
+            SELECT json_build_object('weight_kg', s.weight_kg, 'reps', s.reps, 'log_date', s.log_date)
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.weight_kg DESC
+            LIMIT 1
+        ),
+        'best_e1rm', (
+            SELECT MAX(s.e1rm) FROM sets s WHERE s.is_warmup = false
+        ),
+        'best_volume_set', (
+            SELECT json_build_object(
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'volume_load', s.volume_load,
+                'log_date', s.log_date
+            )
+            FROM sets s
+            WHERE s.is_warmup = false
+            ORDER BY s.volume_load DESC
+            LIMIT 1
+        ),
+        'recent_session', COALESCE((
+            SELECT json_agg(json_build_object(
+                'set_number', s.set_number,
+                'weight_kg', s.weight_kg,
+                'reps', s.reps,
+                'rpe', s.rpe,
+                'is_warmup', s.is_warmup,
+                'is_pr', s.is_pr,
+                'volume_load', s.volume_load
+            ) ORDER BY s.set_number)
+            FROM sets s
+            WHERE s.log_date = (SELECT MAX(log_date) FROM sets)
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.get_exercise_best_sets(
+    p_user_id uuid,
+    p_exercise_name text
+)
+RETURNS json AS $$
+    SELECT json_build_object(
+        'best_e1rm', (
+            SELECT el.e1rm
+            FROM public.exercise_logs el
+            WHERE el.user_id = p_user_id
+              AND el.exercise_name_lower = lower(p_exercise_name)
+              AND el.is_warmup = false
+            ORDER BY el.e1rm DESC
+            LIMIT 1
+        ),
+        'best_weight', (
+            SELECT json_build_object(
+                'weight_kg', el.weight_kg,
+                'reps', el.reps,
+                'volume_load', el.volume_load,
+                'log_date', el.log_date
+            )
+            FROM public.exercise_logs el
+            WHERE el.user_id = p_user_id
+              AND el.exercise_name_lower = lower(p_exercise_name)
+              AND el.is_warmup = false
+            ORDER BY el.weight_kg DESC
+            LIMIT 1
+        ),
+        'best_volume_set', (
+            SELECT json_build_object(
+                'weight_kg', el.weight_kg,
+                'reps', el.reps,
+                'volume_load', el.volume_load,
+                'log_date', el.log_date
+            )
+            FROM public.exercise_logs el
+            WHERE el.user_id = p_user_id
+              AND el.exercise_name_lower = lower(p_exercise_name)
+              AND el.is_warmup = false
+            ORDER BY el.volume_load DESC
+            LIMIT 1
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMIT;
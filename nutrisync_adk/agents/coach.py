@@ -2,11 +2,11 @@ import logging
 from google.adk.agents import Agent
 from google.adk.tools import google_search
 from google.genai import types
-from ..tools.nutrition import log_meal, get_nutrition_history, calculate_macros
+from ..tools.nutrition import log_meal, log_meals, get_nutrition_history, get_daily_nutrition_totals, calculate_macros
 from ..tools.workouts import (
-    log_workout, get_workout_history, get_next_scheduled_workout,
+    log_workout, get_workout_history, get_daily_workout_totals, get_next_scheduled_workout,
     generate_workout_plan, get_workout_plan, log_exercise_sets,
-    get_exercise_history, get_progressive_overload_summary,
+    get_exercise_history, get_progressive_overload_summary, get_progressive_overload_bulk,
 )
 from ..tools.sleep import log_sleep, get_sleep_history
 from ..tools.body_comp import log_body_comp, get_body_comp_history
@@ -26,10 +26,13 @@ coach_agent = Agent(
     instruction="You are a helpful NutriSync coach.",  # Placeholder — overridden by InstructionProvider in runner
     tools=[
         log_meal,
+        log_meals,
         get_nutrition_history,
+        get_daily_nutrition_totals,
         calculate_macros,
         log_workout,
         get_workout_history,
+        get_daily_workout_totals,
         get_next_scheduled_workout,
         get_health_scores,
         log_sleep,
@@ -47,6 +50,7 @@ coach_agent = Agent(
         log_exercise_sets,
         get_exercise_history,
         get_progressive_overload_summary,
+        get_progressive_overload_bulk,
     ],
     description="Main coach agent handling nutrition, workout planning, set-level exercise logging, progressive overload tracking, sleep, body comp, context notes logic, and up-to-date internet searches."
 )
@@ -1,13 +1,24 @@
+import asyncio
+import functools
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 from .runners import NutriSyncRunner
 from .services.analytics import capture as posthog_capture, identify as posthog_identify, shutdown as posthog_shutdown
+from .services.cache import (
+    invalidate_user_context, invalidate_user_logs, next_workout_cache, workout_plan_cache,
+    overload_summary_cache, USER_CONTEXT_CORE,
+)
+from .services.db_pool import close_pg_pool
+from .tools.utils import get_today_date_str, b64decode
 
 load_dotenv()
 
@@ -21,9 +32,17 @@ app = FastAPI()
 runner = NutriSyncRunner()
 scheduler = AsyncIOScheduler()
 
+# Blocking Supabase/Storage/webpush I/O reaches the loop's default executor via
+# asyncio.to_thread and APScheduler's sync jobs; the stock pool is sized for CPU
+# (min(32, cpu_count + 4)), so give it room for I/O-bound concurrency instead.
+_IO_EXECUTOR_WORKERS = 64
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("NutriSync ADK is starting up...")
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=_IO_EXECUTOR_WORKERS, thread_name_prefix="supabase-io")
+    )
     try:
         from .services.notifications import run_morning_check, run_afternoon_check, run_evening_check, run_night_check, run_body_comp_check
         scheduler.add_job(run_morning_check, 'cron', hour=9, minute=0)
@@ -39,6 +58,9 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown()
+    await runner.drain_pending_writes()
+    await runner.postgrest.aclose()
+    await close_pg_pool()
     posthog_shutdown()
     logger.info("PostHog analytics flushed and shut down.")
 
@@ -48,13 +70,11 @@ async def health_check():
 
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
-    from fastapi.responses import Response
     return Response(status_code=204)
 
 # Chat API
 # Chat API
 from typing import Optional
-import base64
 
 class ChatRequest(BaseModel):
     message: str
@@ -85,7 +105,7 @@ async def chat_endpoint(request: ChatRequest):
                 encoded = request.image
                 mime_type = "image/jpeg" # Fallback
 
-            image_bytes = base64.b64decode(encoded)
+            image_bytes = b64decode(encoded)
         except Exception as e:
             logger.error(f"Failed to decode image: {e}")
 
@@ -196,7 +216,6 @@ def calculate_targets(data: dict) -> dict:
         height = int(data.get('height_cm', 175))
         age = 25 # Default
         if data.get('dob'):
-            from datetime import datetime
             dob = datetime.strptime(data['dob'], '%Y-%m-%d')
             today = datetime.today()
             age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
@@ -265,34 +284,34 @@ def calculate_targets(data: dict) -> dict:
             "daily_carbs_target_gm": 300
         }
 
+def _fetch_split_schedule(user_id: str) -> List[str]:
+    """Ordered day names of the user's active split (two dependent queries)."""
+    split_res = runner.supabase.table("workout_splits").select("id, name").eq("user_id", user_id).eq("is_active", True).execute()
+    if not split_res.data:
+        return []
+    split_id = split_res.data[0]['id']
+    items_res = runner.supabase.table("split_items").select("workout_name").eq("split_id", split_id).order("order_index").execute()
+    return [item['workout_name'] for item in items_res.data] if items_res.data else []
+
 @app.get("/api/profile/{user_id}")
 async def get_profile(user_id: str):
     try:
-        # Fetch Profile
-        res = runner.supabase.table("user_profile").select("*").eq("user_id", user_id).execute()
+        sb = runner.supabase
+        # Profile, split schedule, 1RM records and equipment are independent;
+        # fetch them concurrently instead of one blocking round-trip after another.
+        res, split_schedule, records_res, equip_res = await asyncio.gather(
+            asyncio.to_thread(lambda: sb.table("user_profile").select("*").eq("user_id", user_id).execute()),
+            asyncio.to_thread(_fetch_split_schedule, user_id),
+            asyncio.to_thread(lambda: sb.table("user_1rm_records").select("exercise_name, weight_kg").eq("user_id", user_id).execute()),
+            asyncio.to_thread(lambda: sb.table("user_equipment").select("equipment_name").eq("user_id", user_id).execute()),
+        )
+
         profile_data = {}
         if res.data:
             profile_data = res.data[0]
-            
-        # Fetch Active Split
-        split_res = runner.supabase.table("workout_splits").select("id, name").eq("user_id", user_id).eq("is_active", True).execute()
-        
-        split_schedule = []
-        if split_res.data:
-            split_id = split_res.data[0]['id']
-            # Fetch Items
-            items_res = runner.supabase.table("split_items").select("workout_name").eq("split_id", split_id).order("order_index").execute()
-            if items_res.data:
-                split_schedule = [item['workout_name'] for item in items_res.data]
         
         profile_data['split_schedule'] = split_schedule
-        
-        # Fetch 1RM Records
-        records_res = runner.supabase.table("user_1rm_records").select("exercise_name, weight_kg").eq("user_id", user_id).execute()
         profile_data['one_rm_records'] = records_res.data if records_res.data else []
-        
-        # Fetch User Equipment
-        equip_res = runner.supabase.table("user_equipment").select("equipment_name").eq("user_id", user_id).execute()
         profile_data['equipment_list'] = [e['equipment_name'] for e in equip_res.data] if equip_res.data else []
         
         return profile_data
@@ -309,6 +328,7 @@ async def update_language(user_id: str, body: dict):
         lang = "en"
     try:
         runner.supabase.table("user_profile").update({"language": lang}).eq("user_id", user_id).execute()
+        invalidate_user_context(user_id, USER_CONTEXT_CORE)
         return {"status": "ok", "language": lang}
     except Exception as e:
         logger.error(f"Error updating language: {e}")
@@ -317,8 +337,8 @@ async def update_language(user_id: str, body: dict):
 @app.post("/api/profile")
 async def update_profile(request: ProfileRequest):
     try:
-        # Check if profile exists
-        res = runner.supabase.table("user_profile").select("*").eq("user_id", request.user_id).execute()
+        # Check if profile exists (starting weight is the only field read back)
+        res = runner.supabase.table("user_profile").select("starting_weight_kg").eq("user_id", request.user_id).execute()
         
         data = request.dict(exclude_unset=True)
         current_weight = data.get("weight_kg", None) # Don't pop, keep in data for profile update
@@ -365,6 +385,7 @@ async def update_profile(request: ProfileRequest):
                 "user_id": request.user_id,
                 "weight_kg": current_weight
             }).execute()
+            invalidate_user_logs(request.user_id, "body_composition_logs")
         
         # Handle Custom Split (Upsert pattern: reuse existing active split)
         if split_schedule and len(split_schedule) > 0:
@@ -437,6 +458,11 @@ async def update_profile(request: ProfileRequest):
                 ]
                 runner.supabase.table("user_equipment").insert(equip_rows).execute()
 
+        # Profile, split, 1RMs and equipment all feed the chat context
+        invalidate_user_context(request.user_id)
+        next_workout_cache.pop(request.user_id)
+        workout_plan_cache.pop(request.user_id)
+
         # ── PostHog: Track profile save and set person properties ──
         posthog_capture(request.user_id, "api_profile_saved", {
             "fitness_goal": request.fitness_goal,
@@ -480,7 +506,6 @@ class LiveCoachLogRequest(BaseModel):
 async def log_live_coach_exercise(request: LiveCoachLogRequest):
     """Logs a single set from the Live Coach pose tracker into exercise_logs."""
     try:
-        from .tools.utils import get_today_date_str
 
         exercise_name = LIVE_COACH_EXERCISE_MAP.get(
             request.exercise_key, request.exercise_key.title()
@@ -501,38 +526,19 @@ async def log_live_coach_exercise(request: LiveCoachLogRequest):
 
         log_date = get_today_date_str()
 
-        # Determine next set_number for this exercise today
-        existing_sets = (runner.supabase.table("exercise_logs")
-                         .select("set_number")
-                         .eq("user_id", request.user_id)
-                         .eq("log_date", log_date)
-                         .ilike("exercise_name", exercise_name)
-                         .order("set_number", desc=True)
-                         .limit(1)
-                         .execute())
-        set_number = (existing_sets.data[0]["set_number"] + 1) if existing_sets.data else 1
-
-        # ── PR Detection (volume PR & weight PR) ───────────────────────────
-        pr_resp = (runner.supabase.table("exercise_logs")
-                   .select("volume_load")
-                   .eq("user_id", request.user_id)
-                   .ilike("exercise_name", exercise_name)
-                   .eq("is_warmup", False)
-                   .order("volume_load", desc=True)
-                   .limit(1)
-                   .execute())
-        existing_best_volume = pr_resp.data[0]["volume_load"] if pr_resp.data else 0
-
-        weight_pr_resp = (runner.supabase.table("exercise_logs")
-                          .select("weight_kg")
-                          .eq("user_id", request.user_id)
-                          .ilike("exercise_name", exercise_name)
-                          .eq("is_warmup", False)
-                          .order("weight_kg", desc=True)
-                          .limit(1)
-                          .execute())
-        existing_best_weight = weight_pr_resp.data[0]["weight_kg"] if weight_pr_resp.data else 0
-
+        # Next set_number for this exercise today + PR baselines (volume PR &
+        # weight PR), one aggregate RPC
+        baselines = runner.supabase.rpc("get_exercise_pr_baselines", {
+            "p_user_id": request.user_id,
+            "p_exercise_name": exercise_name,
+            "p_log_date": log_date,
+        }).execute().data
+        baseline = baselines[0] if baselines else {}
+        set_number = (baseline.get("last_set_number") or 0) + 1
+        existing_best_volume = baseline.get("best_volume") or 0
+        existing_best_weight = baseline.get("best_weight") or 0
+
+        # ── PR Detection ────────────────────────────────────────────────────
         vol = weight_kg * request.reps
         is_pr = False
         pr_type = None
@@ -559,6 +565,7 @@ async def log_live_coach_exercise(request: LiveCoachLogRequest):
         insert_resp = runner.supabase.table("exercise_logs").insert(row).execute()
         if not insert_resp.data:
             raise HTTPException(status_code=500, detail="error.exercise_log_failed")
+        overload_summary_cache.pop(request.user_id)
 
         # ── PostHog: Track live coach exercise log ──
         posthog_capture(request.user_id, "api_live_coach_logged", {
@@ -594,30 +601,12 @@ async def log_live_coach_exercise(request: LiveCoachLogRequest):
 async def get_workout_plan(user_id: str):
     """Returns the user's current AI-generated workout plan grouped by day."""
     try:
-        # Get active split
-        split_resp = (runner.supabase.table("workout_splits")
-                      .select("id, name")
-                      .eq("user_id", user_id)
-                      .eq("is_active", True)
-                      .limit(1)
-                      .execute())
-        if not split_resp.data:
+        # Active split + its plan rows in one RPC
+        plan_doc = runner.supabase.rpc("get_active_workout_plan", {"p_user_id": user_id}).execute().data or {}
+        if plan_doc.get("split_name") is None:
             return {"plan": [], "split_name": None, "message": "No active split found."}
 
-        split_id = split_resp.data[0]["id"]
-        split_name = split_resp.data[0]["name"]
-
-        plan_resp = (runner.supabase.table("workout_plan_exercises")
-                     .select("split_day_name, exercise_order, exercise_name, exercise_type, "
-                             "target_muscles, sets, rep_range_low, rep_range_high, "
-                             "load_percentage, rest_seconds, superset_group, notes")
-                     .eq("user_id", user_id)
-                     .eq("split_id", split_id)
-                     .order("split_day_name")
-                     .order("exercise_order")
-                     .execute())
-
-        return {"split_name": split_name, "plan": plan_resp.data or []}
+        return {"split_name": plan_doc["split_name"], "plan": plan_doc.get("plan") or []}
     except Exception as e:
         logger.error(f"Error fetching workout plan: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -628,83 +617,47 @@ async def get_progress(user_id: str, exercise: Optional[str] = None, weeks: int
     """Returns progressive overload data for one exercise or all exercises."""
     try:
         if exercise:
-            # Weekly trend via DB function
-            progress_resp = runner.supabase.rpc("get_exercise_progress", {
-                "p_user_id": user_id,
-                "p_exercise_name": exercise,
-                "p_weeks": weeks,
-            }).execute()
-
-            # All-time best weight
-            best_weight_resp = (runner.supabase.table("exercise_logs")
-                                .select("weight_kg, reps, volume_load, log_date")
-                                .eq("user_id", user_id)
-                                .ilike("exercise_name", exercise)
-                                .eq("is_warmup", False)
-                                .order("weight_kg", desc=True)
-                                .limit(1)
-                                .execute())
-
-            # All-time best volume set
-            best_vol_resp = (runner.supabase.table("exercise_logs")
-                             .select("weight_kg, reps, volume_load, log_date")
-                             .eq("user_id", user_id)
-                             .ilike("exercise_name", exercise)
-                             .eq("is_warmup", False)
-                             .order("volume_load", desc=True)
-                             .limit(1)
-                             .execute())
-
-            best_weight = best_weight_resp.data[0] if best_weight_resp.data else None
-            best_e1rm = None
-            if best_weight:
-                w, r = best_weight["weight_kg"], best_weight["reps"]
-                best_e1rm = round(w * (1 + r / 30.0), 1) if r > 0 else w
+            sb = runner.supabase
+
+            # Weekly trend via DB function, plus the all-time best weight and
+            # best volume set in one RPC: independent reads, issued concurrently
+            progress_resp, best_resp = await asyncio.gather(
+                asyncio.to_thread(lambda: sb.rpc("get_exercise_progress", {
+                    "p_user_id": user_id,
+                    "p_exercise_name": exercise,
+                    "p_weeks": weeks,
+                }).execute()),
+                asyncio.to_thread(lambda: sb.rpc("get_exercise_best_sets", {
+                    "p_user_id": user_id,
+                    "p_exercise_name": exercise,
+                }).execute()),
+            )
+            best_sets = best_resp.data or {}
 
             return {
                 "exercise": exercise,
                 "weekly_trend": progress_resp.data or [],
                 "all_time_pr": {
-                    "best_weight": best_weight,
-                    "best_volume_set": best_vol_resp.data[0] if best_vol_resp.data else None,
-                    "best_e1rm": best_e1rm,
+                    "best_weight": best_sets.get("best_weight"),
+                    "best_volume_set": best_sets.get("best_volume_set"),
+                    "best_e1rm": best_sets.get("best_e1rm"),
                 },
             }
         else:
             # Summary for all exercises
-            from datetime import datetime, timedelta
             cutoff = (datetime.utcnow() - timedelta(weeks=weeks)).strftime('%Y-%m-%d')
 
-            all_resp = (runner.supabase.table("exercise_logs")
-                        .select("exercise_name, weight_kg, reps, volume_load, is_pr, log_date")
-                        .eq("user_id", user_id)
-                        .eq("is_warmup", False)
-                        .gte("log_date", cutoff)
-                        .order("log_date", desc=True)
-                        .limit(500)
-                        .execute())
+            # Per-exercise totals grouped in Postgres (most recently trained
+            # first), same RPC the overload summary tool uses
+            summary_resp = runner.supabase.rpc("get_exercise_summaries", {
+                "p_user_id": user_id,
+                "p_since": cutoff,
+            }).execute()
 
-            if not all_resp.data:
+            exercises = summary_resp.data or []
+            if not exercises:
                 return {"exercises": [], "message": "No exercise data yet."}
 
-            exercise_map = {}
-            for row in all_resp.data:
-                name = row["exercise_name"]
-                if name not in exercise_map:
-                    exercise_map[name] = {
-                        "total_sets": 0, "total_volume": 0,
-                        "best_weight": 0, "best_volume_set": 0,
-                        "pr_count": 0, "last_date": row["log_date"],
-                    }
-                entry = exercise_map[name]
-                entry["total_sets"] += 1
-                entry["total_volume"] += (row["volume_load"] or 0)
-                entry["best_weight"] = max(entry["best_weight"], row["weight_kg"])
-                entry["best_volume_set"] = max(entry["best_volume_set"], row["volume_load"] or 0)
-                if row.get("is_pr"):
-                    entry["pr_count"] += 1
-
-            exercises = [{"exercise": name, **data} for name, data in exercise_map.items()]
             return {"exercises": exercises, "total_tracked": len(exercises)}
     except Exception as e:
         logger.error(f"Error fetching progress: {e}")
@@ -735,31 +688,38 @@ from jinja2 import Environment, FileSystemLoader
 _jinja_env = Environment(
     loader=FileSystemLoader("nutrisync_adk/static"),
     autoescape=True,
+    # Templates ship with the image; skip the per-lookup mtime check
+    auto_reload=False,
 )
 
-# PostHog config read once from environment
+# PostHog / VAPID config read once from environment
 _POSTHOG_API_KEY = os.getenv("POSTHOG_API_KEY", "")
 _POSTHOG_HOST = os.getenv("POSTHOG_HOST", "https://eu.i.posthog.com")
+_VAPID_PUBLIC_KEY = os.getenv("VAPID_PUBLIC_KEY", "")
 
 # Mount static directory
 app.mount("/static", StaticFiles(directory="nutrisync_adk/static"), name="static")
 
-# Serve index.html at root — rendered via Jinja2 to inject server-side config
-@app.get("/")
-async def serve_index():
+@functools.lru_cache(maxsize=1)
+def _render_index() -> str:
+    # Every input is process-level config, so the page is rendered once
     template = _jinja_env.get_template("index.html")
-    html = template.render(
+    return template.render(
         posthog_api_key=_POSTHOG_API_KEY,
         posthog_host=_POSTHOG_HOST,
-        vapid_public_key=os.getenv("VAPID_PUBLIC_KEY", "")
+        vapid_public_key=_VAPID_PUBLIC_KEY
     )
-    return HTMLResponse(content=html)
+
+# Serve index.html at root — rendered via Jinja2 to inject server-side config
+@app.get("/")
+async def serve_index():
+    return HTMLResponse(content=_render_index())
 
 # ── Notifications API ──────────────────────────────────────────────────────
 
 @app.get("/api/notifications/vapid-key")
 async def get_vapid_key():
-    return {"key": os.getenv("VAPID_PUBLIC_KEY", "")}
+    return {"key": _VAPID_PUBLIC_KEY}
 
 class PushSubscriptionRequest(BaseModel):
     user_id: str
@@ -793,24 +753,24 @@ async def test_trigger_push(req: Request):
         body = await req.json()
         user_id = body.get("user_id")
         if not user_id: return {"error": "Missing user_id"}
-        from .services.notifications import get_supabase, get_users_with_subscriptions, send_push_message, get_user_language
-        import json
+        from .services.notifications import get_supabase, get_user_subscriptions, send_push_messages, get_user_language, _encode_payload
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        for sub in subs:
-            if sub["user_id"] == user_id:
-                lang = get_user_language(sb, user_id)
-                if lang == "ar":
-                    title = "إشعار تجريبي! 🚀"
-                    body = "هذا إشعار تجريبي من نيوتري سينك."
-                else:
-                    title = "Test Ping! 🚀"
-                    body = "This is a test notification from NutriSync."
-                    
-                send_push_message(
-                    {"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, 
-                    json.dumps({"title": title, "body": body})
-                )
+        # Only this user's devices; language is looked up once, not per device
+        subs = get_user_subscriptions(sb, user_id)
+        if subs:
+            lang = get_user_language(sb, user_id)
+            if lang == "ar":
+                title = "إشعار تجريبي! 🚀"
+                body = "هذا إشعار تجريبي من نيوتري سينك."
+            else:
+                title = "Test Ping! 🚀"
+                body = "This is a test notification from NutriSync."
+
+            payload = _encode_payload(title, body)
+            send_push_messages([
+                ({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
+                for sub in subs
+            ])
         return {"status": "success"}
     except Exception as e:
          return {"error": str(e)}
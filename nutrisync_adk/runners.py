@@ -1,10 +1,15 @@
 import logging
-import json
 import asyncio
-import base64
+import functools
+import mimetypes
 import os
+import re
 import time
-from typing import Dict, Any, Optional
+import uuid
+from operator import itemgetter
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 from google.adk.sessions import DatabaseSessionService
 from google.adk.runners import Runner
@@ -12,12 +17,17 @@ from google.adk.agents import Agent
 from google.adk.agents.readonly_context import ReadonlyContext
 from google.genai import types
 from dotenv import load_dotenv
+import orjson
 
 from .agents.coach import coach_agent
 from .services.local_context import ContextService
-from .services.history_service import HistoryService
-from .services.analytics import capture as posthog_capture
-from .tools.utils import get_supabase_client
+from .services.history_service import HistoryService, CHAT_IMAGES_BUCKET
+from .services.analytics import (
+    capture as posthog_capture,
+    capture_batch as posthog_capture_batch,
+    is_enabled as posthog_enabled,
+)
+from .tools.utils import get_supabase_client, get_async_postgrest, b64encode
 from .user_context import current_user_id
 
 load_dotenv()
@@ -25,21 +35,52 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 # ── Prompt Template ──────────────────────────────────────────────────────────
-_PROMPT_TEMPLATES: Dict[str, str] = {}
+_PROMPTS_DIR = Path(__file__).parent / "prompts"
 
+# Bounded: `lang` comes straight from the chat request body.
+@functools.lru_cache(maxsize=8)
 def _load_prompt_template(lang: str = "en") -> str:
     """Load the system prompt template for the given language."""
-    global _PROMPT_TEMPLATES
-    if lang not in _PROMPT_TEMPLATES:
-        suffix = f"_{lang}" if lang != "en" else ""
-        prompt_path = os.path.join(os.path.dirname(__file__), 'prompts', f'system{suffix}.md')
-        try:
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                _PROMPT_TEMPLATES[lang] = f.read()
-        except Exception as e:
-            logger.warning(f"No prompt for lang={lang}, falling back to English: {e}")
-            return _load_prompt_template("en")
-    return _PROMPT_TEMPLATES[lang]
+    suffix = f"_{lang}" if lang != "en" else ""
+    try:
+        return (_PROMPTS_DIR / f"system{suffix}.md").read_text(encoding="utf-8")
+    except Exception as e:
+        if lang == "en":
+            raise
+        logger.warning(f"No prompt for lang={lang}, falling back to English: {e}")
+        return _load_prompt_template("en")
+
+
+# Placeholder used for empty active notes (shared with the InstructionProvider default)
+_NO_NOTES = "None"
+
+# Known state placeholders and the value used when a key is missing from state.
+_PROMPT_PLACEHOLDERS: Dict[str, str] = {
+    "user_profile": "{}",
+    "daily_totals": "{}",
+    "current_time": "Unknown",
+    "active_notes": _NO_NOTES,
+    "equipment_list": "None",
+    "one_rm_records": "None",
+    "split_structure": "No active split",
+    "workout_plan": "None",
+    "coach_name": "NutriSync",
+}
+
+# We do NOT use str.format() because the prompt contains literal {braces}
+# in JSON examples and other non-state contexts — only these names match.
+_PLACEHOLDER_RE = re.compile(r"\{(" + "|".join(_PROMPT_PLACEHOLDERS) + r")\}")
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_prompt_template(lang: str = "en") -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Split the prompt template once into literal chunks and placeholder names.
+
+    Returns (literals, names) where len(literals) == len(names) + 1, so a
+    render is literals[0] + value(names[0]) + literals[1] + ...
+    """
+    pieces = _PLACEHOLDER_RE.split(_load_prompt_template(lang))
+    return tuple(pieces[0::2]), tuple(pieces[1::2])
 
 
 # ── InstructionProvider ──────────────────────────────────────────────────────
@@ -47,43 +88,41 @@ async def _build_instruction(ctx: ReadonlyContext) -> str:
     """
     ADK InstructionProvider callback — called per-request with the
     request-scoped ReadonlyContext. Reads pre-populated session.state
-    values and injects them into the static prompt template.
+    values and injects them into the precompiled prompt template.
     """
-    template = _load_prompt_template(ctx.state.get("language", "en"))
-
-    # Read pre-populated state (set in process_message before run_async)
-    user_profile = ctx.state.get("user_profile", "{}")
-    daily_totals = ctx.state.get("daily_totals", "{}")
-    current_time = ctx.state.get("current_time", "Unknown")
-    active_notes = ctx.state.get("active_notes", "None")
-    equipment_list = ctx.state.get("equipment_list", "None")
-    one_rm_records = ctx.state.get("one_rm_records", "None")
-    workout_plan = ctx.state.get("workout_plan", "None")
-    split_structure = ctx.state.get("split_structure", "No active split")
-
-    # DEBUG: Log all state keys and equipment value
-    all_keys = list(ctx.state.keys()) if hasattr(ctx.state, 'keys') else "NOT A DICT"
-    logger.info(f"[_build_instruction] State keys: {all_keys}")
-    logger.info(f"[_build_instruction] equipment_list value: '{equipment_list}'")
-
-    # Manually substitute our known placeholders.
-    # We do NOT use str.format() because the prompt contains literal {braces}
-    # in JSON examples and other non-state contexts.
-    result = template
-    result = result.replace("{user_profile}", user_profile)
-    result = result.replace("{daily_totals}", daily_totals)
-    result = result.replace("{current_time}", current_time)
-    result = result.replace("{active_notes}", active_notes)
-    result = result.replace("{equipment_list}", equipment_list)
-    result = result.replace("{one_rm_records}", one_rm_records)
-    result = result.replace("{split_structure}", split_structure)
-    result = result.replace("{workout_plan}", workout_plan)
-    result = result.replace("{coach_name}", ctx.state.get("coach_name", "NutriSync"))
-
-    return result
+    state = ctx.state
+
+    # DEBUG: Log all state keys and equipment value (runs on every LLM call,
+    # so only build the key list when debug logging is on)
+    if logger.isEnabledFor(logging.DEBUG):
+        all_keys = list(state.keys()) if hasattr(state, 'keys') else "NOT A DICT"
+        logger.debug("[_build_instruction] State keys: %s", all_keys)
+        logger.debug("[_build_instruction] equipment_list value: '%s'", state.get('equipment_list', 'None'))
+
+    values = tuple(state.get(name, default) for name, default in _PROMPT_PLACEHOLDERS.items())
+    return _render_prompt(state.get("language", "en"), values)
+
+
+# Bounded LRU of rendered prompts. The provider runs once per LLM call, so a
+# turn with tool calls re-renders from identical state several times; the key
+# is the tuple of state strings themselves (str caches its own hash, and the
+# same objects come back from session.state within a turn), which makes a hit
+# O(1) instead of hashing every input with a digest.
+@functools.lru_cache(maxsize=256)
+def _render_prompt(lang: str, values: Tuple[str, ...]) -> str:
+    literals, names = _compile_prompt_template(lang)
+    by_name = dict(zip(_PROMPT_PLACEHOLDERS, values))
+
+    # Single pass: interleave literal chunks with state values
+    out = [literals[0]]
+    for name, literal in zip(names, literals[1:]):
+        out.append(by_name[name])
+        out.append(literal)
+    return "".join(out)
 
 
 # ── Database URL ─────────────────────────────────────────────────────────────
+@functools.cache
 def _get_db_url() -> str:
     """Build the asyncpg connection URL for DatabaseSessionService."""
     raw_url = os.getenv("SUPABASE_DB_URL", "")
@@ -111,15 +150,42 @@ def _create_session_service() -> DatabaseSessionService:
 
 
 # ── Runner ───────────────────────────────────────────────────────────────────
+def _dumps_pretty(value: Any) -> str:
+    """Indented JSON for prompt state (orjson; UTF-8 kept as-is, unlike json's \\u escapes)."""
+    return orjson.dumps(
+        value, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+    ).decode()
+
+
+def _truncate_repr(value: Any, limit: int = 500) -> str:
+    """Short text form of a tool response for chat_history.tool_calls.
+
+    Strings are sliced directly; dicts/lists are serialized by orjson in C and
+    cut at the byte level, instead of building the full Python str() first.
+    """
+    if isinstance(value, str):
+        return value[:limit]
+    if isinstance(value, (dict, list)):
+        try:
+            return orjson.dumps(value, default=str)[:limit].decode("utf-8", errors="ignore")
+        except TypeError:
+            pass
+    return repr(value)[:limit]
+
+
 APP_NAME = "NutriSync"
 
+_get_position_day = itemgetter("position", "day")
+
 class NutriSyncRunner:
     def __init__(self):
         self.supabase = get_supabase_client()
+        # Native-async PostgREST client for the per-message hot paths
+        self.postgrest = get_async_postgrest()
 
         # Services (still needed for context fetching and dual-write to chat_history)
-        self.history_service = HistoryService(self.supabase)
-        self.context_service = ContextService(self.supabase)
+        self.history_service = HistoryService(self.postgrest, storage=self.supabase.storage)
+        self.context_service = ContextService(self.postgrest)
 
         # ADK DatabaseSessionService — persists sessions in Supabase PostgreSQL
         self.session_service = _create_session_service()
@@ -146,32 +212,71 @@ class NutriSyncRunner:
         # Per-user asyncio locks to prevent stale session errors on rapid messages
         self._user_locks: Dict[str, asyncio.Lock] = {}
 
+        # Strong refs to in-flight background chat_history writes (asyncio keeps
+        # only weak ones); drained on shutdown by drain_pending_writes()
+        self._pending_writes: Set[asyncio.Task] = set()
+
+        # Bookkeeping switches — skip per-tool work nobody will consume
+        self._persist_tool_calls = os.getenv("PERSIST_TOOL_CALLS", "true").lower() == "true"
+        self._analytics_enabled = posthog_enabled()
+
     def _get_user_lock(self, user_id: str) -> asyncio.Lock:
         if user_id not in self._user_locks:
             self._user_locks[user_id] = asyncio.Lock()
         return self._user_locks[user_id]
 
-    async def _get_or_create_session(self, user_id: str, state: dict = None):
-        """Get existing session for user, or create a new one."""
-        session_id = f"session_{user_id}"
+    async def _store_chat_image(self, user_id: str, image_bytes: bytes, mime_type: str) -> str:
+        """Upload a chat image to the private bucket and return its object path.
+
+        History reads turn the path into a signed URL. Falls back to an inline
+        data URL if the upload fails, so the message still renders.
+        """
+        ext = mimetypes.guess_extension(mime_type) or ".jpg"
+        path = f"{user_id}/{uuid.uuid4().hex}{ext}"
         try:
-            session = await self.session_service.get_session(
+            bucket = self.supabase.storage.from_(CHAT_IMAGES_BUCKET)
+            await asyncio.to_thread(bucket.upload, path, image_bytes, {"content-type": mime_type})
+            return path
+        except Exception as e:
+            logger.error(f"Chat image upload failed for {user_id}, storing inline: {e}")
+            return f"data:{mime_type};base64,{b64encode(image_bytes).decode('ascii')}"
+
+    async def _save_user_message(self, user_id: str, text: str, image_bytes: Optional[bytes],
+                                 mime_type: Optional[str], created_at: str) -> Optional[str]:
+        image_data = None
+        if image_bytes and mime_type:
+            image_data = await self._store_chat_image(user_id, image_bytes, mime_type)
+        return await self.history_service.add_message(
+            user_id, "user", text, image_data=image_data, created_at=created_at,
+        )
+
+    async def _get_session(self, user_id: str):
+        """Look up the user's existing session. Returns None if missing or corrupt."""
+        try:
+            return await self.session_service.get_session(
                 app_name=APP_NAME,
                 user_id=user_id,
-                session_id=session_id,
+                session_id=f"session_{user_id}",
             )
         except Exception as e:
             logger.warning(f"Corrupt session detected for {user_id}, resetting: {e}")
             await self._delete_session(user_id)
-            session = None
+            return None
+
+    async def _create_session(self, user_id: str, state: dict = None):
+        """Create a fresh session for the user seeded with `state`."""
+        return await self.session_service.create_session(
+            app_name=APP_NAME,
+            user_id=user_id,
+            session_id=f"session_{user_id}",
+            state=state or {},
+        )
 
+    async def _get_or_create_session(self, user_id: str, state: dict = None):
+        """Get existing session for user, or create a new one."""
+        session = await self._get_session(user_id)
         if session is None:
-            session = await self.session_service.create_session(
-                app_name=APP_NAME,
-                user_id=user_id,
-                session_id=session_id,
-                state=state or {},
-            )
+            session = await self._create_session(user_id, state=state)
         return session
 
     async def _delete_session(self, user_id: str):
@@ -187,6 +292,12 @@ class NutriSyncRunner:
         except Exception as e:
             logger.error(f"Failed to delete session {session_id}: {e}")
 
+    async def drain_pending_writes(self):
+        """Wait for background chat_history writes to finish (graceful shutdown)."""
+        if self._pending_writes:
+            logger.info(f"Draining {len(self._pending_writes)} pending chat_history writes")
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
     async def reset_session(self, user_id: str):
         """Public method to reset a user's ADK session (admin recovery)."""
         async with self._get_user_lock(user_id):
@@ -249,12 +360,18 @@ class NutriSyncRunner:
 
     async def _process_message_impl(self, user_id: str, text: str, image_bytes: bytes = None, mime_type: str = None, language: str = "en") -> dict:
         """Internal implementation — runs under per-user lock."""
-        process_start = time.time()
+        process_start = time.perf_counter_ns()
+        received_at = datetime.now(timezone.utc).isoformat()
 
         # 1. Fetch Dynamic Context (Parallel DB queries inside ContextService)
-        ctx_start = time.time()
-        context_data = await self.context_service.get_user_context(user_id)
-        ctx_duration_ms = int((time.time() - ctx_start) * 1000)
+        #    and look up the ADK session concurrently — they are independent.
+        #    Neither coroutine raises: both fall back to empty/None on error.
+        ctx_start = time.perf_counter_ns()
+        async with asyncio.TaskGroup() as tg:
+            t_context = tg.create_task(self.context_service.get_user_context(user_id))
+            t_session = tg.create_task(self._get_session(user_id))
+        context_data, session = t_context.result(), t_session.result()
+        ctx_duration_ms = (time.perf_counter_ns() - ctx_start) // 1_000_000
 
         # 2. Prepare session state with fresh context
         # Extract coach_name from profile for prompt substitution
@@ -264,28 +381,33 @@ class NutriSyncRunner:
         state_updates = {
             "language": language,
             "coach_name": coach_name,
-            "user_profile": json.dumps(profile_data, indent=2, default=str),
-            "daily_totals": json.dumps(context_data.get("daily_totals", {}), indent=2, default=str),
+            "user_profile": _dumps_pretty(profile_data),
+            "daily_totals": _dumps_pretty(context_data.get("daily_totals", {})),
             "current_time": context_data.get("current_time", "Unknown"),
             "active_notes": self._format_notes(context_data.get("active_notes", [])),
             "equipment_list": ", ".join(context_data.get("equipment_list", [])) or "None specified",
-            "one_rm_records": json.dumps(context_data.get("one_rm_records", []), indent=2, default=str) if context_data.get("one_rm_records") else "None recorded",
+            "one_rm_records": _dumps_pretty(context_data.get("one_rm_records", [])) if context_data.get("one_rm_records") else "None recorded",
             "split_structure": self._format_split_structure(context_data.get("split_structure", [])),
-            "workout_plan": json.dumps(context_data.get("workout_plan", []), indent=2, default=str) if context_data.get("workout_plan") else "No plan generated yet",
+            "workout_plan": _dumps_pretty(context_data.get("workout_plan", [])) if context_data.get("workout_plan") else "No plan generated yet",
         }
-        logger.info(f"Equipment context for {user_id}: {state_updates['equipment_list']}")
-        logger.info(f"1RM records for {user_id}: {state_updates['one_rm_records'][:100]}")
-        logger.info(f"Workout plan for {user_id}: {state_updates['workout_plan'][:100]}")
+        # Per-message context dumps: debug level, formatted only if emitted
+        logger.debug("Equipment context for %s: %s", user_id, state_updates['equipment_list'])
+        logger.debug("1RM records for %s: %.100s", user_id, state_updates['one_rm_records'])
+        logger.debug("Workout plan for %s: %.100s", user_id, state_updates['workout_plan'])
 
-        # 3. Get or create session (state_updates applied via state_delta in run_async)
-        session = await self._get_or_create_session(user_id, state=state_updates)
+        # 3. Create the session if the lookup found none
+        #    (state_updates applied via state_delta in run_async)
+        if session is None:
+            session = await self._create_session(user_id, state=state_updates)
 
         # 4. Dual-write: Save User Message to chat_history table (for frontend)
-        img_b64 = None
-        if image_bytes and mime_type:
-            img_b64 = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
-
-        await self.history_service.add_message(user_id, "user", text, image_data=img_b64)
+        # Overlaps the agent run, so the image upload and INSERT stay off the
+        # critical path; awaited before the reply is persisted (step 7).
+        user_write = asyncio.create_task(self._save_user_message(
+            user_id, text, image_bytes, mime_type, created_at=received_at,
+        ))
+        self._pending_writes.add(user_write)
+        user_write.add_done_callback(self._pending_writes.discard)
 
         # 5. Build message parts
         parts = [types.Part(text=text)] if text else []
@@ -299,11 +421,15 @@ class NutriSyncRunner:
         user_msg = types.Content(role='user', parts=parts)
 
         # 6. Run agent with reused runner + session
-        final_response_text = ""
+        # Final text is accumulated part-by-part and joined once at the end,
+        # so multi-part final responses are not truncated to parts[0].
+        text_buf: List[str] = []
         collected_tool_calls = []
         chart_data = None
         tool_call_count = 0
         tool_names_used = []
+        # PostHog events are buffered for the turn and flushed once at the end
+        analytics_events: List[Tuple[str, dict]] = []
 
         async for event in self.runner.run_async(
             user_id=user_id,
@@ -311,46 +437,64 @@ class NutriSyncRunner:
             new_message=user_msg,
             state_delta=state_updates,
         ):
-            # Capture tool calls from events for logging
-            if hasattr(event, 'content') and event.content:
-                for part in event.content.parts:
-                    if hasattr(part, 'function_call') and part.function_call:
-                        tool_call_count += 1
-                        tool_names_used.append(part.function_call.name)
+            # Capture tool calls from events for logging. Event.content and the
+            # Part fields are plain pydantic attributes defaulting to None.
+            # No early break on the final response: ADK appends the turn's
+            # events to the session while the generator is still running.
+            content = event.content
+            if content is None or not content.parts:
+                continue
+            is_final = event.is_final_response()
+            for part in content.parts:
+                if is_final and part.text:
+                    text_buf.append(part.text)
+
+                fc = part.function_call
+                if fc is not None:
+                    tool_call_count += 1
+                    if self._persist_tool_calls:
                         collected_tool_calls.append({
-                            "name": part.function_call.name,
-                            "args": dict(part.function_call.args) if part.function_call.args else {}
-                        })
-                        # ── PostHog: Track each AI tool invocation ──
-                        posthog_capture(user_id, "ai_tool_called", {
-                            "tool_name": part.function_call.name,
-                            "has_args": bool(part.function_call.args),
+                            "name": fc.name,
+                            "args": dict(fc.args) if fc.args else {}
                         })
-                    if hasattr(part, 'function_response') and part.function_response:
-                        response_val = part.function_response.response
-                        tool_name = part.function_response.name
-
-                        # Chart Detection
-                        if tool_name == "draw_chart" and isinstance(response_val, dict) and response_val.get("success"):
-                            chart_data = {
-                                "image_base64": response_val.get("image_base64"),
-                                "caption": response_val.get("caption", "")
-                            }
-
-                        # Log response (truncate unless chart/critical)
+                    # ── PostHog: Track each AI tool invocation ──
+                    if self._analytics_enabled:
+                        tool_names_used.append(fc.name)
+                        analytics_events.append(("ai_tool_called", {
+                            "tool_name": fc.name,
+                            "has_args": bool(fc.args),
+                        }))
+                fr = part.function_response
+                if fr is not None:
+                    response_val = fr.response
+                    tool_name = fr.name
+
+                    # Chart Detection
+                    if tool_name == "draw_chart" and isinstance(response_val, dict) and response_val.get("success"):
+                        chart_data = {
+                            "image_base64": response_val.get("image_base64"),
+                            "caption": response_val.get("caption", "")
+                        }
+
+                    # Log response (truncate unless chart/critical)
+                    if self._persist_tool_calls:
                         log_resp = response_val
                         if "draw_chart" not in tool_name:
-                            log_resp = str(response_val)[:500]
+                            log_resp = _truncate_repr(response_val)
 
                         collected_tool_calls.append({
                             "name": tool_name,
                             "response": log_resp
                         })
 
-            if event.is_final_response():
-                final_response_text = event.content.parts[0].text
+        final_response_text = "".join(text_buf)
 
         # 7. Dual-write: Save Model Response to chat_history table (for frontend)
+        #    Awaited: its id is returned as message_id for feedback.
+        #    The user row must be committed first: /api/history?after= polls
+        #    page on created_at, and a poll that has already seen the reply
+        #    would skip a user row landing after it. Normally done by now.
+        await user_write
         model_message_id = None
         if final_response_text:
             model_message_id = await self.history_service.add_message(
@@ -361,16 +505,18 @@ class NutriSyncRunner:
             )
 
         # ── PostHog: Track full agent run metrics ──
-        total_duration_ms = int((time.time() - process_start) * 1000)
-        posthog_capture(user_id, "ai_agent_run_completed", {
-            "context_load_ms": ctx_duration_ms,
-            "total_duration_ms": total_duration_ms,
-            "tool_call_count": tool_call_count,
-            "tools_used": tool_names_used,
-            "has_image_input": image_bytes is not None,
-            "has_chart_output": chart_data is not None,
-            "response_length": len(final_response_text),
-        })
+        if self._analytics_enabled:
+            total_duration_ms = (time.perf_counter_ns() - process_start) // 1_000_000
+            analytics_events.append(("ai_agent_run_completed", {
+                "context_load_ms": ctx_duration_ms,
+                "total_duration_ms": total_duration_ms,
+                "tool_call_count": tool_call_count,
+                "tools_used": tool_names_used,
+                "has_image_input": image_bytes is not None,
+                "has_chart_output": chart_data is not None,
+                "response_length": len(final_response_text),
+            }))
+            posthog_capture_batch(user_id, analytics_events)
 
         return {
             "text": final_response_text,
@@ -382,8 +528,8 @@ class NutriSyncRunner:
     def _format_notes(notes: list) -> str:
         """Format active notes list into a string for the prompt."""
         if not notes:
-            return "None"
-        return "\n".join(f"- {note}" for note in notes)
+            return _NO_NOTES
+        return "\n".join(["- " + note for note in notes])
 
     @staticmethod
     def _format_split_structure(split_items: list) -> str:
@@ -398,8 +544,7 @@ class NutriSyncRunner:
         """
         if not split_items:
             return "No active split"
-        split_name = split_items[0].get("split_name", "Custom Split") if split_items else ""
+        split_name = split_items[0].get("split_name", "Custom Split")
         lines = [f"Split: {split_name}"]
-        for item in split_items:
-            lines.append(f"{item['position']}. {item['day']}")
+        lines.extend(f"{pos}. {day}" for pos, day in map(_get_position_day, split_items))
         return "\n".join(lines)
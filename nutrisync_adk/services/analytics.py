@@ -14,7 +14,9 @@ Configuration:
 
 import logging
 import os
-from typing import Optional
+import queue
+import threading
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -57,6 +59,70 @@ def _get_client():
     return _posthog_client
 
 
+def is_enabled() -> bool:
+    """Return True if a PostHog client is configured and events will be sent."""
+    return _get_client() is not None
+
+
+# ── Background Event Queue ───────────────────────────────────────────────────
+# capture() only enqueues; a single daemon worker hands events to the SDK in
+# batches so lock/JSON work in client.capture never runs on the request path.
+# A thread-safe queue.Queue is used (not asyncio.Queue) because capture() is
+# also called from sync code running in worker threads.
+_QUEUE_MAXSIZE = 10_000
+_BATCH_SIZE = 100
+_FLUSH_INTERVAL_S = 0.5
+
+_event_queue: "queue.Queue[Tuple[str, str, dict]]" = queue.Queue(maxsize=_QUEUE_MAXSIZE)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def _drain_worker():
+    """Pull events off the queue and send them to PostHog in batches."""
+    while True:
+        batch = []
+        try:
+            batch.append(_event_queue.get(timeout=_FLUSH_INTERVAL_S))
+            while len(batch) < _BATCH_SIZE:
+                batch.append(_event_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if batch:
+            client = _get_client()
+            for user_id, event, properties in batch:
+                try:
+                    client.capture(
+                        distinct_id=user_id,
+                        event=event,
+                        properties=properties,
+                    )
+                except Exception as e:
+                    # Never let analytics break the app
+                    logger.error(f"PostHog capture failed for {event}: {e}")
+        elif _stop.is_set():
+            return
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_drain_worker, name="posthog-drain", daemon=True)
+            _worker.start()
+
+
+def _enqueue(user_id: str, event: str, properties: Optional[dict]):
+    try:
+        _event_queue.put_nowait((user_id, event, properties or {}))
+    except queue.Full:
+        logger.warning(f"PostHog queue full — dropping event {event}")
+
+
 def capture(
     user_id: str,
     event: str,
@@ -65,24 +131,39 @@ def capture(
     """
     Capture a server-side event in PostHog.
 
+    Non-blocking: the event is queued and sent by the background worker.
+
     Args:
         user_id: The Supabase user UUID (distinct_id).
         event: Event name, e.g. 'api_chat_processed'.
         properties: Optional dict of event properties.
     """
-    client = _get_client()
-    if client is None:
+    if _get_client() is None:
         return
 
-    try:
-        client.capture(
-            distinct_id=user_id,
-            event=event,
-            properties=properties or {},
-        )
-    except Exception as e:
-        # Never let analytics break the app
-        logger.error(f"PostHog capture failed: {e}")
+    _ensure_worker()
+    _enqueue(user_id, event, properties)
+
+
+def capture_batch(
+    user_id: str,
+    events: List[Tuple[str, dict]],
+):
+    """
+    Capture several server-side events for one user in a single call.
+
+    Non-blocking, like capture(); events keep their emission order.
+
+    Args:
+        user_id: The Supabase user UUID (distinct_id).
+        events: List of (event_name, properties) tuples, in emission order.
+    """
+    if _get_client() is None:
+        return
+
+    _ensure_worker()
+    for event, properties in events:
+        _enqueue(user_id, event, properties)
 
 
 def identify(
@@ -110,7 +191,11 @@ def identify(
 
 
 def shutdown():
-    """Flush pending events and shut down the PostHog client."""
+    """Drain queued events, then flush and shut down the PostHog client."""
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=10)
+
     client = _get_client()
     if client is not None:
         try:
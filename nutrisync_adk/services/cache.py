@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache whose entries also expire after `ttl` seconds.
+
+    Backed by an OrderedDict (hash map + linked list), so get/set/pop are O(1).
+    Guarded by a threading.Lock rather than an asyncio.Lock because it is
+    touched both from the event loop and from sync tool functions.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_sub(self, key: Hashable, sub_key: Hashable) -> Optional[Any]:
+        """
+        Look up one result inside a per-key dict of results (see set_sub).
+
+        Each sub-entry carries its own expiry, so a result is never served
+        past `ttl` just because other queries kept the outer entry alive.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            expires_at, subs = entry
+            if expires_at < now:
+                del self._data[key]
+                return None
+            hit = subs.get(sub_key)
+            if hit is None:
+                return None
+            sub_expires_at, value = hit
+            if sub_expires_at < now:
+                del subs[sub_key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set_sub(self, key: Hashable, sub_key: Hashable, value: Any):
+        """Store one result under key's dict of results; pop(key) drops them all."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            subs = {}
+            if entry is not None and entry[0] >= now:
+                subs = {k: v for k, v in entry[1].items() if v[0] >= now}
+            subs[sub_key] = (now + self.ttl, value)
+            self._data[key] = (now + self.ttl, subs)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# ── Per-user chat context ────────────────────────────────────────────────────
+# "core": profile, today's goals, active notes — changes with every log.
+# "training": equipment, 1RMs, workout plan, split — changes on human timescales.
+# Writers invalidate the group they touch, so the TTL only bounds staleness
+# from writes made outside this process.
+USER_CONTEXT_CORE = "core"
+USER_CONTEXT_TRAINING = "training"
+
+user_core_context_cache = TTLCache(maxsize=10_000, ttl=30)
+user_training_context_cache = TTLCache(maxsize=10_000, ttl=300)
+
+_USER_CONTEXT_CACHES = {
+    USER_CONTEXT_CORE: user_core_context_cache,
+    USER_CONTEXT_TRAINING: user_training_context_cache,
+}
+
+
+def invalidate_user_context(user_id: Optional[str], kind: Optional[str] = None):
+    """Drop a user's cached chat context after a write that changes it.
+
+    kind: USER_CONTEXT_CORE or USER_CONTEXT_TRAINING; None drops both.
+    """
+    if not user_id:
+        return
+    if kind is None:
+        for cache in _USER_CONTEXT_CACHES.values():
+            cache.pop(user_id)
+    else:
+        _USER_CONTEXT_CACHES[kind].pop(user_id)
+
+
+# ── Per-user log history queries (tools.utils.query_user_logs) ───────────────
+# One entry per (user_id, table) holding {query args: rows} via get_sub/set_sub,
+# so a write to a table drops every cached window for that user in one pop
+# while each window still expires on its own.
+user_log_query_cache = TTLCache(
+    maxsize=1024, ttl=float(os.getenv("NUTRISYNC_QUERY_TTL", "45"))
+)
+
+
+def invalidate_user_logs(user_id: Optional[str], table_name: str):
+    """Drop a user's cached history queries for a log table after a write to it."""
+    if not user_id:
+        return
+    user_log_query_cache.pop((user_id, table_name))
+
+
+# ── Next scheduled workout (get_next_workout RPC) ────────────────────────────
+# Only moves when a logged workout advances the split or the split is
+# replaced; both writers pop the user's entry.
+next_workout_cache = TTLCache(maxsize=10_000, ttl=300)
+
+
+# ── Active-split workout plan (get_workout_plan tool) ────────────────────────
+# One entry per user holding {(day filter, limit, offset): result} (get_sub/
+# set_sub, so each result keeps its own expiry). Rewritten only
+# by generate_workout_plan or a split change on profile save; both pop it.
+workout_plan_cache = TTLCache(maxsize=10_000, ttl=300)
+
+
+# ── Progressive overload summaries (get_progressive_overload_summary) ────────
+# One entry per user holding {(exercise_name, weeks): result} via get_sub/
+# set_sub, each result with its own expiry. Every exercise_logs writer
+# (log_exercise_sets, the live coach endpoint) pops it.
+overload_summary_cache = TTLCache(maxsize=1024, ttl=60)
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Direct Postgres access for the per-message read paths. PostgREST wraps every
+# call in its own HTTPS request; a warm asyncpg pool skips that hop entirely.
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+def _get_dsn() -> str:
+    """SUPABASE_DB_URL as a plain postgresql:// DSN (asyncpg has no +driver scheme)."""
+    raw_url = os.getenv("SUPABASE_DB_URL", "")
+    if not raw_url:
+        raise ValueError("SUPABASE_DB_URL must be set in .env")
+    return raw_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def get_pg_pool() -> asyncpg.Pool:
+    """Lazily create the process-wide asyncpg pool."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    _get_dsn(),
+                    min_size=2,
+                    max_size=10,
+                    max_inactive_connection_lifetime=300,
+                    command_timeout=30,
+                    # Same reason as the ADK session service: Supavisor's
+                    # transaction pooler can't hold prepared statements.
+                    statement_cache_size=0,
+                )
+                logger.info("asyncpg pool created")
+    return _pool
+
+
+async def close_pg_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
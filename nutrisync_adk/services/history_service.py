@@ -1,48 +1,90 @@
-import logging
 import asyncio
+import logging
 from typing import List, Dict, Any, Optional
-from supabase import Client
 from datetime import timedelta
-from ..tools.utils import get_current_functional_time
+from ..tools.utils import AsyncPostgrest, get_current_functional_time
 
 logger = logging.getLogger(__name__)
 
+# Columns the chat UI renders (image_data/tool_calls carry user images and charts)
+_CHAT_HISTORY_COLUMNS = "id,role,content,tool_calls,image_data,created_at"
+
+# Private bucket for user chat images. chat_history.image_data stores the
+# object path (<user_id>/<uuid>.<ext>); history reads swap it for a
+# short-lived signed URL. Rows written while the bucket was public hold a
+# public URL, which is mapped back to its path.
+CHAT_IMAGES_BUCKET = "chat-images"
+CHAT_IMAGE_URL_TTL = 3600
+_LEGACY_PUBLIC_MARKER = f"/object/public/{CHAT_IMAGES_BUCKET}/"
+
 class HistoryService:
     """
     Service for fetching historical data (chat, nutrition, workouts).
     Implements generic time-series fetching to stay DRY.
     """
-    
-    def __init__(self, supabase: Client):
-        self.supabase = supabase
+
+    def __init__(self, postgrest: AsyncPostgrest, storage: Any = None):
+        self.postgrest = postgrest
+        # supabase-py StorageClient, used to sign chat image URLs
+        self.storage = storage
 
     async def get_recent_chat_history(self, user_id: str, limit: int = 20, after: Optional[str] = None) -> List[Dict[str, Any]]:
         """Fetches recent chat messages for context window."""
-        return await asyncio.to_thread(self._get_recent_chat_history_sync, user_id, limit, after)
-
-    def _get_recent_chat_history_sync(self, user_id: str, limit: int, after: Optional[str] = None) -> List[Dict[str, Any]]:
         try:
-            query = self.supabase.table("chat_history") \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .order("created_at", desc=True) \
-                .limit(limit)
-            
+            params = {
+                "select": _CHAT_HISTORY_COLUMNS,
+                "user_id": f"eq.{user_id}",
+                "limit": limit,
+            }
             if after:
-                query = query.gt("created_at", after)
-
-            res = query.execute()
-            # Reverse for chronological order
-            return res.data[::-1] if res.data else []
+                # Incremental sync: the DB returns the next rows after the
+                # cursor already in chronological order.
+                params["created_at"] = f"gt.{after}"
+                params["order"] = "created_at.asc"
+                rows = await self.postgrest.select("chat_history", params)
+            else:
+                # Latest N needs DESC + LIMIT; reverse for chronological order
+                params["order"] = "created_at.desc"
+                rows = await self.postgrest.select("chat_history", params)
+                rows.reverse()
+            await self._sign_chat_images(rows)
+            return rows
         except Exception as e:
             logger.error(f"Error fetching chat history: {e}")
             return []
 
-    async def add_message(self, user_id: str, role: str, content: str, tool_calls: Optional[Dict] = None, image_data: Optional[str] = None) -> Optional[str]:
-        """Adds a message to history. Returns the inserted message's UUID."""
-        return await asyncio.to_thread(self._add_message_sync, user_id, role, content, tool_calls, image_data)
+    async def _sign_chat_images(self, rows: List[Dict[str, Any]]):
+        """Replace stored image object paths with signed URLs, in one Storage call."""
+        pending = {}
+        for row in rows:
+            image = row.get("image_data")
+            if not image or image.startswith("data:"):
+                continue
+            if _LEGACY_PUBLIC_MARKER in image:
+                image = image.split(_LEGACY_PUBLIC_MARKER, 1)[1].split("?", 1)[0]
+            pending.setdefault(image, []).append(row)
+        if not pending or self.storage is None:
+            return
 
-    def _add_message_sync(self, user_id: str, role: str, content: str, tool_calls: Optional[Dict], image_data: Optional[str]) -> Optional[str]:
+        try:
+            bucket = self.storage.from_(CHAT_IMAGES_BUCKET)
+            signed = await asyncio.to_thread(bucket.create_signed_urls, list(pending), CHAT_IMAGE_URL_TTL)
+        except Exception as e:
+            logger.error(f"Error signing chat image URLs: {e}")
+            signed = []
+
+        urls = {item["path"]: item.get("signedURL") for item in signed if not item.get("error")}
+        for path, path_rows in pending.items():
+            for row in path_rows:
+                # Unsignable (deleted object, Storage down): render without the image
+                row["image_data"] = urls.get(path)
+
+    async def add_message(self, user_id: str, role: str, content: str, tool_calls: Optional[Dict] = None, image_data: Optional[str] = None, created_at: Optional[str] = None) -> Optional[str]:
+        """Adds a message to history. Returns the inserted message's UUID.
+
+        Pass created_at to pin the row's timestamp (e.g. when the insert is
+        issued concurrently with later messages); defaults to the DB's now().
+        """
         try:
             data = {
                 "user_id": user_id,
@@ -51,9 +93,11 @@ class HistoryService:
                 "tool_calls": tool_calls,
                 "image_data": image_data
             }
-            res = self.supabase.table("chat_history").insert(data).execute()
-            if res.data and len(res.data) > 0:
-                return res.data[0].get("id")
+            if created_at:
+                data["created_at"] = created_at
+            rows = await self.postgrest.insert("chat_history", data)
+            if rows:
+                return rows[0].get("id")
             return None
         except Exception as e:
             logger.error(f"Error adding message to history: {e}")
@@ -68,22 +112,17 @@ class HistoryService:
         return await self._fetch_time_series(user_id, "workout_logs", days)
 
     async def _fetch_time_series(self, user_id: str, table_name: str, days: int, limit: int = 50) -> List[Dict[str, Any]]:
-        return await asyncio.to_thread(self._fetch_time_series_sync, user_id, table_name, days, limit)
-
-    def _fetch_time_series_sync(self, user_id: str, table_name: str, days: int, limit: int) -> List[Dict[str, Any]]:
         try:
             now = get_current_functional_time()
             lookback = now - timedelta(days=days)
-            
-            res = self.supabase.table(table_name) \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .gte("created_at", lookback.isoformat()) \
-                .order("created_at", desc=True) \
-                .limit(limit) \
-                .execute()
-            
-            return res.data if res.data else []
+
+            return await self.postgrest.select(table_name, {
+                "select": "*",
+                "user_id": f"eq.{user_id}",
+                "created_at": f"gte.{lookback.isoformat()}",
+                "order": "created_at.desc",
+                "limit": limit,
+            })
         except Exception as e:
             logger.error(f"Error fetching {table_name} history: {e}")
             return []
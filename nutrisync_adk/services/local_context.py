@@ -1,80 +1,85 @@
 import logging
-import asyncio
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from supabase import Client
+import time
+from datetime import date
+from typing import Awaitable, Dict, Any, List, Optional, Tuple
 
-from ..tools.utils import get_today_date_str, get_current_functional_time, CAIRO_TZ
+import orjson
+
+from ..tools.utils import AsyncPostgrest, get_today_date_str, get_current_functional_time
+from .cache import user_core_context_cache, user_training_context_cache
+from .db_pool import get_pg_pool
 
 logger = logging.getLogger(__name__)
 
+# (epoch minute, formatted Cairo time). The prompt only shows minute precision
+# and Cairo's UTC offset is whole hours, so one strftime per minute suffices.
+_current_time_cache: Tuple[int, str] = (-1, "")
+
+
+def _current_time_str() -> str:
+    global _current_time_cache
+    minute = int(time.time()) // 60
+    if _current_time_cache[0] != minute:
+        now = get_current_functional_time()
+        _current_time_cache = (minute, now.strftime('%Y-%m-%d %H:%M (%A)'))
+    return _current_time_cache[1]
+
+
 class ContextService:
     """
     Service for fetching and aggregating user context data.
     """
     
-    def __init__(self, supabase: Client):
-        self.supabase = supabase
+    def __init__(self, postgrest: AsyncPostgrest):
+        self.postgrest = postgrest
 
     async def get_user_context(self, user_id: str) -> Dict[str, Any]:
         """
-        Fetches all necessary context for the user in parallel:
+        Fetches all necessary context for the user:
         - User Profile
         - Daily Goals (Totals)
         - Active Notes
         - User Equipment
         - 1RM Records
         - Active Workout Plan
+
+        Each half comes from one RPC and is cached per user with its own TTL
+        (see services/cache.py): "core" (profile/goals/notes, get_user_context)
+        and "training" (equipment, 1RMs, plan, split, get_user_training_context).
+        Only expired groups are refetched, in one statement; tools and endpoints
+        that write these tables invalidate the matching group. current_time is
+        always computed fresh.
         """
         try:
-            # Plan parallel execution
-            task_profile = self._fetch_user_profile(user_id)
-            task_goals = self._fetch_daily_goals(user_id)
-            task_notes = self._fetch_active_notes(user_id)
-            task_equipment = self._fetch_user_equipment(user_id)
-            task_1rm = self._fetch_1rm_records(user_id)
-            task_plan = self._fetch_workout_plan(user_id)
-            task_split = self._fetch_split_structure(user_id)
-
-            # Execute all in parallel
-            results = await asyncio.gather(
-                task_profile, task_goals, task_notes, task_equipment,
-                task_1rm, task_plan, task_split,
-                return_exceptions=True,
-            )
-            
-            # Unpack results handling exceptions
-            profile = results[0] if not isinstance(results[0], Exception) else {}
-            daily_totals = results[1] if not isinstance(results[1], Exception) else self._get_empty_goals()
-            active_notes = results[2] if not isinstance(results[2], Exception) else []
-            equipment_list = results[3] if not isinstance(results[3], Exception) else []
-            one_rm_records = results[4] if not isinstance(results[4], Exception) else []
-            workout_plan = results[5] if not isinstance(results[5], Exception) else []
-            split_structure = results[6] if not isinstance(results[6], Exception) else []
-            
-            if isinstance(results[0], Exception): logger.error(f"Error fetching profile: {results[0]}")
-            if isinstance(results[1], Exception): logger.error(f"Error fetching goals: {results[1]}")
-            if isinstance(results[2], Exception): logger.error(f"Error fetching notes: {results[2]}")
-            if isinstance(results[3], Exception): logger.error(f"Error fetching equipment: {results[3]}")
-            if isinstance(results[4], Exception): logger.error(f"Error fetching 1RM records: {results[4]}")
-            if isinstance(results[5], Exception): logger.error(f"Error fetching workout plan: {results[5]}")
-            if isinstance(results[6], Exception): logger.error(f"Error fetching split structure: {results[6]}")
-
-            # Current Time String
-            now = get_current_functional_time()
-            current_time_str = now.strftime('%Y-%m-%d %H:%M (%A)')
+            today = get_today_date_str()
+            cached_core = user_core_context_cache.get(user_id)
+            # Core holds today's goals, so an entry from an earlier functional day is stale
+            core = cached_core[1] if cached_core is not None and cached_core[0] == today else None
+            training = user_training_context_cache.get(user_id)
+
+            if core is None or training is None:
+                # Whichever halves are missing come back from one statement on
+                # one pooled connection: a single round-trip either way.
+                fetched, ok = await self._guarded(
+                    self._fetch_context_groups(user_id, today, core is None, training is None),
+                    {}, "user context",
+                )
+                # Don't pin fallback results (a failed fetch) for the whole TTL
+                if core is None:
+                    core = self._parse_core(fetched.get("core"))
+                    if ok:
+                        user_core_context_cache.set(user_id, (today, core))
+                if training is None:
+                    training = self._parse_training(fetched.get("training"))
+                    if ok:
+                        user_training_context_cache.set(user_id, training)
 
             return {
                 "user_id": user_id,
-                "profile": profile,
-                "daily_totals": daily_totals,
-                "current_time": current_time_str,
-                "active_notes": active_notes,
-                "equipment_list": equipment_list,
-                "one_rm_records": one_rm_records,
-                "workout_plan": workout_plan,
-                "split_structure": split_structure,
+                **core,
+                **training,
+                "current_time": _current_time_str(),
             }
 
         except Exception as e:
@@ -83,7 +88,7 @@ class ContextService:
                 "user_id": user_id,
                 "profile": {},
                 "daily_totals": self._get_empty_goals(),
-                "current_time": "Unknown",
+                "current_time": _current_time_str(),
                 "active_notes": [],
                 "equipment_list": [],
                 "one_rm_records": [],
@@ -91,30 +96,63 @@ class ContextService:
                 "split_structure": [],
             }
 
-    async def _fetch_user_profile(self, user_id: str) -> Dict[str, Any]:
-        # Using async mechanism of supabase-py if available, else standard blocking in thread if needed
-        # NOTE: supabase-func calls are blocking HTTP requests. To make them truly async in python
-        # without native async library support, we wrap in to_thread if they block.
-        # However, supabase-py's postgrest might be synchronous.
-        # For true parallelism with synchronous IO, we use asyncio.to_thread
-        return await asyncio.to_thread(self._fetch_user_profile_sync, user_id)
-
-    def _fetch_user_profile_sync(self, user_id: str) -> Dict[str, Any]:
-        # NEW: Filter by user_id, not id=1
-        res = self.supabase.table("user_profile").select("*").eq("user_id", user_id).execute()
-        return res.data[0] if res.data else {}
-
-    async def _fetch_daily_goals(self, user_id: str) -> Dict[str, Any]:
-        return await asyncio.to_thread(self._fetch_daily_goals_sync, user_id)
-
-    def _fetch_daily_goals_sync(self, user_id: str) -> Dict[str, Any]:
-        today_str = get_today_date_str()
-        # NEW: Filter by user_id AND goal_date
-        res = self.supabase.table("daily_goals").select("*").eq("user_id", user_id).eq("goal_date", today_str).execute()
-        
+    async def _fetch_context_groups(self, user_id: str, today: str,
+                                    need_core: bool, need_training: bool) -> Dict[str, Any]:
+        """Run the needed context RPCs as columns of one SELECT; returns decoded json per group."""
+        columns, args = [], [user_id]
+        if need_core:
+            args.append(date.fromisoformat(today))
+            columns.append("public.get_user_context($1::uuid, $2::date) AS core")
+        if need_training:
+            columns.append("public.get_user_training_context($1::uuid) AS training")
+
+        pool = await get_pg_pool()
+        row = await pool.fetchrow(f"SELECT {', '.join(columns)}", *args)
+
+        if need_core and logger.isEnabledFor(logging.DEBUG):
+            await self._log_query_plan("get_user_context", {"p_user_id": user_id, "p_today": today})
+        return {key: orjson.loads(raw) for key, raw in row.items() if raw is not None}
+
+    @staticmethod
+    async def _guarded(coro: Awaitable[Any], default: Any, label: str) -> Tuple[Any, bool]:
+        """Await a fetch; on failure log it and return (default, False)."""
+        try:
+            return await coro, True
+        except Exception as e:
+            logger.error(f"Error fetching {label}: {e}")
+            return default, False
+
+    def _parse_core(self, data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Profile, today's goals and active notes from get_user_context."""
+        data = data or {}
+        return {
+            "profile": data.get("profile") or {},
+            "daily_totals": self._goals_from_row(data.get("goals")),
+            "active_notes": self._format_active_notes(data.get("notes") or []),
+        }
+
+    @staticmethod
+    def _parse_training(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Equipment, 1RMs, plan and split from get_user_training_context."""
+        data = data or {}
+        return {
+            "equipment_list": data.get("equipment") or [],
+            "one_rm_records": data.get("one_rm_records") or [],
+            "workout_plan": data.get("workout_plan") or [],
+            "split_structure": data.get("split_structure") or [],
+        }
+
+    async def _log_query_plan(self, fn: str, params: Dict[str, Any]):
+        """Debug mode only: log EXPLAIN ANALYZE for an RPC to catch seq scans/regressions."""
+        try:
+            plan = await self.postgrest.explain_rpc(fn, params)
+            logger.debug(f"Query plan for {fn}:\n{plan}")
+        except Exception as e:
+            logger.debug(f"Could not fetch query plan for {fn}: {e}")
+
+    def _goals_from_row(self, row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         data = self._get_empty_goals()
-        if res.data:
-            row = res.data[0]
+        if row:
             data.update({
                 "calories": row.get("calories_consumed", 0),
                 "workouts": row.get("workouts_completed", 0),
@@ -123,107 +161,12 @@ class ContextService:
             })
         return data
 
-    async def _fetch_active_notes(self, user_id: str) -> List[str]:
-        return await asyncio.to_thread(self._fetch_active_notes_sync, user_id)
-
-    def _fetch_active_notes_sync(self, user_id: str) -> List[str]:
-        # NEW: Filter by user_id
-        res = self.supabase.table("persistent_context").select("note_content, created_at").eq("user_id", user_id).eq("is_active", True).execute()
-        notes = []
-        if res.data:
-            for n in res.data:
-                content = n['note_content']
-                created_at = n.get('created_at')
-                time_suffix = ""
-                if created_at:
-                    try:
-                        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                        dt_cairo = dt.astimezone(CAIRO_TZ)
-                        time_suffix = f" (Added: {dt_cairo.strftime('%Y-%m-%d %H:%M')})"
-                    except Exception:
-                        pass
-                notes.append(f"{content}{time_suffix}")
-        return notes
-
-    async def _fetch_user_equipment(self, user_id: str) -> List[str]:
-        return await asyncio.to_thread(self._fetch_user_equipment_sync, user_id)
-
-    def _fetch_user_equipment_sync(self, user_id: str) -> List[str]:
-        res = self.supabase.table("user_equipment").select("equipment_name").eq("user_id", user_id).execute()
-        if res.data:
-            return [row["equipment_name"] for row in res.data]
-        return []
-
-    # ── 1RM Records ──────────────────────────────────────────────────────
-    async def _fetch_1rm_records(self, user_id: str) -> List[Dict[str, Any]]:
-        return await asyncio.to_thread(self._fetch_1rm_records_sync, user_id)
-
-    def _fetch_1rm_records_sync(self, user_id: str) -> List[Dict[str, Any]]:
-        res = (self.supabase.table("user_1rm_records")
-               .select("exercise_name, weight_kg")
-               .eq("user_id", user_id)
-               .execute())
-        if res.data:
-            return [{"exercise": r["exercise_name"], "weight_kg": r["weight_kg"]} for r in res.data]
-        return []
-
-    # ── Active Workout Plan ──────────────────────────────────────────────
-    async def _fetch_workout_plan(self, user_id: str) -> List[Dict[str, Any]]:
-        return await asyncio.to_thread(self._fetch_workout_plan_sync, user_id)
-
-    def _fetch_workout_plan_sync(self, user_id: str) -> List[Dict[str, Any]]:
-        # First get the active split
-        split_res = (self.supabase.table("workout_splits")
-                     .select("id")
-                     .eq("user_id", user_id)
-                     .eq("is_active", True)
-                     .limit(1)
-                     .execute())
-        if not split_res.data:
-            return []
-
-        split_id = split_res.data[0]["id"]
-
-        res = (self.supabase.table("workout_plan_exercises")
-               .select("split_day_name, exercise_order, exercise_name, exercise_type, "
-                       "target_muscles, sets, rep_range_low, rep_range_high, "
-                       "load_percentage, rest_seconds, notes")
-               .eq("user_id", user_id)
-               .eq("split_id", split_id)
-               .order("split_day_name")
-               .order("exercise_order")
-               .execute())
-        return res.data if res.data else []
-
-    # ── Split Structure ────────────────────────────────────────────────────
-    async def _fetch_split_structure(self, user_id: str) -> List[Dict[str, Any]]:
-        return await asyncio.to_thread(self._fetch_split_structure_sync, user_id)
-
-    def _fetch_split_structure_sync(self, user_id: str) -> List[Dict[str, Any]]:
-        """Fetch split_items for the user's active split, ordered by position."""
-        split_res = (self.supabase.table("workout_splits")
-                     .select("id, name")
-                     .eq("user_id", user_id)
-                     .eq("is_active", True)
-                     .limit(1)
-                     .execute())
-        if not split_res.data:
-            return []
-
-        split_id = split_res.data[0]["id"]
-        split_name = split_res.data[0]["name"]
-
-        items_res = (self.supabase.table("split_items")
-                     .select("order_index, workout_name")
-                     .eq("split_id", split_id)
-                     .order("order_index")
-                     .execute())
-        if not items_res.data:
-            return []
-
+    @staticmethod
+    def _format_active_notes(rows: List[Dict[str, Any]]) -> List[str]:
+        # created_str is already Cairo-local 'YYYY-MM-DD HH:MM' (formatted in the RPC)
         return [
-            {"position": row["order_index"], "day": row["workout_name"], "split_name": split_name}
-            for row in items_res.data
+            f"{n['note_content']} (Added: {n['created_str']})" if n.get('created_str') else n['note_content']
+            for n in rows
         ]
 
     def _get_empty_goals(self) -> Dict[str, Any]:
@@ -1,8 +1,13 @@
 import os
 import json
+import functools
 import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 from pywebpush import webpush, WebPushException
-from supabase import create_client, Client
+from supabase import Client
+from nutrisync_adk.tools.utils import get_supabase_client, get_today_date_str
 
 logger = logging.getLogger("NutriSync-Notifications")
 
@@ -11,11 +16,12 @@ VAPID_PUBLIC_KEY = os.getenv("VAPID_PUBLIC_KEY", "")
 VAPID_CLAIMS = {"sub": "mailto:admin@nutrisync.com"}
 
 def get_supabase() -> Client:
-    url = os.getenv("SUPABASE_URL", "")
-    key = os.getenv("SUPABASE_KEY", "")
-    return create_client(url, key)
+    # Process-wide client (lru_cached, keep-alive HTTP/2 pool) shared with the tools,
+    # instead of building a new client per sweep and per stale-subscription delete.
+    return get_supabase_client()
 
-def send_push_message(subscription: dict, payload: str):
+def _webpush(subscription: dict, payload: bytes) -> Optional[str]:
+    """Send one push; returns the endpoint if the subscription is gone (404/410)."""
     try:
         webpush(
             subscription_info=subscription,
@@ -26,18 +32,43 @@ def send_push_message(subscription: dict, payload: str):
     except WebPushException as ex:
         logger.error(f"Push response code: {ex.response.status_code}")
         logger.error(f"Push response info: {ex.response.text}")
-        # If the subscription is no longer valid, we should theoretically delete it
+        # If the subscription is no longer valid, the caller deletes it
         if ex.response.status_code in [404, 410]:
-            try:
-                sb = get_supabase()
-                sb.table("push_subscriptions").delete().eq("endpoint", subscription["endpoint"]).execute()
-            except Exception as e:
-                logger.error(f"Failed to delete stale subscription: {e}")
+            return subscription["endpoint"]
     except Exception as e:
         logger.error(f"Error in webpush: {e}")
+    return None
 
-def get_users_with_subscriptions(sb: Client):
-    resp = sb.table("push_subscriptions").select("user_id, endpoint, p256dh, auth").execute()
+def _delete_stale_subscriptions(endpoints: List[str]):
+    """Drop expired subscriptions with one in_() delete per batch."""
+    try:
+        sb = get_supabase()
+        for i in range(0, len(endpoints), _IN_BATCH_SIZE):
+            sb.table("push_subscriptions").delete().in_("endpoint", endpoints[i:i + _IN_BATCH_SIZE]).execute()
+        logger.info(f"Deleted {len(endpoints)} stale push subscriptions")
+    except Exception as e:
+        logger.error(f"Failed to delete stale subscriptions: {e}")
+
+# webpush() is a blocking HTTPS call per device; sweeps fan the sends out over
+# a bounded pool instead of sending one after another.
+_PUSH_WORKERS = 32
+_push_executor = ThreadPoolExecutor(max_workers=_PUSH_WORKERS, thread_name_prefix="webpush")
+
+def send_push_messages(messages: List[Tuple[dict, bytes]]):
+    """Send (subscription_info, payload) pushes concurrently; returns when all are done."""
+    if not messages:
+        return
+    results = list(_push_executor.map(lambda m: _webpush(*m), messages))
+    logger.info(f"Sent {len(messages)} push notifications")
+    stale = list(dict.fromkeys(endpoint for endpoint in results if endpoint))
+    if stale:
+        _delete_stale_subscriptions(stale)
+
+def _subscription_info(sub: dict) -> dict:
+    return {"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}
+
+def get_user_subscriptions(sb: Client, user_id: str):
+    resp = sb.table("push_subscriptions").select("user_id, endpoint, p256dh, auth").eq("user_id", user_id).execute()
     return resp.data or []
 
 def get_user_language(sb: Client, user_id: str) -> str:
@@ -49,33 +80,63 @@ def get_user_language(sb: Client, user_id: str) -> str:
         logger.error(f"Error fetching language for {user_id}: {e}")
     return "en"
 
+# PostgREST filters go in the URL, so in_() lists are sent in batches to keep
+# request lines well under proxy limits.
+_IN_BATCH_SIZE = 200
+
+def _encode_payload(title: str, body: str) -> bytes:
+    """Compact UTF-8 JSON push body (Arabic stays raw instead of \\u-escaped)."""
+    return json.dumps({"title": title, "body": body}, separators=(",", ":"), ensure_ascii=False).encode()
+
+# Fixed reminder payloads, serialized once at import; sweeps only pick by language.
+def _payloads(ar: Tuple[str, str], en: Tuple[str, str]) -> Dict[str, bytes]:
+    return {lang: _encode_payload(title, body)
+            for lang, (title, body) in (("ar", ar), ("en", en))}
+
+_MORNING_PAYLOADS = _payloads(
+    ("صباح الخير! ☀️", "هل نمت جيداً؟ سجل نومك لليلة الماضية للحفاظ على دقة إحصائياتك."),
+    ("Good morning! ☀️", "Did you sleep well? Log your sleep from last night to keep your stats accurate."),
+)
+_AFTERNOON_PAYLOADS = _payloads(
+    ("استمر على المسار الصحيح! 🥗", "لا تنسَ تسجيل غدائك للبقاء على اطلاع دائم بالسعرات الحرارية."),
+    ("Stay on track! 🥗", "Don't forget to track your lunch to stay on top of your macros."),
+)
+_BODY_COMP_PAYLOADS = _payloads(
+    ("حان وقت قياس الوزن! ⚖️", "سجل وزن جسمك الحالي للحفاظ على دقة مخططات التقدم وتحديث أهداف السعرات الحرارية الخاصة بك."),
+    ("Time for a weigh-in! ⚖️", "Log your current body weight to keep your progress charts accurate and your calorie targets updated."),
+)
+
+def _payload_for(payloads: Dict[str, bytes], lang: str) -> bytes:
+    return payloads["ar"] if lang == "ar" else payloads["en"]
+
+@functools.lru_cache(maxsize=256)
+def _evening_payload(lang: str, next_workout: str) -> bytes:
+    # Users on the same split day share one encoded payload
+    if lang == "ar":
+        title = f"حان الوقت لسحق تمرين {next_workout}! 🏋️"
+        body = f"هل أنجزت تمرين {next_workout} الخاص بك اليوم؟ سجله الآن للحفاظ على الزخم!"
+    else:
+        title = f"Time to crush {next_workout}! 🏋️"
+        body = f"Did you hit your {next_workout} workout today? Log it now to keep up the momentum!"
+    return _encode_payload(title, body)
+
+def _push_targets(sb: Client, fn: str, params: Dict[str, Any]) -> List[dict]:
+    """Devices a sweep should notify (endpoint/keys + language), selected in Postgres."""
+    return sb.rpc(fn, params).execute().data or []
+
 def run_morning_check():
     """Morning heuristics (e.g., 9:00 AM) - Check for sleep logs from yesterday."""
     logger.info("Running morning notification check...")
     try:
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        if not subs: return
-        
-        from nutrisync_adk.tools.utils import get_today_date_str
         today = get_today_date_str() # We can improve this by using yesterday, but sleep logs handles time offset implicitly
-        
-        for sub in subs:
-            user_id = sub["user_id"]
-            lang = get_user_language(sb, user_id)
-            # Check if sleep was logged
-            sleep_resp = sb.table("sleep_logs").select("id").eq("user_id", user_id).eq("log_date", today).limit(1).execute()
-            if not sleep_resp.data:
-                # Send notification
-                if lang == "ar":
-                    title = "صباح الخير! ☀️"
-                    body = "هل نمت جيداً؟ سجل نومك لليلة الماضية للحفاظ على دقة إحصائياتك."
-                else:
-                    title = "Good morning! ☀️"
-                    body = "Did you sleep well? Log your sleep from last night to keep your stats accurate."
-                    
-                payload = json.dumps({"title": title, "body": body})
-                send_push_message({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
+        # Subscribed devices whose user hasn't logged sleep today
+        targets = _push_targets(sb, "get_morning_push_targets", {"p_date": today})
+        send_push_messages([
+            (_subscription_info(t), _payload_for(_MORNING_PAYLOADS, t["language"]))
+            for t in targets
+        ])
+
     except Exception as e:
         logger.error(f"Morning check error: {e}")
 
@@ -84,26 +145,14 @@ def run_afternoon_check():
     logger.info("Running afternoon notification check...")
     try:
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        if not subs: return
-        
-        from nutrisync_adk.tools.utils import get_today_date_str
         today = get_today_date_str()
-        
-        for sub in subs:
-            user_id = sub["user_id"]
-            lang = get_user_language(sb, user_id)
-            nut_resp = sb.table("nutrition_logs").select("id").eq("user_id", user_id).eq("log_date", today).limit(1).execute()
-            if not nut_resp.data:
-                if lang == "ar":
-                    title = "استمر على المسار الصحيح! 🥗"
-                    body = "لا تنسَ تسجيل غدائك للبقاء على اطلاع دائم بالسعرات الحرارية."
-                else:
-                    title = "Stay on track! 🥗"
-                    body = "Don't forget to track your lunch to stay on top of your macros."
-                
-                payload = json.dumps({"title": title, "body": body})
-                send_push_message({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
+        # Subscribed devices whose user hasn't logged a meal today
+        targets = _push_targets(sb, "get_afternoon_push_targets", {"p_date": today})
+        send_push_messages([
+            (_subscription_info(t), _payload_for(_AFTERNOON_PAYLOADS, t["language"]))
+            for t in targets
+        ])
+
     except Exception as e:
         logger.error(f"Afternoon check error: {e}")
 
@@ -112,61 +161,21 @@ def run_evening_check():
     logger.info("Running evening notification check...")
     try:
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        if not subs: return
-        
-        from nutrisync_adk.tools.utils import get_today_date_str
         today = get_today_date_str()
-        
-        for sub in subs:
-            user_id = sub["user_id"]
-            lang = get_user_language(sb, user_id)
-            
-            # 1. Does the user have a workout log today?
-            log_resp = sb.table("workout_logs").select("id").eq("user_id", user_id).eq("log_date", today).limit(1).execute()
-            if log_resp.data:
-                continue # They already worked out
-                
-            # 2. What is their next scheduled split day?
-            split_resp = sb.table("workout_splits").select("id").eq("user_id", user_id).eq("is_active", True).limit(1).execute()
-            if not split_resp.data:
-                continue # No active split
-                
-            split_id = split_resp.data[0]["id"]
-            items_resp = sb.table("split_items").select("workout_name").eq("split_id", split_id).order("order_index").execute()
-            if not items_resp.data:
-                continue
-                
-            schedule = [item["workout_name"] for item in items_resp.data]
-            
-            # Find the last logged workout day to determine where they are in the cycle.
-            # Simplified heuristic: just ask the database what they did last time.
-            last_log = sb.table("workout_logs").select("workout_type").eq("user_id", user_id).order("start_time", desc=True).limit(1).execute()
-            
-            next_workout = schedule[0]
-            if last_log.data:
-                last_type = last_log.data[0]["workout_type"]
-                try:
-                    # Find exactly where they are in the exact string match schedule
-                    idx = schedule.index(last_type)
-                    next_workout = schedule[(idx + 1) % len(schedule)]
-                except ValueError:
-                    # If the last logged wasn't strictly in schedule, assume first item.
-                    next_workout = schedule[0]
-                    
-            if next_workout.strip().lower() in ("rest", "rest day"):
+        # Devices whose user has an active split but no workout log today, with the
+        # next split day after their last logged workout (resolved in SQL)
+        targets = _push_targets(sb, "get_evening_push_targets", {"p_date": today})
+
+        outbox = []
+        for t in targets:
+            next_workout = t.get("next_workout")
+            if not next_workout or next_workout.strip().lower() in ("rest", "rest day"):
                 continue # It's a rest day, no notification needed
-                
-            if lang == "ar":
-                title = f"حان الوقت لسحق تمرين {next_workout}! 🏋️"
-                body = f"هل أنجزت تمرين {next_workout} الخاص بك اليوم؟ سجله الآن للحفاظ على الزخم!"
-            else:
-                title = f"Time to crush {next_workout}! 🏋️"
-                body = f"Did you hit your {next_workout} workout today? Log it now to keep up the momentum!"
-                
-            payload = json.dumps({"title": title, "body": body})
-            send_push_message({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
-            
+
+            outbox.append((_subscription_info(t), _evening_payload(t["language"], next_workout)))
+
+        send_push_messages(outbox)
+
     except Exception as e:
         logger.error(f"Evening check error: {e}")
 
@@ -175,36 +184,16 @@ def run_night_check():
     logger.info("Running night notification check...")
     try:
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        if not subs: return
-        
-        from nutrisync_adk.tools.utils import get_today_date_str
         today_date = get_today_date_str()
-        
-        for sub in subs:
-            user_id = sub["user_id"]
-            
-            # 1. Fetch user targets and language
-            profile_resp = sb.table("user_profile").select("daily_calorie_target, daily_protein_target_gm, language").eq("user_id", user_id).execute()
-            if not profile_resp.data:
-                continue
-            
-            target_cals = profile_resp.data[0].get("daily_calorie_target") or 0
-            target_protein = profile_resp.data[0].get("daily_protein_target_gm") or 0
-            lang = profile_resp.data[0].get("language") or "en"
-            
-            if target_cals == 0 and target_protein == 0:
-                continue
-                
-            # 2. Fetch logged nutrition for today
-            nut_resp = sb.table("nutrition_logs").select("calories, protein").eq("user_id", user_id).eq("log_date", today_date).execute()
-            
-            consumed_cals = sum((log.get("calories") or 0) for log in nut_resp.data) if nut_resp.data else 0
-            consumed_protein = sum((log.get("protein") or 0) for log in nut_resp.data) if nut_resp.data else 0
-            
-            remaining_cals = max(0, target_cals - consumed_cals)
-            remaining_protein = max(0, target_protein - consumed_protein)
-            
+        # Devices of users with macro targets, with today's remaining calories/protein
+        targets = _push_targets(sb, "get_night_push_targets", {"p_date": today_date})
+
+        outbox = []
+        for t in targets:
+            lang = t["language"]
+            remaining_cals = float(t.get("remaining_calories") or 0)
+            remaining_protein = float(t.get("remaining_protein") or 0)
+
             # Send notification if significantly under target
             if remaining_cals > 150 or remaining_protein > 15:
                 if lang == "ar":
@@ -221,10 +210,11 @@ def run_night_check():
                         else: body = f"You still need {int(remaining_protein)}g protein"
                     body += " today! Grab a high-protein snack before bed."
                     title = "Late-Night Macro Check 🌙"
-                
-                payload = json.dumps({"title": title, "body": body})
-                send_push_message({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
-                
+
+                outbox.append((_subscription_info(t), _encode_payload(title, body)))
+
+        send_push_messages(outbox)
+
     except Exception as e:
         logger.error(f"Night check error: {e}")
 
@@ -233,29 +223,14 @@ def run_body_comp_check():
     logger.info("Running bi-weekly body composition notification check...")
     try:
         sb = get_supabase()
-        subs = get_users_with_subscriptions(sb)
-        if not subs: return
-        
-        from datetime import datetime, timedelta
         # 3 days ago string
         cutoff_date = (datetime.utcnow() - timedelta(days=3)).strftime('%Y-%m-%d')
-        
-        for sub in subs:
-            user_id = sub["user_id"]
-            lang = get_user_language(sb, user_id)
-            
-            # Query if they have logged weight since the cutoff
-            comp_resp = sb.table("body_composition_logs").select("id").eq("user_id", user_id).gte("log_date", cutoff_date).limit(1).execute()
-            if not comp_resp.data:
-                if lang == "ar":
-                    title = "حان وقت قياس الوزن! ⚖️"
-                    body = "سجل وزن جسمك الحالي للحفاظ على دقة مخططات التقدم وتحديث أهداف السعرات الحرارية الخاصة بك."
-                else:
-                    title = "Time for a weigh-in! ⚖️"
-                    body = "Log your current body weight to keep your progress charts accurate and your calorie targets updated."
-                
-                payload = json.dumps({"title": title, "body": body})
-                send_push_message({"endpoint": sub["endpoint"], "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}}, payload)
-                
+        # Subscribed devices whose user hasn't logged weight since the cutoff
+        targets = _push_targets(sb, "get_body_comp_push_targets", {"p_since": cutoff_date})
+        send_push_messages([
+            (_subscription_info(t), _payload_for(_BODY_COMP_PAYLOADS, t["language"]))
+            for t in targets
+        ])
+
     except Exception as e:
         logger.error(f"Body comp check error: {e}")
@@ -1,8 +1,9 @@
 import logging
 from typing import Optional, List, Dict, Any
 from google.adk.tools import BaseTool
-from ..tools.utils import get_supabase_client, calculate_log_timestamp
+from ..tools.utils import get_supabase_client, calculate_log_timestamp, query_user_logs, BODY_COMP_COLS
 from ..user_context import current_user_id
+from ..services.cache import invalidate_user_context, invalidate_user_logs, USER_CONTEXT_CORE
 
 logger = logging.getLogger(__name__)
 
@@ -35,23 +36,23 @@ def log_body_comp(
         supabase = get_supabase_client()
         created_at = calculate_log_timestamp()
         
-        data = {
-            "user_id": user_id,
-            "created_at": created_at,
-            "weight_kg": weight_kg,
-            "muscle_kg": muscle_kg,
-            "bf_percent": bf_percent,
-            "resting_hr": resting_hr,
-            "notes": notes
+        params = {
+            "p_user_id": user_id,
+            "p_created_at": created_at,
+            "p_weight_kg": weight_kg,
+            "p_muscle_kg": muscle_kg,
+            "p_bf_percent": bf_percent,
+            "p_resting_hr": resting_hr,
+            "p_notes": notes,
         }
-        
-        # Remove None
-        data = {k: v for k, v in data.items() if v is not None}
-        
-        response = supabase.table("body_composition_logs").insert(data).execute()
-        
-        # Sync with user_profile
-        supabase.table("user_profile").update({"weight_kg": weight_kg}).eq("user_id", user_id).execute()
+
+        # Remove None (omitted metrics fall back to the RPC's defaults)
+        params = {k: v for k, v in params.items() if v is not None}
+
+        # Log insert and user_profile weight sync run in one transaction
+        response = supabase.rpc("log_body_comp", params).execute()
+        invalidate_user_context(user_id, USER_CONTEXT_CORE)
+        invalidate_user_logs(user_id, "body_composition_logs")
         
         if response.data:
             return f"Successfully logged body comp: {weight_kg}kg."
@@ -62,10 +63,9 @@ def log_body_comp(
         logger.error(f"Error logging body comp: {e}")
         return f"Error logging body comp: {str(e)}"
 
-def get_body_comp_history(limit: Optional[int] = 10, days: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_body_comp_history(limit: Optional[int] = 10, days: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Fetches body composition logs.
     """
-    from ..tools.utils import query_user_logs
-    return query_user_logs("body_composition_logs", days=days, start_date=start_date, end_date=end_date, default_limit=limit or 10)
+    return await query_user_logs("body_composition_logs", columns=BODY_COMP_COLS, days=days, start_date=start_date, end_date=end_date, default_limit=limit or 10)
 
@@ -1,14 +1,98 @@
 import logging
 import json
-import base64
+import functools
 import httpx
+import orjson
 from typing import Dict, Any
+from .utils import b64encode
+from ..services.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 QUICKCHART_API_URL = "https://quickchart.io/chart"
 
-def draw_chart(chart_config: Dict[str, Any], caption: str = "") -> Dict[str, Any]:
+@functools.lru_cache(maxsize=1)
+def _get_quickchart_client() -> httpx.AsyncClient:
+    # One keep-alive HTTP/2 pool for every chart render: repeat charts skip the
+    # TCP/TLS handshake and concurrent renders multiplex on one connection
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        timeout=30.0,
+    )
+
+class _QuickChartError(Exception):
+    pass
+
+_AXIS_DEFAULTS = {
+    "ticks": {"color": "#aaaaaa"},
+    "grid": {"color": "rgba(255, 255, 255, 0.1)"},
+}
+
+# Dark-mode Chart.js options; only keys the caller left out are filled in
+_DARK_DEFAULTS = {
+    "plugins": {
+        # Legend styling (white text on dark bg)
+        "legend": {"labels": {"color": "#ffffff"}},
+    },
+    # Axis styling for dark mode
+    "scales": {"x": _AXIS_DEFAULTS, "y": _AXIS_DEFAULTS},
+}
+
+def _fill_defaults(target: Dict[str, Any], defaults: Dict[str, Any]):
+    """Recursively add missing keys from defaults to target (fresh dicts, never shared)."""
+    for key, value in defaults.items():
+        if isinstance(value, dict):
+            current = target.get(key)
+            if current is None:
+                current = target[key] = {}
+            if isinstance(current, dict):
+                _fill_defaults(current, value)
+        elif key not in target:
+            target[key] = value
+
+# Multiple of 3, so each chunk base64-encodes without padding in the middle of the stream
+_STREAM_CHUNK_SIZE = 12288
+
+# Charts are a pure function of the payload, so an agent regenerating the same
+# chart gets the earlier image back. ~64 PNGs at a few hundred KB of base64 each.
+_chart_cache = TTLCache(maxsize=64, ttl=3600)
+
+async def _render_chart(payload_json: bytes) -> str:
+    """POST a canonical QuickChart payload; returns the PNG as base64. Errors raise, so they aren't cached."""
+    cached = _chart_cache.get(payload_json)
+    if cached is not None:
+        return cached
+
+    async with _get_quickchart_client().stream(
+        "POST",
+        QUICKCHART_API_URL,
+        content=payload_json,
+        headers={"Content-Type": "application/json"}
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise _QuickChartError(f"QuickChart API error: {response.status_code} - {response.text[:200]}")
+
+        # Encode while downloading instead of buffering the PNG and then its base64 copy
+        encoded = bytearray()
+        carry = b""
+        size = 0
+        async for chunk in response.aiter_bytes(chunk_size=_STREAM_CHUNK_SIZE):
+            size += len(chunk)
+            if carry:
+                chunk = carry + chunk
+            cut = len(chunk) - len(chunk) % 3
+            encoded += b64encode(chunk[:cut])
+            carry = chunk[cut:]
+        encoded += b64encode(carry)
+
+    logger.info(f"Chart generated successfully ({size} bytes)")
+    image_base64 = encoded.decode('ascii')
+    _chart_cache.set(payload_json, image_base64)
+    return image_base64
+
+async def draw_chart(chart_config: Dict[str, Any], caption: str = "") -> Dict[str, Any]:
     """
     Generates a chart image using QuickChart.io API from a full Chart.js configuration.
     
@@ -66,43 +150,15 @@ def draw_chart(chart_config: Dict[str, Any], caption: str = "") -> Dict[str, Any
             }
         
         # Inject dark mode / neon defaults if not specified
-        if "options" not in chart_config:
-            chart_config["options"] = {}
-        
-        options = chart_config["options"]
-        
-        # Default plugin options for dark mode
-        if "plugins" not in options:
-            options["plugins"] = {}
+        options = chart_config.get("options")
+        if not isinstance(options, dict):
+            options = chart_config["options"] = {}
+        _fill_defaults(options, _DARK_DEFAULTS)
         
-        plugins = options["plugins"]
-        
-        # Legend styling (white text on dark bg)
-        if "legend" not in plugins:
-            plugins["legend"] = {}
-        if "labels" not in plugins["legend"]:
-            plugins["legend"]["labels"] = {"color": "#ffffff"}
-        
-        # Title styling
-        if "title" in plugins and "color" not in plugins["title"]:
-            plugins["title"]["color"] = "#ffffff"
-        
-        # Axis styling for dark mode
-        if "scales" not in options:
-            options["scales"] = {}
-        
-        for axis in ["x", "y"]:
-            if axis not in options["scales"]:
-                options["scales"][axis] = {}
-            axis_opts = options["scales"][axis]
-            if "ticks" not in axis_opts:
-                axis_opts["ticks"] = {}
-            if "color" not in axis_opts["ticks"]:
-                axis_opts["ticks"]["color"] = "#aaaaaa"
-            if "grid" not in axis_opts:
-                axis_opts["grid"] = {}
-            if "color" not in axis_opts["grid"]:
-                axis_opts["grid"]["color"] = "rgba(255, 255, 255, 0.1)"
+        # Title styling (only when the chart has a title)
+        title = options["plugins"].get("title")
+        if isinstance(title, dict) and "color" not in title:
+            title["color"] = "#ffffff"
         
         # Build payload for QuickChart API
         payload = {
@@ -113,35 +169,25 @@ def draw_chart(chart_config: Dict[str, Any], caption: str = "") -> Dict[str, Any
             "format": "png"
         }
         
-        # Make synchronous request to QuickChart
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(
-                QUICKCHART_API_URL,
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                # Encode image as base64
-                image_base64 = base64.b64encode(response.content).decode('utf-8')
-                
-                logger.info(f"Chart generated successfully ({len(response.content)} bytes)")
-                
-                return {
-                    "success": True,
-                    "image_base64": image_base64,
-                    "caption": caption,
-                    "message": "Chart generated successfully. The image will be sent separately."
-                }
-            else:
-                error_msg = f"QuickChart API error: {response.status_code} - {response.text[:200]}"
-                logger.error(error_msg)
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+        # Canonical JSON bytes (sorted keys) so equal configs share one cache entry
+        payload_json = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        try:
+            image_base64 = await _render_chart(payload_json)
+        except _QuickChartError as e:
+            logger.error(str(e))
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
+        return {
+            "success": True,
+            "image_base64": image_base64,
+            "caption": caption,
+            "message": "Chart generated successfully. The image will be sent separately."
+        }
                 
-    except json.JSONDecodeError as e:
+    except (json.JSONDecodeError, orjson.JSONEncodeError) as e:
         logger.error(f"Invalid JSON in chart_config: {e}")
         return {
             "success": False,
@@ -4,9 +4,13 @@ from typing import Optional, List, Dict, Any
 from google.adk.tools import BaseTool
 from ..tools.utils import get_supabase_client, calculate_log_timestamp
 from ..user_context import current_user_id
+from ..services.cache import invalidate_user_context, USER_CONTEXT_CORE
 
 logger = logging.getLogger(__name__)
 
+# Newest active notes returned by get_active_notes_tool
+_ACTIVE_NOTES_LIMIT = 20
+
 def set_status_note(
     note_content: str,
     confirmation_required: bool = True
@@ -25,15 +29,13 @@ def set_status_note(
 
         supabase = get_supabase_client()
         
-        data = {
-            "user_id": user_id,
-            "note_content": note_content,
-            "is_active": True
-        }
-        
-        # We just insert a new active note. 
-        # (Optionally we could deactivate old conflicting ones, but stackable notes are fine).
-        response = supabase.table("persistent_context").insert(data).execute()
+        # Insert a new active note; the RPC first retires any active duplicate of it
+        # (distinct notes still stack).
+        response = supabase.rpc("set_status_note", {
+            "p_user_id": user_id,
+            "p_note_content": note_content,
+        }).execute()
+        invalidate_user_context(user_id, USER_CONTEXT_CORE)
         
         if response.data:
             return f"Successfully set status: '{note_content}'. I will keep this in mind."
@@ -66,10 +68,12 @@ def clear_status_note(
         
         if clear_all:
              response = query.eq("is_active", True).execute()
+             invalidate_user_context(user_id, USER_CONTEXT_CORE)
              return "Successfully cleared all active status notes."
         
         if note_id:
             response = query.eq("id", note_id).execute()
+            invalidate_user_context(user_id, USER_CONTEXT_CORE)
             return f"Successfully cleared note {note_id}."
             
         return "Error: Must specify note_id or clear_all=True."
@@ -89,10 +93,11 @@ def get_active_notes_tool() -> List[Dict[str, Any]]:
 
         supabase = get_supabase_client()
         response = supabase.table("persistent_context") \
-            .select("*") \
+            .select("id, note_content, created_at") \
             .eq("user_id", user_id) \
             .eq("is_active", True) \
             .order("created_at", desc=True) \
+            .limit(_ACTIVE_NOTES_LIMIT) \
             .execute()
         return response.data
     except Exception as e:
@@ -1,12 +1,15 @@
 import logging
+from datetime import date, timedelta
 from typing import Optional, List, Dict, Any
+import orjson
 from google.adk.tools import BaseTool
-from ..tools.utils import get_supabase_client, calculate_log_timestamp, get_today_date_str
+from ..tools.utils import get_async_postgrest, calculate_log_timestamp, get_today_date_str, query_user_logs, NUTRITION_COLS
 from ..user_context import current_user_id
+from ..services.cache import invalidate_user_context, invalidate_user_logs, USER_CONTEXT_CORE
 
 logger = logging.getLogger(__name__)
 
-def log_meal(
+async def log_meal(
     food_item: str,
     calories: int,
     protein: int,
@@ -45,7 +48,6 @@ def log_meal(
         if not user_id:
              return "Error: No user context found."
 
-        supabase = get_supabase_client()
         timestamp = calculate_log_timestamp()
         
         data = {
@@ -59,10 +61,15 @@ def log_meal(
             "healthy": healthy
         }
         
-        response = supabase.table("nutrition_logs").insert(data).execute()
+        # Native async insert: the sync client would block the event loop for
+        # the whole round trip while ADK awaits this tool.
+        rows = await get_async_postgrest().insert("nutrition_logs", data)
+        # daily_goals totals are rolled up from nutrition_logs
+        invalidate_user_context(user_id, USER_CONTEXT_CORE)
+        invalidate_user_logs(user_id, "nutrition_logs")
         
-        # Check if successful (Supabase-py usually raises error or returns data)
-        if response.data:
+        # PostgREST raises on failure or returns the inserted representation
+        if rows:
             return f"Successfully logged {food_item} ({calories}kcal)."
         else:
             return "Error: Failed to log meal (No data returned)."
@@ -71,7 +78,76 @@ def log_meal(
         logger.error(f"Error logging meal: {e}")
         return f"Error logging meal: {str(e)}"
 
-def get_nutrition_history(days: Optional[int] = 7, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+async def log_meals(meals_json: str, confirmation_required: bool = True) -> str:
+    """
+    Logs several foods/meals at once to the nutrition_logs table.
+    Prefer this over repeated log_meal calls whenever the user reports 2 or more items
+    (e.g. "chicken, rice and broccoli") — they are saved in a single request.
+
+    Args:
+        meals_json: JSON array of meal objects. Each object must have:
+            - food_item (str): Name of the food
+            - calories (int): Total calories
+            - protein (int): Protein in grams
+            - carbs (int): Carbs in grams
+            - fats (int): Fats in grams
+            Optional fields per meal:
+            - healthy (bool): Whether the food is considered healthy/clean (default true)
+        confirmation_required: Signal for the agent to ask confirmation.
+
+    Returns:
+        Status message string.
+    """
+    try:
+        user_id = current_user_id.get()
+        if not user_id:
+             return "Error: No user context found."
+
+        try:
+            meals = orjson.loads(meals_json)
+        except orjson.JSONDecodeError as e:
+            return f"Error: Invalid JSON — {str(e)}"
+
+        if not isinstance(meals, list) or len(meals) == 0:
+            return "Error: meals_json must be a non-empty JSON array."
+
+        # One timestamp for the whole batch: these were eaten together
+        timestamp = calculate_log_timestamp()
+        rows = []
+        for i, meal in enumerate(meals):
+            if not isinstance(meal, dict) or not meal.get("food_item"):
+                return f"Error: Meal {i + 1} is missing 'food_item'."
+            try:
+                rows.append({
+                    "user_id": user_id,
+                    "created_at": timestamp,
+                    "food_item": str(meal["food_item"]),
+                    "calories": int(meal["calories"]),
+                    "protein": int(meal["protein"]),
+                    "carbs": int(meal["carbs"]),
+                    "fats": int(meal["fats"]),
+                    "healthy": bool(meal.get("healthy", True)),
+                })
+            except (KeyError, TypeError, ValueError) as e:
+                return f"Error: Meal {i + 1} ('{meal.get('food_item')}') has a missing or invalid field: {e}"
+
+        # Single bulk insert instead of one round trip per item
+        inserted = await get_async_postgrest().insert("nutrition_logs", rows)
+        invalidate_user_context(user_id, USER_CONTEXT_CORE)
+        invalidate_user_logs(user_id, "nutrition_logs")
+
+        if inserted:
+            total_kcal = sum(r["calories"] for r in rows)
+            names = ", ".join(r["food_item"] for r in rows)
+            return f"Successfully logged {len(rows)} items ({total_kcal}kcal total): {names}."
+        else:
+            return "Error: Failed to log meals (No data returned)."
+
+    except Exception as e:
+        logger.error(f"Error logging meals: {e}")
+        return f"Error logging meals: {str(e)}"
+
+async def get_nutrition_history(days: Optional[int] = 7, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Fetches nutrition logs.
     
@@ -80,8 +156,28 @@ def get_nutrition_history(days: Optional[int] = 7, start_date: Optional[str] = N
         start_date: Specific start date (YYYY-MM-DD or ISO) to search from. Only one of 'days' or 'start_date' is needed.
         end_date: Specific end date (YYYY-MM-DD or ISO) to search up to.
     """
-    from ..tools.utils import query_user_logs
-    return query_user_logs("nutrition_logs", days=days, start_date=start_date, end_date=end_date)
+    return await query_user_logs("nutrition_logs", date_column="log_date", columns=NUTRITION_COLS, days=days, start_date=start_date, end_date=end_date)
+
+
+async def get_daily_nutrition_totals(days: Optional[int] = 7) -> List[Dict[str, Any]]:
+    """
+    Fetches per-day nutrition totals (calories, protein, carbs, fats, item count), summed in the database.
+    Use this for totals/adherence questions over several days instead of adding up get_nutrition_history rows.
+
+    Args:
+        days: Number of days to look back from today (default 7).
+    """
+    user_id = current_user_id.get()
+    if not user_id:
+        return []
+
+    try:
+        lookback_days = days if days is not None else 7
+        since = (date.fromisoformat(get_today_date_str()) - timedelta(days=lookback_days)).isoformat()
+        return await get_async_postgrest().rpc("daily_nutrition_totals", {"p_user_id": user_id, "p_since": since}) or []
+    except Exception as e:
+        logger.error(f"Error fetching daily nutrition totals: {e}")
+        return []
 
 
 def calculate_macros(food_name: str) -> str:
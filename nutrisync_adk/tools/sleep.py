@@ -1,13 +1,14 @@
 import logging
-import uuid
+from datetime import date, datetime, timedelta
 from typing import Optional, List, Dict, Any
 from google.adk.tools import BaseTool
-from ..tools.utils import get_supabase_client, calculate_log_timestamp, get_today_date_str
+from ..tools.utils import get_async_postgrest, calculate_log_timestamp, get_today_date_str, query_user_logs, uuid7, CAIRO_TZ, SLEEP_COLS
 from ..user_context import current_user_id
+from ..services.cache import invalidate_user_logs
 
 logger = logging.getLogger(__name__)
 
-def log_sleep(
+async def log_sleep(
     night_sleep_hours: float,
     sleep_score: int,
     sleep_start_time: Optional[str] = None,
@@ -38,7 +39,6 @@ def log_sleep(
         if not user_id:
              return "Error: No user context."
 
-        supabase = get_supabase_client()
         # "Created At" is the time of logging (now)
         created_at = calculate_log_timestamp()
         
@@ -49,30 +49,27 @@ def log_sleep(
         if sleep_start_time and len(sleep_start_time) <= 5:
             # Assume HH:MM format
             try:
-                from datetime import datetime, timedelta
                 # Parse the time
                 h, m = map(int, sleep_start_time.split(':'))
                 
                 # Parse the sleep date
-                date_obj = datetime.strptime(sleep_date, "%Y-%m-%d")
+                date_obj = date.fromisoformat(sleep_date)
                 
                 # Logic: If time is 00:00-12:00, it's likely the "next day" relative to the functional sleep date
                 # e.g. Sleep Date = Jan 1 (Monday), Bed Time = 01:00 (Tuesday AM)
                 if h < 12:
                      date_obj += timedelta(days=1)
                 
-                # Combine
-                start_dt = date_obj.replace(hour=h, minute=m, second=0)
-                
-                from ..tools.utils import CAIRO_TZ
-                start_dt = CAIRO_TZ.localize(start_dt)
+                # Combine (zoneinfo takes tzinfo directly, no localize step)
+                start_dt = datetime(date_obj.year, date_obj.month, date_obj.day, h, m, tzinfo=CAIRO_TZ)
                 
                 sleep_start_time = start_dt.isoformat()
             except Exception as e:
                 logger.warning(f"Could not parse sleep_start_time '{sleep_start_time}', passing as is. Error: {e}")
         
-        # Generate UUID locally since schema has no default
-        record_id = str(uuid.uuid4())
+        # Generate UUID locally since schema has no default; v7 keeps the PK
+        # index append-only (ids sort by creation time)
+        record_id = uuid7()
 
         data = {
             "id": record_id,
@@ -81,19 +78,25 @@ def log_sleep(
             "sleep_date": sleep_date,
             "night_sleep_hours": night_sleep_hours,
             "sleep_score": sleep_score,
-            "sleep_start_time": sleep_start_time,
-            "deep_sleep_percentage": deep_sleep_percentage,
-            "rem_sleep_percentage": rem_sleep_percentage,
-            "light_sleep_percentage": light_sleep_percentage,
-            "times_woke_up": times_woke_up
         }
         
-        # Filter out None values to let DB handle nulls if any (though schema seems permissive or handled)
-        data = {k: v for k, v in data.items() if v is not None}
+        # Only send optional fields that were given, to let DB handle nulls
+        # (built in place rather than copying through a filtering comprehension)
+        if sleep_start_time is not None:
+            data["sleep_start_time"] = sleep_start_time
+        if deep_sleep_percentage is not None:
+            data["deep_sleep_percentage"] = deep_sleep_percentage
+        if rem_sleep_percentage is not None:
+            data["rem_sleep_percentage"] = rem_sleep_percentage
+        if light_sleep_percentage is not None:
+            data["light_sleep_percentage"] = light_sleep_percentage
+        if times_woke_up is not None:
+            data["times_woke_up"] = times_woke_up
         
-        response = supabase.table("sleep_logs").insert(data).execute()
+        rows = await get_async_postgrest().insert("sleep_logs", data)
+        invalidate_user_logs(user_id, "sleep_logs")
         
-        if response.data:
+        if rows:
             return f"Successfully logged sleep: {night_sleep_hours} hrs (Score: {sleep_score})."
         else:
             return "Error: Failed to log sleep (No data returned)."
@@ -102,7 +105,7 @@ def log_sleep(
         logger.error(f"Error logging sleep: {e}")
         return f"Error logging sleep: {str(e)}"
 
-def get_sleep_history(days: Optional[int] = 7, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_sleep_history(days: Optional[int] = 7, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Fetches sleep logs.
     
@@ -111,6 +114,5 @@ def get_sleep_history(days: Optional[int] = 7, start_date: Optional[str] = None,
         start_date: Specific start date (YYYY-MM-DD).
         end_date: Specific end date.
     """
-    from ..tools.utils import query_user_logs
-    return query_user_logs("sleep_logs", date_column="sleep_date", days=days, start_date=start_date, end_date=end_date, default_limit=20)
+    return await query_user_logs("sleep_logs", date_column="sleep_date", columns=SLEEP_COLS, days=days, start_date=start_date, end_date=end_date, default_limit=20)
 
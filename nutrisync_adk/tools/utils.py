@@ -1,30 +1,164 @@
 import os
+import functools
 import logging
-from typing import Dict, Any
-from datetime import datetime, timedelta
-import pytz
-from supabase import create_client, Client
+import threading
+import time
+from typing import Dict, Any, List
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+import httpx
+import orjson
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 
+from ..user_context import current_user_id
+from ..services.cache import user_log_query_cache
+
+try:
+    # SIMD (AVX2/AVX-512) base64 for chart PNGs and uploaded images; same API as stdlib
+    from pybase64 import b64encode, b64decode
+except ImportError:
+    from base64 import b64encode, b64decode
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Single instance/factory for Supabase
-_supabase_client = None
+# Pool sizing shared by the sync and async PostgREST clients. Set on the
+# transports: httpx ignores client-level limits once a transport is given.
+_POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
 
+# Single instance/factory for Supabase
+@functools.lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
-    global _supabase_client
-    if _supabase_client is None:
-        url = os.getenv("SUPABASE_URL")
-        key = os.getenv("SUPABASE_KEY")
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env")
-        _supabase_client = create_client(url, key)
-    return _supabase_client
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env")
+
+    # One keep-alive HTTP/2 pool shared by every sync PostgREST call in the
+    # process, so tool calls reuse warm TCP/TLS connections instead of reconnecting.
+    # retries=1 retries a failed connect once (ConnectError/ConnectTimeout on a
+    # new connection); requests on an already-pooled connection are not resent.
+    http_client = httpx.Client(
+        transport=httpx.HTTPTransport(http2=True, retries=1, limits=_POOL_LIMITS),
+        timeout=10.0,
+    )
+    try:
+        options = ClientOptions(postgrest_client_timeout=10, httpx_client=http_client)
+    except TypeError:
+        # Older supabase-py without httpx_client support
+        http_client.close()
+        options = ClientOptions(postgrest_client_timeout=10)
+    return create_client(url, key, options=options)
+
+
+class AsyncPostgrest:
+    """
+    Minimal native-async PostgREST client for the per-message hot paths.
+
+    supabase-py's postgrest client is synchronous, so every call from the
+    async services had to hop through asyncio.to_thread. This talks to
+    /rest/v1 directly over one pooled httpx.AsyncClient per process.
+    Query params use raw PostgREST syntax, e.g. {"user_id": "eq.<uuid>"}.
+    """
+
+    def __init__(self, url: str, key: str):
+        # HTTP/2: ContextService's concurrent selects multiplex over one
+        # connection instead of each opening its own TCP/TLS handshake.
+        # retries=1: retry failed connects once, as in get_supabase_client.
+        self._client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(http2=True, retries=1, limits=_POOL_LIMITS),
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=10.0,
+        )
+
+    # Bodies are (de)serialized with orjson rather than httpx's stdlib json
+
+    async def select(self, table: str, params: Any) -> List[Dict[str, Any]]:
+        # params: a dict, or (key, value) pairs when a column is filtered twice
+        resp = await self._client.get(f"/{table}", params=params)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
+    async def insert(self, table: str, rows: Any) -> List[Dict[str, Any]]:
+        resp = await self._client.post(
+            f"/{table}",
+            content=orjson.dumps(rows),
+            headers={"Content-Type": "application/json", "Prefer": "return=representation"},
+        )
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
+    async def rpc(self, fn: str, params: Dict[str, Any]) -> Any:
+        resp = await self._client.post(
+            f"/rpc/{fn}",
+            content=orjson.dumps(params),
+            headers={"Content-Type": "application/json"},
+        )
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
+    async def explain_rpc(self, fn: str, params: Dict[str, Any]) -> str:
+        """EXPLAIN (ANALYZE, BUFFERS) plan for an RPC call, as text.
+
+        Needs the PostgREST db-plan-enabled setting on the project; debug use only.
+        """
+        resp = await self._client.post(
+            f"/rpc/{fn}",
+            content=orjson.dumps(params),
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/vnd.pgrst.plan+text; options=analyze|buffers",
+            },
+        )
+        resp.raise_for_status()
+        return resp.text
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_async_postgrest = None
+_async_postgrest_lock = threading.Lock()
+
+def get_async_postgrest() -> AsyncPostgrest:
+    global _async_postgrest
+    if _async_postgrest is None:
+        # Double-checked: a racing first call (event loop vs. a to_thread
+        # worker) must not build and leak a second connection pool.
+        with _async_postgrest_lock:
+            if _async_postgrest is None:
+                url = os.getenv("SUPABASE_URL")
+                key = os.getenv("SUPABASE_KEY")
+                if not url or not key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env")
+                _async_postgrest = AsyncPostgrest(url, key)
+    return _async_postgrest
+
+def uuid7() -> str:
+    """
+    Time-ordered UUIDv7 string (48-bit Unix ms timestamp + 74 random bits).
+
+    For client-generated primary keys: ids ascend with insert time, so B-tree
+    inserts land on the rightmost index page instead of a random one.
+    """
+    ts_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (
+        (ts_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76                          # version 7
+        | (rand >> 68) << 64                 # rand_a: 12 bits
+        | 0b10 << 62                         # RFC 9562 variant
+        | (rand & 0x3FFF_FFFF_FFFF_FFFF)     # rand_b: 62 bits
+    )
+    h = f"{value:032x}"
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
 
 # Constants
-CAIRO_TZ = pytz.timezone('Africa/Cairo')
+# zoneinfo (C-backed, no .localize()); loaded once here so the first log doesn't pay the tz DB read
+CAIRO_TZ = ZoneInfo('Africa/Cairo')
 FUNCTIONAL_DAY_OFFSET_HOURS = 4
 
 def get_current_functional_time() -> datetime:
@@ -53,75 +187,112 @@ def calculate_log_timestamp(functional_check: bool = True) -> str:
     
     return now.isoformat()
 
+# (minute bucket, date string): the functional day only flips on a minute boundary
+_today_cache = (None, "")
+
 def get_today_date_str() -> str:
     """
     Returns the 'functional' today date string (YYYY-MM-DD).
     If it's 2 AM Tuesday, returns Monday's date for daily queries.
     """
+    global _today_cache
+    bucket = int(time.time() // 60)
+    cached_bucket, cached = _today_cache
+    if cached_bucket == bucket:
+        return cached
+
     now = get_current_functional_time()
     if 0 <= now.hour < FUNCTIONAL_DAY_OFFSET_HOURS:
-        functional_now = now - timedelta(days=1)
-        return functional_now.strftime('%Y-%m-%d')
-    return now.strftime('%Y-%m-%d')
+        now = now - timedelta(days=1)
+    today = now.date().isoformat()
+    _today_cache = (bucket, today)
+    return today
 
+# Columns the history tools return per table (the agent never reads ids/user_id).
+# workout_logs stays "*": rows ingested by the legacy pipeline carry extra
+# columns, and the agent links exercise sets by its id.
+NUTRITION_COLS = "created_at,log_date,food_item,calories,protein,carbs,fats,healthy"
+SLEEP_COLS = (
+    "created_at,sleep_date,night_sleep_hours,sleep_score,sleep_start_time,"
+    "deep_sleep_percentage,rem_sleep_percentage,light_sleep_percentage,times_woke_up"
+)
+BODY_COMP_COLS = "created_at,weight_kg,muscle_kg,bf_percent,resting_hr,notes"
 
-def query_user_logs(
+
+async def query_user_logs(
     table_name: str,
     date_column: str = "created_at",
+    columns: str = "*",
     days: int = None,
     start_date: str = None,
     end_date: str = None,
     default_limit: int = 50,
     explicit_limit: int = 100,
+    offset: int = 0,
 ) -> list:
     """
     Shared helper for querying time-series log tables filtered by the current user.
 
+    Native async so the history tools don't block the event loop; when the
+    agent asks for several histories in one turn, ADK runs them concurrently.
+
     Args:
         table_name: Supabase table to query (e.g. "nutrition_logs").
-        date_column: Column used for date filtering/ordering (e.g. "created_at", "sleep_date").
+        date_column: Column used for date filtering/ordering. Prefer the table's functional-day
+            date column ("log_date", "sleep_date") where it has one; created_at breaks ties.
+        columns: Comma-separated PostgREST select list (default all columns).
         days: Lookback window in days from today (default: 7 if neither days nor start_date given).
         start_date: Explicit start date (YYYY-MM-DD or ISO).
         end_date: Explicit end date (YYYY-MM-DD or ISO). Only used with start_date.
         default_limit: Max rows when using the days-based lookback.
         explicit_limit: Max rows when using explicit start_date range.
+        offset: Rows to skip before the limit, for paging past the first window.
 
     Returns:
         List of row dicts, or empty list on error.
     """
-    from ..user_context import current_user_id
-
     user_id = current_user_id.get()
     if not user_id:
         return []
 
+    # Repeat "last N days" asks within the TTL skip the round trip; log_*
+    # writers invalidate (user_id, table_name).
+    cache_key = (user_id, table_name)
+    query_key = (date_column, columns, days, start_date, end_date, default_limit, explicit_limit, offset)
+    cached = user_log_query_cache.get_sub(cache_key, query_key)
+    if cached is not None:
+        return list(cached)
+
     try:
-        supabase = get_supabase_client()
-        query = (
-            supabase.table(table_name)
-            .select("*")
-            .eq("user_id", user_id)
-            .order(date_column, desc=True)
-        )
+        # Pairs rather than a dict: an explicit range filters date_column twice
+        params = [
+            ("select", columns),
+            ("user_id", f"eq.{user_id}"),
+            ("order", f"{date_column}.desc" if date_column == "created_at" else f"{date_column}.desc,created_at.desc"),
+        ]
 
         if start_date:
-            query = query.gte(date_column, start_date)
+            params.append((date_column, f"gte.{start_date}"))
             if end_date:
-                query = query.lte(date_column, end_date)
-            query = query.limit(explicit_limit)
+                params.append((date_column, f"lte.{end_date}"))
+            params.append(("limit", explicit_limit))
         else:
             lookback_days = days if days is not None else 7
-            now = get_current_functional_time()
-            lookback_date = now - timedelta(days=lookback_days)
-            # Use ISO for timestamp columns, date string for date columns
+            # Use ISO for timestamp columns; functional-day date columns are
+            # compared against the functional today, no clock offset needed
             if date_column == "created_at":
-                query = query.gte(date_column, lookback_date.isoformat())
+                lookback_date = get_current_functional_time() - timedelta(days=lookback_days)
+                params.append((date_column, f"gte.{lookback_date.isoformat()}"))
             else:
-                query = query.gte(date_column, lookback_date.strftime('%Y-%m-%d'))
-            query = query.limit(default_limit)
+                lookback_date = date.fromisoformat(get_today_date_str()) - timedelta(days=lookback_days)
+                params.append((date_column, f"gte.{lookback_date.isoformat()}"))
+            params.append(("limit", default_limit))
+        if offset:
+            params.append(("offset", offset))
 
-        response = query.execute()
-        return response.data if response.data else []
+        rows = await get_async_postgrest().select(table_name, params) or []
+        user_log_query_cache.set_sub(cache_key, query_key, rows)
+        return list(rows)
     except Exception as e:
         logger.error(f"Error fetching {table_name}: {e}")
         return []
@@ -1,12 +1,23 @@
 import os
+import functools
 import logging
 from typing import Dict, Any
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
 import httpx
 
+from ..services.cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
-def web_search(query: str) -> str:
+# Formatted results per normalized query; repeat lookups skip the Tavily round trip
+_search_cache = TTLCache(maxsize=512, ttl=600)
+
+@functools.lru_cache(maxsize=1)
+def _get_tavily_client(api_key: str) -> AsyncTavilyClient:
+    # Built once per key and reused across searches (keeps its httpx pool warm)
+    return AsyncTavilyClient(api_key=api_key)
+
+async def web_search(query: str) -> str:
     """
     Searches the live internet for up-to-date information, news, facts, and specific nutrition data 
     that might be missing from the static database. 
@@ -20,11 +31,16 @@ def web_search(query: str) -> str:
     if not api_key:
         return "Error: TAVILY_API_KEY is not set. Web search is currently unavailable."
         
+    cache_key = " ".join(query.lower().split())
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        tavily_client = TavilyClient(api_key=api_key)
+        tavily_client = _get_tavily_client(api_key)
         
         # We request an AI-generated answer specifically optimized for LLM consumption
-        response = tavily_client.search(
+        response = await tavily_client.search(
             query=query,
             search_depth="basic",
             include_answer=True,
@@ -50,7 +66,9 @@ def web_search(query: str) -> str:
         if not output:
             return "No useful results found for this query."
             
-        return "\n".join(output)
+        result = "\n".join(output)
+        _search_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
         logger.error(f"Error connecting to Tavily search service: {e}")
@@ -1,9 +1,21 @@
+import asyncio
+import functools
 import logging
-import json
 import re
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
 from typing import Optional, List, Dict, Any
-from ..tools.utils import get_supabase_client, calculate_log_timestamp, get_today_date_str
+import orjson
+from ..tools.utils import (
+    get_supabase_client, get_async_postgrest, calculate_log_timestamp, get_today_date_str,
+    query_user_logs,
+)
 from ..user_context import current_user_id
+from ..services.cache import (
+    invalidate_user_context, invalidate_user_logs, next_workout_cache, workout_plan_cache,
+    overload_summary_cache, USER_CONTEXT_CORE, USER_CONTEXT_TRAINING,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +36,65 @@ def _normalize_day_name(name: str) -> str:
     return _SUFFIX_RE.sub('', name).strip().lower()
 
 
+def _advance_split_position(user_id: str, workout_type: str):
+    """Advance the active split's position if this workout matches a split day."""
+    try:
+        supabase = get_supabase_client()
+        split_resp = (supabase.table("workout_splits")
+                      .select("id, last_completed_order_index")
+                      .eq("user_id", user_id)
+                      .eq("is_active", True)
+                      .limit(1)
+                      .execute())
+
+        if split_resp.data:
+            split_row = split_resp.data[0]
+            split_id = split_row["id"]
+            last_idx = split_row["last_completed_order_index"] or 0
+
+            items_resp = (supabase.table("split_items")
+                          .select("order_index, workout_name")
+                          .eq("split_id", split_id)
+                          .order("order_index")
+                          .execute())
+            items = items_resp.data or []
+
+            if items:
+                total = len(items)
+                norm_type = _normalize_day_name(workout_type)
+
+                # Collect all positions whose normalised name matches
+                matching_positions = [
+                    it["order_index"] for it in items
+                    if _normalize_day_name(it["workout_name"]) == norm_type
+                ]
+
+                if matching_positions:
+                    # Disambiguate duplicates (e.g. PPL x2 has two "Push" days)
+                    # Pick the NEXT matching position in the cycle after last_idx
+                    chosen = None
+                    for pos in matching_positions:
+                        if pos > last_idx:
+                            chosen = pos
+                            break
+                    # Wrap-around: if all matches are <= last_idx, take the first
+                    if chosen is None:
+                        chosen = matching_positions[0]
+
+                    supabase.rpc("advance_split_position", {
+                        "p_user_id": user_id,
+                        "p_order_index": chosen,
+                    }).execute()
+    except Exception as adv_err:
+        # Non-fatal — don't break workout logging if split advance fails
+        logger.warning(f"Split advance failed for user {user_id}: {adv_err}")
+
+
 # ---------------------------------------------------------------------------
 # Session-level workout logging (existing, enhanced to return workout_log_id)
 # ---------------------------------------------------------------------------
 
-def log_workout(
+async def log_workout(
     workout_type: str,
     duration_minutes: int,
     calories_burned: int,
@@ -53,7 +119,6 @@ def log_workout(
         if not user_id:
             return "Error: No user context."
 
-        supabase = get_supabase_client()
         timestamp = calculate_log_timestamp()
         log_date = get_today_date_str()
 
@@ -69,62 +134,18 @@ def log_workout(
             "aerobic_training_stress": aerobic_training_stress
         }
 
-        response = supabase.table("workout_logs").insert(data).execute()
+        rows = await get_async_postgrest().insert("workout_logs", data)
 
-        if response.data:
-            row = response.data[0]
+        if rows:
+            # daily_goals workout totals change (split position is not in the context)
+            invalidate_user_context(user_id, USER_CONTEXT_CORE)
+            invalidate_user_logs(user_id, "workout_logs")
+            row = rows[0]
             workout_log_id = row.get("id")
 
-            # ── Advance split position if this workout matches a split day ──
-            try:
-                split_resp = (supabase.table("workout_splits")
-                              .select("id, last_completed_order_index")
-                              .eq("user_id", user_id)
-                              .eq("is_active", True)
-                              .limit(1)
-                              .execute())
-
-                if split_resp.data:
-                    split_row = split_resp.data[0]
-                    split_id = split_row["id"]
-                    last_idx = split_row["last_completed_order_index"] or 0
-
-                    items_resp = (supabase.table("split_items")
-                                  .select("order_index, workout_name")
-                                  .eq("split_id", split_id)
-                                  .order("order_index")
-                                  .execute())
-                    items = items_resp.data or []
-
-                    if items:
-                        total = len(items)
-                        norm_type = _normalize_day_name(workout_type)
-
-                        # Collect all positions whose normalised name matches
-                        matching_positions = [
-                            it["order_index"] for it in items
-                            if _normalize_day_name(it["workout_name"]) == norm_type
-                        ]
-
-                        if matching_positions:
-                            # Disambiguate duplicates (e.g. PPL x2 has two "Push" days)
-                            # Pick the NEXT matching position in the cycle after last_idx
-                            chosen = None
-                            for pos in matching_positions:
-                                if pos > last_idx:
-                                    chosen = pos
-                                    break
-                            # Wrap-around: if all matches are <= last_idx, take the first
-                            if chosen is None:
-                                chosen = matching_positions[0]
-
-                            supabase.rpc("advance_split_position", {
-                                "p_user_id": user_id,
-                                "p_order_index": chosen,
-                            }).execute()
-            except Exception as adv_err:
-                # Non-fatal — don't break workout logging if split advance fails
-                logger.warning(f"Split advance failed for user {user_id}: {adv_err}")
+            # Split advance is sync PostgREST work; keep it off the event loop
+            await asyncio.to_thread(_advance_split_position, user_id, workout_type)
+            next_workout_cache.pop(user_id)
 
             return (
                 f"Successfully logged {workout_type} ({duration_minutes} min, {calories_burned} kcal). "
@@ -137,7 +158,13 @@ def log_workout(
         logger.error(f"Error logging workout: {e}")
         return f"Error logging workout: {str(e)}"
 
-def get_workout_history(days: Optional[int] = 7, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_workout_history(
+    days: Optional[int] = 7,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
     """
     Fetches workout logs.
     
@@ -145,9 +172,34 @@ def get_workout_history(days: Optional[int] = 7, start_date: Optional[str] = Non
         days: Number of days to look back from today (default 7).
         start_date: Specific start date (YYYY-MM-DD or ISO) to search from. Only one of 'days' or 'start_date' is needed.
         end_date: Specific end date to search up to.
+        limit: Max sessions to return (default 50 for 'days', 100 for a date range).
+        offset: Number of newest sessions to skip, to page further back (default 0).
+    """
+    return await query_user_logs(
+        "workout_logs", date_column="log_date", days=days, start_date=start_date, end_date=end_date,
+        default_limit=limit or 50, explicit_limit=limit or 100, offset=offset,
+    )
+
+
+async def get_daily_workout_totals(days: Optional[int] = 7) -> List[Dict[str, Any]]:
+    """
+    Fetches per-day workout totals (sessions, duration minutes, calories burned), summed in the database.
+    Use this for training frequency/volume questions over several days instead of adding up get_workout_history rows.
+
+    Args:
+        days: Number of days to look back from today (default 7).
     """
-    from ..tools.utils import query_user_logs
-    return query_user_logs("workout_logs", days=days, start_date=start_date, end_date=end_date)
+    user_id = current_user_id.get()
+    if not user_id:
+        return []
+
+    try:
+        lookback_days = days if days is not None else 7
+        since = (date.fromisoformat(get_today_date_str()) - timedelta(days=lookback_days)).isoformat()
+        return await get_async_postgrest().rpc("daily_workout_totals", {"p_user_id": user_id, "p_since": since}) or []
+    except Exception as e:
+        logger.error(f"Error fetching daily workout totals: {e}")
+        return []
 
 
 def calculate_workout_volume() -> str:
@@ -166,6 +218,10 @@ def get_next_scheduled_workout() -> Dict[str, Any]:
         if not user_id:
             return {"message": "Error: User context missing."}
 
+        cached = next_workout_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+
         supabase = get_supabase_client()
         
         # Call the PostgreSQL function - we need to ensure the RPC function accepts user_id if we modified it
@@ -186,7 +242,7 @@ def get_next_scheduled_workout() -> Dict[str, Any]:
             total = row.get('total_items')
             
             if next_workout:
-                return {
+                result = {
                     "next_workout": next_workout,
                     "split_name": split_name,
                     "position": position,
@@ -194,7 +250,7 @@ def get_next_scheduled_workout() -> Dict[str, Any]:
                     "message": f"Next scheduled: {next_workout} ({position}/{total} in {split_name})"
                 }
             else:
-                return {
+                result = {
                     "next_workout": None,
                     "split_name": None,
                     "position": None,
@@ -202,10 +258,14 @@ def get_next_scheduled_workout() -> Dict[str, Any]:
                     "message": "No active workout split configured."
                 }
         else:
-            return {
+            result = {
                 "next_workout": None,
                 "message": "No active workout split configured."
             }
+
+        # log_workout and profile saves pop this when the split moves
+        next_workout_cache.set(user_id, result)
+        return dict(result)
             
     except Exception as e:
         logger.error(f"Error fetching next scheduled workout: {e}")
@@ -269,6 +329,11 @@ SPLIT_MUSCLE_MAP = {
     "full body b":      ["chest", "back", "shoulders", "quads", "hamstrings", "glutes", "biceps", "triceps", "core"],
 }
 
+# Fields every exercise in generate_workout_plan's exercises_json must carry
+_PLAN_REQUIRED_FIELDS = ("split_day_name", "exercise_order", "exercise_name", "exercise_type",
+                         "target_muscles", "sets", "rep_range_low", "rep_range_high")
+_PLAN_REQUIRED_KEYS = frozenset(_PLAN_REQUIRED_FIELDS)
+
 
 def generate_workout_plan(
     exercises_json: str,
@@ -313,19 +378,20 @@ def generate_workout_plan(
 
         # Parse the plan JSON
         try:
-            exercises = json.loads(exercises_json)
-        except json.JSONDecodeError as e:
+            exercises = orjson.loads(exercises_json)
+        except orjson.JSONDecodeError as e:
             return f"Error: Invalid JSON — {str(e)}"
 
         if not isinstance(exercises, list) or len(exercises) == 0:
             return "Error: exercises_json must be a non-empty array of exercise objects."
 
-        # Validate required fields
-        required_fields = ["split_day_name", "exercise_order", "exercise_name", "exercise_type",
-                           "target_muscles", "sets", "rep_range_low", "rep_range_high"]
+        # Validate required fields (one C-level subset check per row; the
+        # missing list is only built for the error message)
         for i, ex in enumerate(exercises):
-            missing = [f for f in required_fields if f not in ex]
-            if missing:
+            if not isinstance(ex, dict):
+                return f"Error: Exercise #{i+1} must be an object."
+            if not _PLAN_REQUIRED_KEYS <= ex.keys():
+                missing = [f for f in _PLAN_REQUIRED_FIELDS if f not in ex]
                 return f"Error: Exercise #{i+1} missing fields: {missing}"
 
         # Fetch active split to get split_id
@@ -367,53 +433,31 @@ def generate_workout_plan(
                 f"Please re-generate using the EXACT day names from the user's split."
             )
 
-        # Delete existing plan for this split (full replacement)
-        supabase.table("workout_plan_exercises").delete().eq("user_id", user_id).eq("split_id", split_id).execute()
-
-        # Build insert rows
-        now_iso = calculate_log_timestamp(functional_check=False)
-        rows = []
-        for ex in exercises:
-            rows.append({
-                "user_id": user_id,
-                "split_id": split_id,
-                "split_day_name": ex["split_day_name"],
-                "exercise_order": ex["exercise_order"],
-                "exercise_name": ex["exercise_name"],
-                "exercise_type": ex["exercise_type"],
-                "target_muscles": ex["target_muscles"],
-                "sets": ex["sets"],
-                "rep_range_low": ex["rep_range_low"],
-                "rep_range_high": ex["rep_range_high"],
-                "load_percentage": ex.get("load_percentage"),
-                "rest_seconds": ex.get("rest_seconds", 120),
-                "superset_group": ex.get("superset_group"),
-                "notes": ex.get("notes"),
-                "created_at": now_iso,
-                "updated_at": now_iso,
-            })
-
-        # Batch insert
-        insert_resp = supabase.table("workout_plan_exercises").insert(rows).execute()
-
-        if not insert_resp.data:
+        # Full replacement in one transaction: upsert on the (split day,
+        # order) unique index, drop slots the new plan no longer has.
+        # The parsed exercises go as-is; jsonb_to_recordset picks the columns,
+        # nulls missing optionals and ignores extra keys (rest defaults to 120s).
+        written = supabase.rpc("replace_workout_plan", {
+            "p_user_id": user_id,
+            "p_split_id": split_id,
+            "p_rows": exercises,
+        }).execute().data
+        invalidate_user_context(user_id, USER_CONTEXT_TRAINING)
+        workout_plan_cache.pop(user_id)
+
+        if not written:
             return "Error: Failed to save workout plan."
 
         # Build summary
-        days = {}
+        days = defaultdict(list)
         for ex in exercises:
-            day = ex["split_day_name"]
-            if day not in days:
-                days[day] = []
-            days[day].append(ex["exercise_name"])
+            days[ex["split_day_name"]].append(ex["exercise_name"])
 
-        summary_parts = []
-        for day, exs in days.items():
-            summary_parts.append(f"  {day}: {len(exs)} exercises ({', '.join(exs)})")
+        summary = "\n".join(f"  {day}: {len(exs)} exercises ({', '.join(exs)})" for day, exs in days.items())
 
         return (
             f"✅ Workout plan saved successfully! ({len(exercises)} exercises across {len(days)} days)\n"
-            + "\n".join(summary_parts)
+            + summary
         )
 
     except Exception as e:
@@ -421,7 +465,11 @@ def generate_workout_plan(
         return f"Error saving workout plan: {str(e)}"
 
 
-def get_workout_plan(split_day_name: Optional[str] = None) -> List[Dict[str, Any]]:
+def get_workout_plan(
+    split_day_name: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
     """
     Returns the current AI-generated workout plan for the user's active split.
     If split_day_name is provided, returns only exercises for that specific day.
@@ -429,6 +477,8 @@ def get_workout_plan(split_day_name: Optional[str] = None) -> List[Dict[str, Any
 
     Args:
         split_day_name: Optional day name filter (e.g., 'Push', 'Pull', 'Legs'). If omitted, returns full plan.
+        limit: Max exercises to return (default 100).
+        offset: Number of exercises to skip, for paging through a long plan (default 0).
 
     Returns:
         List of exercise plan objects including exercise_name, sets, rep_range, target_muscles, etc.
@@ -438,64 +488,52 @@ def get_workout_plan(split_day_name: Optional[str] = None) -> List[Dict[str, Any
         if not user_id:
             return [{"error": "No user context."}]
 
-        supabase = get_supabase_client()
-
-        # Get active split
-        split_resp = (supabase.table("workout_splits")
-                      .select("id, name")
-                      .eq("user_id", user_id)
-                      .eq("is_active", True)
-                      .limit(1)
-                      .execute())
-        if not split_resp.data:
-            return [{"message": "No active workout split found. Set one up first."}]
+        # The agent often re-reads the plan within a turn; generate_workout_plan
+        # and split changes pop this
+        query_key = (split_day_name, limit, offset)
+        cached = workout_plan_cache.get_sub(user_id, query_key)
+        if cached is not None:
+            return list(cached)
 
-        split_id = split_resp.data[0]["id"]
-        split_name = split_resp.data[0]["name"]
-
-        # Fetch plan exercises
-        query = (supabase.table("workout_plan_exercises")
-                 .select("split_day_name, exercise_order, exercise_name, exercise_type, "
-                         "target_muscles, sets, rep_range_low, rep_range_high, "
-                         "load_percentage, rest_seconds, superset_group, notes")
-                 .eq("user_id", user_id)
-                 .eq("split_id", split_id)
-                 .order("split_day_name")
-                 .order("exercise_order"))
-
-        if split_day_name:
-            query = query.eq("split_day_name", split_day_name)
-
-        resp = query.execute()
-
-        if not resp.data:
-            return [{"message": f"No workout plan found for split '{split_name}'. "
-                     "Ask me to generate one based on your profile and equipment!"}]
-
-        # Group by day for clean output
-        result = []
-        for row in resp.data:
-            result.append({
-                "split_day_name": row["split_day_name"],
-                "order": row["exercise_order"],
-                "exercise": row["exercise_name"],
-                "type": row["exercise_type"],
-                "muscles": row["target_muscles"],
-                "sets": row["sets"],
-                "reps": f"{row['rep_range_low']}-{row['rep_range_high']}",
-                "load_%1RM": f"{int(row['load_percentage']*100)}%" if row.get("load_percentage") else None,
-                "rest": f"{row['rest_seconds']}s",
-                "superset_group": row.get("superset_group"),
-                "notes": row.get("notes"),
-            })
-
-        return result
+        result = _fetch_workout_plan(user_id, split_day_name, limit, offset)
+        workout_plan_cache.set_sub(user_id, query_key, result)
+        return list(result)
 
     except Exception as e:
         logger.error(f"Error fetching workout plan: {e}")
         return [{"error": f"Error fetching workout plan: {str(e)}"}]
 
 
+def _fetch_workout_plan(
+    user_id: str, split_day_name: Optional[str], limit: int, offset: int
+) -> List[Dict[str, Any]]:
+    """Uncached body of get_workout_plan; raises on query errors."""
+    supabase = get_supabase_client()
+
+    # Active split + one page of its plan rows, formatted for the agent
+    # server-side
+    plan_doc = supabase.rpc("get_active_workout_plan", {
+        "p_user_id": user_id,
+        "p_split_day_name": split_day_name or None,
+        "p_limit": limit,
+        "p_offset": offset,
+        "p_formatted": True,
+    }).execute().data or {}
+
+    split_name = plan_doc.get("split_name")
+    if split_name is None:
+        return [{"message": "No active workout split found. Set one up first."}]
+
+    plan_rows = plan_doc.get("plan") or []
+    if not plan_rows:
+        if offset:
+            return [{"message": f"No more exercises in the plan for split '{split_name}' past offset {offset}."}]
+        return [{"message": f"No workout plan found for split '{split_name}'. "
+                 "Ask me to generate one based on your profile and equipment!"}]
+
+    return plan_rows
+
+
 # ============================================================================
 # SET-LEVEL EXERCISE LOGGING (Progressive Overload Foundation)
 # ============================================================================
@@ -536,144 +574,80 @@ def log_exercise_sets(
 
         # Parse sets
         try:
-            sets_data = json.loads(sets_json)
-        except json.JSONDecodeError as e:
+            sets_data = orjson.loads(sets_json)
+        except orjson.JSONDecodeError as e:
             return f"Error: Invalid JSON — {str(e)}"
 
         if not isinstance(sets_data, list) or len(sets_data) == 0:
             return "Error: sets_json must be a non-empty array of set objects."
+        if not all(isinstance(st, dict) for st in sets_data):
+            return "Error: each entry in sets_json must be a set object."
+
+        # PR lookup, insert and 1RM bump run server-side in one round trip
+        result = supabase.rpc("log_exercise_sets_with_pr", {
+            "p_user_id": user_id,
+            "p_exercise_name": exercise_name,
+            "p_log_date": log_date,
+            "p_sets": sets_data,
+            "p_workout_log_id": workout_log_id,
+            "p_new_1rm_name": exercise_name.title(),
+        }).execute().data
+
+        if not result or not result.get("inserted"):
+            return "Error: Failed to log exercise sets."
+        overload_summary_cache.pop(user_id)
 
-        # Fetch existing PR for this exercise (best volume_load = weight × reps, excluding warmups)
-        pr_resp = (supabase.table("exercise_logs")
-                   .select("weight_kg, reps, volume_load")
-                   .eq("user_id", user_id)
-                   .ilike("exercise_name", exercise_name)
-                   .eq("is_warmup", False)
-                   .order("volume_load", desc=True)
-                   .limit(1)
-                   .execute())
-        existing_best_volume = pr_resp.data[0]["volume_load"] if pr_resp.data else 0
-
-        # Fetch existing best weight for PR detection
-        weight_pr_resp = (supabase.table("exercise_logs")
-                          .select("weight_kg")
-                          .eq("user_id", user_id)
-                          .ilike("exercise_name", exercise_name)
-                          .eq("is_warmup", False)
-                          .order("weight_kg", desc=True)
-                          .limit(1)
-                          .execute())
-        existing_best_weight = weight_pr_resp.data[0]["weight_kg"] if weight_pr_resp.data else 0
-
-        # Build insert rows & track PRs
-        rows = []
-        prs_detected = []
-        total_volume = 0
-        working_sets = 0
-
-        for i, s in enumerate(sets_data, start=1):
-            weight = s.get("weight_kg", 0)
-            reps = s.get("reps", 0)
-            rpe = s.get("rpe")
-            is_warmup = s.get("is_warmup", False)
-            notes = s.get("notes")
-            vol = weight * reps
-
-            # PR detection (only for working sets)
-            is_pr = False
-            if not is_warmup and vol > 0:
-                if vol > existing_best_volume:
-                    is_pr = True
-                    existing_best_volume = vol  # Update running best
-                    prs_detected.append(f"Set {i}: {weight}kg × {reps} = {vol:.0f}kg volume (NEW PR!)")
-                elif weight > existing_best_weight:
-                    is_pr = True
-                    existing_best_weight = weight
-                    prs_detected.append(f"Set {i}: {weight}kg (NEW weight PR!)")
-
-            if not is_warmup:
-                total_volume += vol
-                working_sets += 1
-
-            row = {
-                "user_id": user_id,
-                "workout_log_id": workout_log_id,
-                "log_date": log_date,
-                "exercise_name": exercise_name,
-                "set_number": i,
-                "weight_kg": weight,
-                "reps": reps,
-                "rpe": rpe,
-                "is_warmup": is_warmup,
-                "is_pr": is_pr,
-                "notes": notes,
-            }
-            rows.append(row)
-
-        # Batch insert
-        insert_resp = supabase.table("exercise_logs").insert(rows).execute()
+        if result.get("one_rm_updated"):
+            invalidate_user_context(user_id, USER_CONTEXT_TRAINING)
+            logger.info(f"Auto-updated 1RM for {exercise_name}")
 
-        if not insert_resp.data:
-            return "Error: Failed to log exercise sets."
+        # Totals and PR sets come back as the RPC stored them (null weight or
+        # reps coerced to 0), so the summary can't fail after the insert
+        total_volume = result.get("total_volume") or 0
+        working_sets = result.get("working_sets") or 0
 
-        # Auto-update 1RM if a 1-rep max was logged
-        for s in sets_data:
-            if s.get("reps") == 1 and not s.get("is_warmup", False) and s.get("weight_kg", 0) > 0:
-                _try_update_1rm(supabase, user_id, exercise_name, s["weight_kg"])
+        prs_detected = []
+        for pr in result.get("pr_sets") or []:
+            i = pr["set_number"]
+            weight = pr["weight_kg"]
+            reps = pr["reps"]
+            if pr["kind"] == "volume":
+                prs_detected.append(f"Set {i}: {weight}kg × {reps} = {weight * reps:.0f}kg volume (NEW PR!)")
+            else:
+                prs_detected.append(f"Set {i}: {weight}kg (NEW weight PR!)")
 
         # Build response summary
-        msg = f"✅ Logged {exercise_name}: {len(rows)} sets ({working_sets} working), total volume {total_volume:.0f}kg"
+        parts = [f"✅ Logged {exercise_name}: {len(sets_data)} sets ({working_sets} working), total volume {total_volume:.0f}kg"]
         if workout_log_id:
-            msg += f" (linked to session #{workout_log_id})"
+            parts.append(f" (linked to session #{workout_log_id})")
         if prs_detected:
-            msg += "\n🏆 " + "\n🏆 ".join(prs_detected)
+            parts.append("\n🏆 " + "\n🏆 ".join(prs_detected))
 
-        return msg
+        return "".join(parts)
 
     except Exception as e:
         logger.error(f"Error logging exercise sets: {e}")
         return f"Error logging exercise sets: {str(e)}"
 
 
-def _try_update_1rm(supabase, user_id: str, exercise_name: str, weight_kg: float):
-    """Auto-update 1RM record if the logged weight exceeds the existing record.
-    Uses LOWER() matching to find existing records and normalizes to title case on write."""
-    try:
-        # Case-insensitive lookup
-        existing = (supabase.table("user_1rm_records")
-                    .select("exercise_name, weight_kg")
-                    .eq("user_id", user_id)
-                    .ilike("exercise_name", exercise_name)
-                    .limit(1)
-                    .execute())
-
-        if existing.data and existing.data[0]["weight_kg"] >= weight_kg:
-            return  # Existing 1RM is higher or equal, no update needed
-
-        # Use the canonical (existing) exercise name to avoid case-sensitive unique index duplication.
-        # If no record exists yet, use title-case normalization.
-        canonical_name = existing.data[0]["exercise_name"] if existing.data else exercise_name.title()
-
-        # Upsert the 1RM record
-        supabase.table("user_1rm_records").upsert({
-            "user_id": user_id,
-            "exercise_name": canonical_name,
-            "weight_kg": weight_kg,
-            "updated_at": calculate_log_timestamp(functional_check=False),
-        }, on_conflict="user_id,exercise_name").execute()
-
-        logger.info(f"Auto-updated 1RM for {canonical_name}: {weight_kg}kg")
-    except Exception as e:
-        logger.warning(f"Failed to auto-update 1RM for {exercise_name}: {e}")
-
-
 # ============================================================================
 # PROGRESSIVE OVERLOAD QUERYING
 # ============================================================================
 
+@functools.lru_cache(maxsize=64)
+def _cutoff_date_str(days: int, today: str) -> str:
+    """Lookback cutoff (YYYY-MM-DD) `days` before the functional `today`.
+
+    `today` is part of the key, so entries roll over with the functional day.
+    """
+    return (date.fromisoformat(today) - timedelta(days=days)).isoformat()
+
+
 def get_exercise_history(
     exercise_name: str,
     days: Optional[int] = 30,
+    cursor: Optional[str] = None,
+    page_size: int = 50,
 ) -> List[Dict[str, Any]]:
     """
     Fetches the set-level history for a specific exercise, ordered by date descending.
@@ -682,9 +656,12 @@ def get_exercise_history(
     Args:
         exercise_name: Name of the exercise (e.g., 'Barbell Bench Press').
         days: Number of days to look back (default 30).
+        cursor: The next_cursor value from a previous call, to fetch the following (older) page.
+        page_size: Max sets per page (default 50).
 
     Returns:
         List of logged sets with date, weight, reps, RPE, volume, and PR flags.
+        If more sets exist, the last element is {"next_cursor": "..."}.
     """
     try:
         user_id = current_user_id.get()
@@ -692,30 +669,60 @@ def get_exercise_history(
             return [{"error": "No user context."}]
 
         supabase = get_supabase_client()
-        from datetime import timedelta
-        from ..tools.utils import get_current_functional_time
 
-        cutoff = get_current_functional_time() - timedelta(days=days)
-        cutoff_str = cutoff.strftime('%Y-%m-%d')
+        cutoff_str = _cutoff_date_str(days, get_today_date_str())
 
-        resp = (supabase.table("exercise_logs")
-                .select("log_date, set_number, weight_kg, reps, rpe, is_warmup, is_pr, volume_load, notes")
-                .eq("user_id", user_id)
-                .ilike("exercise_name", exercise_name)
-                .gte("log_date", cutoff_str)
+        query = (supabase.table("exercise_logs")
+                 .select("id, log_date, set_number, weight_kg, reps, rpe, is_warmup, is_pr, volume_load, notes")
+                 .eq("user_id", user_id)
+                 .eq("exercise_name_lower", exercise_name.lower())
+                 .gte("log_date", cutoff_str))
+
+        # Keyset pagination: resume strictly after the last row of the
+        # previous page in (log_date DESC, set_number, id) order. id breaks
+        # ties between sessions logged on the same day.
+        if cursor:
+            # Every part is parsed back into its type before it goes into the
+            # or= filter grammar, so a tampered cursor can't add conditions
+            try:
+                c_date, c_set, c_id = cursor.split("|")
+                c_date = date.fromisoformat(c_date).isoformat()
+                c_set = int(c_set)
+                c_id = str(uuid.UUID(c_id))
+            except ValueError:
+                return [{"error": "Invalid cursor."}]
+            query = query.or_(
+                f"log_date.lt.{c_date},"
+                f"and(log_date.eq.{c_date},set_number.gt.{c_set}),"
+                f"and(log_date.eq.{c_date},set_number.eq.{c_set},id.gt.{c_id})"
+            )
+
+        # One extra row tells us whether another page exists
+        resp = (query
                 .order("log_date", desc=True)
                 .order("set_number")
-                .limit(200)
+                .order("id")
+                .limit(page_size + 1)
                 .execute())
 
-        return resp.data if resp.data else []
+        rows = resp.data or []
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        last_id = rows[-1]["id"] if rows else None
+        for row in rows:
+            del row["id"]
+
+        if has_more:
+            last = rows[-1]
+            rows.append({"next_cursor": f"{last['log_date']}|{last['set_number']}|{last_id}"})
+        return rows
 
     except Exception as e:
         logger.error(f"Error fetching exercise history: {e}")
         return [{"error": str(e)}]
 
 
-def get_progressive_overload_summary(
+async def get_progressive_overload_summary(
     exercise_name: Optional[str] = None,
     weeks: int = 8,
 ) -> Dict[str, Any]:
@@ -739,142 +746,122 @@ def get_progressive_overload_summary(
         if not user_id:
             return {"error": "No user context."}
 
-        supabase = get_supabase_client()
+        # Chart follow-ups re-ask the same summary within a turn; set writers
+        # (log_exercise_sets, live coach) pop the user's entry
+        query_key = (exercise_name, weeks)
+        cached = overload_summary_cache.get_sub(user_id, query_key)
+        if cached is not None:
+            return dict(cached)
+
+        result = await _fetch_overload_summary(user_id, exercise_name, weeks)
+        overload_summary_cache.set_sub(user_id, query_key, result)
+        return dict(result)
+
+    except Exception as e:
+        logger.error(f"Error fetching progressive overload summary: {e}")
+        return {"error": str(e)}
+
+
+async def _fetch_overload_summary(user_id: str, exercise_name: Optional[str], weeks: int) -> Dict[str, Any]:
+    """Uncached body of get_progressive_overload_summary; raises on query errors."""
+    # Native async: the agent often asks for several exercises in one
+    # turn, and ADK runs async tool calls concurrently
+    pg = get_async_postgrest()
+
+    # If exercise_name specified, one RPC returns the trend, PRs, bests and last session
+    if exercise_name:
+        overview = await pg.rpc("get_exercise_overview", {
+            "p_user_id": user_id,
+            "p_exercise_name": exercise_name,
+            "p_weeks": weeks,
+        }) or {}
+        return _shape_overview(exercise_name, overview)
 
-        # If exercise_name specified, use the DB function for efficiency
-        if exercise_name:
-            progress_resp = supabase.rpc("get_exercise_progress", {
+    else:
+        # Get summary for ALL exercises the user has logged
+
+        cutoff_str = _cutoff_date_str(weeks * 7, get_today_date_str())
+
+        # Per-exercise totals, grouped in Postgres (most recently trained first)
+        exercises_summary = await pg.rpc("get_exercise_summaries", {
+            "p_user_id": user_id,
+            "p_since": cutoff_str,
+        }) or []
+        if not exercises_summary:
+            return {"exercises": [], "message": "No exercise sets logged yet."}
+
+        return {
+            "exercises": exercises_summary,
+            "total_exercises_tracked": len(exercises_summary),
+        }
+
+
+def _shape_overview(exercise_name: str, overview: Dict[str, Any]) -> Dict[str, Any]:
+    """Tool-facing shape of one get_exercise_overview document."""
+    return {
+        "exercise": exercise_name,
+        "weekly_trend": overview.get("weekly_trend") or [],
+        "all_time_pr": {
+            "best_weight": overview.get("best_weight"),
+            "best_volume_set": overview.get("best_volume_set"),
+            # MAX over the stored e1rm column, not just the heaviest set's estimate
+            "best_e1rm": overview.get("best_e1rm"),
+        },
+        "pr_history": overview.get("pr_history") or [],
+        "recent_session": overview.get("recent_session") or [],
+    }
+
+
+async def get_progressive_overload_bulk(
+    exercise_names: List[str],
+    weeks: int = 8,
+) -> Dict[str, Any]:
+    """
+    Returns progressive overload metrics for several specific exercises in one call.
+    Use this instead of calling get_progressive_overload_summary once per exercise
+    (e.g. reviewing every lift in the user's plan).
+
+    Args:
+        exercise_names: Exercise names (e.g., ['Barbell Bench Press', 'Barbell Squat']).
+        weeks: Number of weeks to analyze (default 8).
+
+    Returns:
+        Dictionary {"exercises": {exercise_name: overload data}}, each entry shaped like
+        get_progressive_overload_summary's single-exercise result.
+    """
+    try:
+        user_id = current_user_id.get()
+        if not user_id:
+            return {"error": "No user context."}
+
+        names = list(dict.fromkeys(n for n in exercise_names if n))
+        if not names:
+            return {"error": "exercise_names must contain at least one exercise."}
+
+        # Reuse (and fill) the single-exercise cache entries; only the
+        # misses go to Postgres, in one RPC
+        results = {}
+        missing = []
+        for name in names:
+            hit = overload_summary_cache.get_sub(user_id, (name, weeks))
+            if hit is not None:
+                results[name] = dict(hit)
+            else:
+                missing.append(name)
+
+        if missing:
+            overviews = await get_async_postgrest().rpc("get_exercise_overview_bulk", {
                 "p_user_id": user_id,
-                "p_exercise_name": exercise_name,
+                "p_names": missing,
                 "p_weeks": weeks,
-            }).execute()
-
-            weekly_trend = progress_resp.data if progress_resp.data else []
-
-            # Fetch all-time PRs
-            pr_resp = (supabase.table("exercise_logs")
-                       .select("weight_kg, reps, volume_load, log_date")
-                       .eq("user_id", user_id)
-                       .ilike("exercise_name", exercise_name)
-                       .eq("is_warmup", False)
-                       .eq("is_pr", True)
-                       .order("log_date", desc=True)
-                       .limit(20)
-                       .execute())
-
-            # Best stats
-            best_weight_resp = (supabase.table("exercise_logs")
-                                .select("weight_kg, reps, log_date")
-                                .eq("user_id", user_id)
-                                .ilike("exercise_name", exercise_name)
-                                .eq("is_warmup", False)
-                                .order("weight_kg", desc=True)
-                                .limit(1)
-                                .execute())
-
-            best_vol_resp = (supabase.table("exercise_logs")
-                             .select("weight_kg, reps, volume_load, log_date")
-                             .eq("user_id", user_id)
-                             .ilike("exercise_name", exercise_name)
-                             .eq("is_warmup", False)
-                             .order("volume_load", desc=True)
-                             .limit(1)
-                             .execute())
-
-            best_weight = best_weight_resp.data[0] if best_weight_resp.data else None
-            best_volume = best_vol_resp.data[0] if best_vol_resp.data else None
-
-            # Compute best e1RM from best_weight
-            best_e1rm = None
-            if best_weight:
-                w, r = best_weight["weight_kg"], best_weight["reps"]
-                best_e1rm = round(w * (1 + r / 30.0), 1) if r > 0 else w
-
-            # Fetch last session
-            latest_date_resp = (supabase.table("exercise_logs")
-                                .select("log_date")
-                                .eq("user_id", user_id)
-                                .ilike("exercise_name", exercise_name)
-                                .order("log_date", desc=True)
-                                .limit(1)
-                                .execute())
-
-            recent_session = []
-            if latest_date_resp.data:
-                latest_date = latest_date_resp.data[0]["log_date"]
-                session_resp = (supabase.table("exercise_logs")
-                                .select("set_number, weight_kg, reps, rpe, is_warmup, is_pr, volume_load")
-                                .eq("user_id", user_id)
-                                .ilike("exercise_name", exercise_name)
-                                .eq("log_date", latest_date)
-                                .order("set_number")
-                                .execute())
-                recent_session = session_resp.data or []
-
-            return {
-                "exercise": exercise_name,
-                "weekly_trend": weekly_trend,
-                "all_time_pr": {
-                    "best_weight": best_weight,
-                    "best_volume_set": best_volume,
-                    "best_e1rm": best_e1rm,
-                },
-                "pr_history": pr_resp.data or [],
-                "recent_session": recent_session,
-            }
+            }) or {}
+            for name in missing:
+                shaped = _shape_overview(name, overviews.get(name) or {})
+                overload_summary_cache.set_sub(user_id, (name, weeks), shaped)
+                results[name] = dict(shaped)
 
-        else:
-            # Get summary for ALL exercises the user has logged
-            from datetime import timedelta
-            from ..tools.utils import get_current_functional_time
-
-            cutoff = get_current_functional_time() - timedelta(weeks=weeks)
-            cutoff_str = cutoff.strftime('%Y-%m-%d')
-
-            # Get distinct exercises
-            all_resp = (supabase.table("exercise_logs")
-                        .select("exercise_name, weight_kg, reps, volume_load, is_pr, log_date")
-                        .eq("user_id", user_id)
-                        .eq("is_warmup", False)
-                        .gte("log_date", cutoff_str)
-                        .order("log_date", desc=True)
-                        .limit(500)
-                        .execute())
-
-            if not all_resp.data:
-                return {"exercises": [], "message": "No exercise sets logged yet."}
-
-            # Group by exercise
-            exercise_map = {}
-            for row in all_resp.data:
-                name = row["exercise_name"]
-                if name not in exercise_map:
-                    exercise_map[name] = {
-                        "total_sets": 0,
-                        "total_volume": 0,
-                        "best_weight": 0,
-                        "best_volume_set": 0,
-                        "pr_count": 0,
-                        "last_date": row["log_date"],
-                    }
-                entry = exercise_map[name]
-                entry["total_sets"] += 1
-                entry["total_volume"] += (row["volume_load"] or 0)
-                entry["best_weight"] = max(entry["best_weight"], row["weight_kg"])
-                entry["best_volume_set"] = max(entry["best_volume_set"], row["volume_load"] or 0)
-                if row.get("is_pr"):
-                    entry["pr_count"] += 1
-
-            exercises_summary = [
-                {"exercise": name, **data}
-                for name, data in exercise_map.items()
-            ]
-
-            return {
-                "exercises": exercises_summary,
-                "total_exercises_tracked": len(exercises_summary),
-            }
+        return {"exercises": results}
 
     except Exception as e:
-        logger.error(f"Error fetching progressive overload summary: {e}")
+        logger.error(f"Error fetching bulk progressive overload: {e}")
         return {"error": str(e)}